@@ -1,9 +1,15 @@
 # app.py
 
+import time
 import streamlit as st
 from database import Database
 from contas import Conta
+from documentos import pipeline_documentos
+from envios import motor_envios
+from invalidacao import barramento_invalidacao
+from metricas import servidor_metricas
 from controller.pagina import Pagina  # Importamos a classe que acabamos de criar
+from controller.visao import registrar_rerun
 
 st.set_page_config(
     page_title="Gerenciador de Aprovados no CAGE RS",
@@ -16,14 +22,32 @@ st.set_page_config(
 def get_database():
     db = Database()
     db.create_all_tables_once()
+
+    # Retoma documentos que ficaram sem processar (ex.: reinício do processo)
+    pipeline_documentos().reprocessarPendentes(db)
+
+    # Motor de envios já no início: entrega o que ficou na fila (pendente,
+    # reserva expirada ou aguardando nova tentativa) sem esperar nova mensagem
+    motor_envios(db)
+
+    # Repassa às outras réplicas as versões das tabelas alteradas aqui (e vice-versa)
+    barramento_invalidacao(db)
+
+    # Métricas do processo para o Prometheus (METRICS_PORT), fora dos reruns
+    servidor_metricas()
     return db
 
 
 def main():
+    inicio = time.perf_counter()
     db = get_database()         # Database inicializado apenas 1x
-    conta_manager = Conta(db)
-    pagina = Pagina(db, conta_manager)
-    pagina.exibir()
+
+    # Conta e Pagina não guardam dados da requisição: criados uma vez por sessão
+    if 'pagina' not in st.session_state:
+        st.session_state['pagina'] = Pagina(db, Conta(db))
+    st.session_state['pagina'].exibir()
+
+    registrar_rerun(time.perf_counter() - inicio)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+
+Armazenamento dos arquivos (blobs) fora do banco de dados, endereçado
+pelo hash do conteúdo (sha256). A tabela 'documentos' guarda apenas os
+metadados e a chave do blob.
+
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from database import Database, TabelaDocumentos
+from sqlalchemy import select, update
+from utils import ler_configuracao
+
+
+class BlobStore:
+    """
+    Interface dos backends de armazenamento. As chaves são o sha256
+    (hex) do conteúdo, de modo que o mesmo arquivo é gravado uma vez só.
+    """
+
+    @staticmethod
+    def chave(conteudo: bytes) -> str:
+        return hashlib.sha256(conteudo).hexdigest()
+
+    def salvar(self, conteudo: bytes) -> str:
+        raise NotImplementedError
+
+    def abrir(self, chave: str):
+        """ Retorna um objeto de arquivo (modo binário) para leitura em stream """
+        raise NotImplementedError
+
+    def ler(self, chave: str) -> bytes:
+        """ Retorna o conteúdo inteiro em memória (para arquivos grandes, use abrir) """
+        raise NotImplementedError
+
+    def existe(self, chave: str) -> bool:
+        raise NotImplementedError
+
+    def remover(self, chave: str) -> None:
+        raise NotImplementedError
+
+    def caminho_local(self, chave: str):
+        """ Caminho no disco, se o backend tiver um (None caso contrário) """
+        return None
+
+
+class BlobStoreLocal(BlobStore):
+    """
+    Backend em sistema de arquivos local: <diretorio>/<ab>/<cd>/<sha256>.
+    A gravação é atômica (arquivo temporário + os.replace).
+    """
+
+    def __init__(self, diretorio: str) -> None:
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave: str) -> str:
+        return os.path.join(self.diretorio, chave[:2], chave[2:4], chave)
+
+    def salvar(self, conteudo: bytes) -> str:
+        chave = self.chave(conteudo)
+        caminho = self._caminho(chave)
+        if os.path.exists(caminho):
+            return chave
+
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(conteudo)
+            os.replace(temporario, caminho)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return chave
+
+    def abrir(self, chave: str):
+        return open(self._caminho(chave), "rb")
+
+    def ler(self, chave: str) -> bytes:
+        with open(self._caminho(chave), "rb") as f:
+            return f.read()
+
+    def existe(self, chave: str) -> bool:
+        return os.path.exists(self._caminho(chave))
+
+    def remover(self, chave: str) -> None:
+        try:
+            os.remove(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def caminho_local(self, chave: str):
+        return self._caminho(chave)
+
+
+BACKENDS = {
+    'local': lambda: BlobStoreLocal(ler_configuracao("BLOB_DIR", "documentos_blob")),
+}
+
+_blob_store = None
+_lock_blob_store = threading.Lock()
+
+
+def blob_store() -> BlobStore:
+    """
+    Instância única do armazenamento de blobs, escolhida via st.secrets
+    (BLOB_BACKEND, padrão 'local'; BLOB_DIR para o backend local).
+    """
+    global _blob_store
+    with _lock_blob_store:
+        if _blob_store is None:
+            _blob_store = BACKENDS[ler_configuracao("BLOB_BACKEND", "local")]()
+        return _blob_store
+
+
+def migrarDocumentosParaBlobStore(db: Database, store: BlobStore = None, tamanho_lote: int = 50) -> int:
+    """
+    Migração única: move o conteúdo das linhas de 'documentos' que ainda
+    guardam o arquivo no banco para o blob store, gravando a chave e
+    limpando a coluna 'conteudo'. Processa em lotes (um commit por lote),
+    de modo que pode ser interrompida e retomada. Retorna quantas linhas migrou.
+    """
+    store = store or blob_store()
+    migrados = 0
+
+    while True:
+        with db.engine.begin() as conn:
+            lote = conn.execute(
+                select(TabelaDocumentos.id_documento, TabelaDocumentos.conteudo)
+                .where(TabelaDocumentos.chave_blob.is_(None))
+                .where(TabelaDocumentos.conteudo.is_not(None))
+                .order_by(TabelaDocumentos.id_documento)
+                .limit(tamanho_lote)
+            ).fetchall()
+
+            if not lote:
+                return migrados
+
+            for id_documento, conteudo in lote:
+                chave = store.salvar(bytes(conteudo))
+                conn.execute(
+                    update(TabelaDocumentos)
+                    .where(TabelaDocumentos.id_documento == id_documento)
+                    .values(chave_blob=chave, conteudo=None)
+                )
+            migrados += len(lote)
+            print(f"Documentos migrados para o blob store: {migrados}")
+
+
+if __name__ == "__main__":
+    db = Database()
+    db.create_all_tables_once()
+    print(f"Total migrado: {migrarDocumentosParaBlobStore(db)}")
@@ -0,0 +1,257 @@
+"""
+
+Exercita o MotorEnvios contra um provedor de WhatsApp (HTTP) e um servidor
+SMTP locais, com falhas simuladas por destinatário, e confere o resultado
+de cada envio na fila: entregas, novas tentativas com backoff exponencial,
+status 'falha' (erro permanente ou tentativas esgotadas) e conexões SMTP
+fechadas ao final. Também mede os envios por segundo de cada canal.
+
+Destinatários simulados (nos dois canais):
+- ok-N: entregue na primeira tentativa;
+- instavel: falha temporária (HTTP 503 / SMTP 451) nas duas primeiras tentativas;
+- fora: falha temporária sempre (vai para 'falha' após --tentativas);
+- invalido: falha permanente (HTTP 400 / SMTP 550), sem nova tentativa;
+- lento (só e-mail): o servidor não responde dentro do timeout do cliente
+  (o smtplib trata como conexão perdida e o remetente reenvia uma vez
+  numa conexão nova, dentro da mesma tentativa).
+
+Uso: python benchmarks/benchmark_envios.py [--envios 100] [--latencia-ms 20]
+                                           [--backoff 1.5] [--tentativas 4]
+
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from database import Database, TabelaEnvios
+from envios import MotorEnvios, RemetenteWhatsApp, RemetenteEmail
+
+ESPECIAIS = ('instavel', 'fora', 'invalido')
+TIMEOUT_SMTP = 1.0
+
+
+class Provedores:
+    """ Estado dos servidores simulados: horário de cada tentativa por destinatário """
+
+    def __init__(self, latencia: float) -> None:
+        self.latencia = latencia
+        self.tentativas = defaultdict(list)     # (canal, destinatário) -> [horários]
+        self.conexoes_smtp = 0
+        self.conexoes_abertas = 0
+        self.lock = threading.Lock()
+
+    def registrar(self, canal: str, destinatario: str) -> int:
+        """ Anota a tentativa e retorna quantas já houve para o destinatário """
+        with self.lock:
+            self.tentativas[(canal, destinatario)].append(time.monotonic())
+            return len(self.tentativas[(canal, destinatario)])
+
+
+def _nome(destino: str) -> str:
+    """ 'whatsapp:+instavel' ou 'instavel@exemplo.com' -> 'instavel' """
+    return destino.split(':+')[-1].split('@')[0]
+
+
+def servidor_whatsapp(provedores: Provedores) -> ThreadingHTTPServer:
+    class Resposta(BaseHTTPRequestHandler):
+        def do_POST(self):
+            corpo = self.rfile.read(int(self.headers['Content-Length']))
+            nome = _nome(parse_qs(corpo.decode())['To'][0])
+            tentativa = provedores.registrar('whatsapp', nome)
+            time.sleep(provedores.latencia)
+
+            if nome == 'invalido':
+                codigo = 400
+            elif nome == 'fora' or (nome == 'instavel' and tentativa <= 2):
+                codigo = 503
+            else:
+                codigo = 201
+            self.send_response(codigo)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), Resposta)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def servidor_smtp(provedores: Provedores) -> socketserver.ThreadingTCPServer:
+    class Sessao(socketserver.StreamRequestHandler):
+        def responder(self, linha: str) -> None:
+            self.wfile.write(linha.encode() + b'\r\n')
+
+        def handle(self):
+            with provedores.lock:
+                provedores.conexoes_smtp += 1
+                provedores.conexoes_abertas += 1
+            try:
+                self.conversar()
+            except OSError:
+                pass
+            finally:
+                with provedores.lock:
+                    provedores.conexoes_abertas -= 1
+
+        def conversar(self):
+            self.responder('220 sumidouro SMTP')
+            destinatario = None
+            while True:
+                linha = self.rfile.readline()
+                if not linha:
+                    return      # cliente fechou a conexão
+                comando = linha.decode().strip()
+                if comando.upper().startswith('RCPT TO'):
+                    destinatario = _nome(comando.split(':', 1)[1].strip(' <>'))
+                    self.responder('550 destinatario inexistente' if destinatario == 'invalido' else '250 ok')
+                elif comando.upper() == 'DATA':
+                    self.responder('354 pode enviar')
+                    while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                        pass
+                    tentativa = provedores.registrar('email', destinatario)
+                    time.sleep(provedores.latencia)
+                    if destinatario == 'lento':
+                        time.sleep(TIMEOUT_SMTP * 2)
+                    if destinatario == 'fora' or (destinatario == 'instavel' and tentativa <= 2):
+                        self.responder('451 tente mais tarde')
+                    else:
+                        self.responder('250 aceita')
+                elif comando.upper() == 'QUIT':
+                    self.responder('221 tchau')
+                    return
+                else:
+                    self.responder('250 ok')
+
+    servidor = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Sessao)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def enfileirar(db: Database, n_envios: int) -> None:
+    destinos = {
+        'whatsapp': lambda nome: f'whatsapp:+{nome}',
+        'email': lambda nome: f'{nome}@exemplo.com',
+    }
+    linhas = []
+    for canal, destino in destinos.items():
+        nomes = [f'ok-{i}' for i in range(n_envios)] + list(ESPECIAIS) + (['lento'] if canal == 'email' else [])
+        linhas.extend(
+            {'n_inscr': nome, 'canal': canal, 'destino': destino(nome), 'titulo': 'Aviso', 'conteudo': 'Conteúdo ' * 20}
+            for nome in nomes
+        )
+    with db.unidadeDeTrabalho() as session:
+        session.execute(insert(TabelaEnvios), linhas)
+
+
+def situacao(db: Database) -> dict:
+    """ (canal, nome) -> (status, tentativas) """
+    with db.engine.connect() as conn:
+        linhas = conn.execute(select(TabelaEnvios.canal, TabelaEnvios.destino, TabelaEnvios.status, TabelaEnvios.tentativas))
+        return {(canal, _nome(destino)): (status, tentativas) for canal, destino, status, tentativas in linhas}
+
+
+def conferir_backoff(rotulo: str, horarios: list, base: float) -> list:
+    """
+    Intervalos entre as tentativas: nenhuma nova tentativa antes de base^k
+    segundos (menos os 20% de jitter). Podem passar disso quando o canal
+    está ocupado com outros lotes.
+    """
+    intervalos = [depois - antes for antes, depois in zip(horarios, horarios[1:])]
+    for k, intervalo_real in enumerate(intervalos, start=1):
+        minimo = base ** k * 0.8
+        assert intervalo_real >= minimo - 0.05, \
+            f"{rotulo}: tentativa {k + 1} após {intervalo_real:.2f}s (mínimo {minimo:.2f}s)"
+    return intervalos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envios", type=int, default=100, help="destinatários 'ok' por canal")
+    parser.add_argument("--latencia-ms", type=float, default=20)
+    parser.add_argument("--backoff", type=float, default=1.5)
+    parser.add_argument("--tentativas", type=int, default=4)
+    parser.add_argument("--taxa", type=float, default=200, help="envios/s por canal (limitador)")
+    args = parser.parse_args()
+
+    provedores = Provedores(args.latencia_ms / 1000)
+    http = servidor_whatsapp(provedores)
+    smtp = servidor_smtp(provedores)
+
+    db = Database(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}")
+    enfileirar(db, args.envios)
+
+    intervalo = 0.2
+    motor = MotorEnvios(
+        db,
+        {
+            'whatsapp': RemetenteWhatsApp(
+                f"http://127.0.0.1:{http.server_address[1]}/Messages.json", 'sid', 'token',
+                'whatsapp:+5551000000000', taxa=args.taxa, conexoes=4
+            ),
+            'email': RemetenteEmail(
+                '127.0.0.1', smtp.server_address[1], 'avisos@exemplo.com', starttls=False,
+                taxa=args.taxa, conexoes=2, timeout=TIMEOUT_SMTP
+            ),
+        },
+        max_tentativas=args.tentativas,
+        backoff_base=args.backoff,
+        intervalo=intervalo
+    )
+
+    # Espera todos os envios saírem de 'pendente'/'enviando'
+    inicio = time.monotonic()
+    fim_ok = {}
+    limite = inicio + sum(args.backoff ** k * 1.2 + TIMEOUT_SMTP + 1 for k in range(1, args.tentativas)) + 60
+    motor.iniciar()
+    while time.monotonic() < limite:
+        estado = situacao(db)
+        for canal in ('whatsapp', 'email'):
+            if canal not in fim_ok and all(status == 'enviado' for (c, nome), (status, _) in estado.items()
+                                           if c == canal and nome.startswith('ok-')):
+                fim_ok[canal] = time.monotonic() - inicio
+        if all(status in ('enviado', 'falha') for status, _ in estado.values()):
+            break
+        time.sleep(0.1)
+    motor.parar()
+
+    # O servidor SMTP percebe o fechamento das conexões (a do 'lento' ainda dorme)
+    limite = time.monotonic() + TIMEOUT_SMTP * 2 + 1
+    while provedores.conexoes_abertas and time.monotonic() < limite:
+        time.sleep(0.1)
+
+    estado = situacao(db)
+    esperado = {'instavel': ('enviado', 2), 'fora': ('falha', args.tentativas), 'invalido': ('falha', 1),
+                'lento': ('falha', args.tentativas)}
+    print(f"{'canal':<9} {'destinatário':<12} {'status':<8} {'tentativas':>10}  intervalos (s)")
+    for (canal, nome), (status, tentativas) in sorted(estado.items()):
+        if nome.startswith('ok-'):
+            assert (status, tentativas) == ('enviado', 0), (canal, nome, status, tentativas)
+            continue
+        assert (status, tentativas) == esperado[nome], (canal, nome, status, tentativas)
+        intervalos = []
+        if nome in ('fora', 'instavel'):
+            intervalos = conferir_backoff(f'{canal}/{nome}', provedores.tentativas[(canal, nome)], args.backoff)
+        print(f"{canal:<9} {nome:<12} {status:<8} {tentativas:>10}  {' '.join(f'{i:.2f}' for i in intervalos)}")
+
+    assert provedores.conexoes_abertas == 0, f"{provedores.conexoes_abertas} conexão(ões) SMTP não fechada(s)"
+    print(f"conexões SMTP abertas: {provedores.conexoes_smtp}, todas fechadas")
+    for canal, duracao in sorted(fim_ok.items()):
+        print(f"{canal:<9} {args.envios} entregas em {duracao:.2f}s ({args.envios / duracao:.1f} envios/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+
+Mede a latência dos reruns "quentes" da página inicial (usuário já logado,
+nada mudou no banco), com o view-model da sessão e sem ele (descartando-o
+antes de cada rerun, como se todos os dados fossem relidos do banco).
+
+Usa o AppTest do Streamlit sobre o app.py, com um banco sqlite temporário
+povoado com a lista de aprovados, usuários e mensagens. Execute a partir de
+um diretório com o .streamlit/secrets.toml da aplicação.
+
+Uso: python benchmarks/benchmark_rerun.py [--reruns 30] [--mensagens 40]
+
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from database import Database, TabelaUsuario, TabelaAprovados
+from contas import Conta
+from mensageria import Mensageria
+from utils import hash_password, ler_configuracao
+
+SENHA = "senha-de-teste"
+
+
+def povoar(db: Database, n_mensagens: int) -> str:
+    """ Cadastra um usuário por aprovado e cria mensagens; retorna uma inscrição para o login """
+    db.create_all_tables_once()
+    aprovados = db.retornarColunas(TabelaAprovados, ['n_inscr', 'posicao', 'nome', 'grupo', 'cota'])
+    hash_senha = hash_password(SENHA)
+
+    with db.unidadeDeTrabalho() as session:
+        for i, (n_inscr, posicao, nome, grupo, cota) in enumerate(aprovados.itertuples(index=False)):
+            db.inserirDados(TabelaUsuario, {
+                'n_inscr': n_inscr, 'posicao': posicao, 'nome': nome, 'senha': hash_senha,
+                'email': f'{n_inscr}@exemplo.com', 'grupo': grupo, 'cota': cota,
+                'opcao': random.choice(["Vai assumir", "Indeciso", "Não vai assumir"])
+            }, session=session)
+
+    grupos = sorted(aprovados['grupo'].unique().tolist())
+    mensageria = Mensageria(db)
+    for i in range(n_mensagens):
+        mensageria.criar_mensagem(f"Aviso {i}", "Conteúdo " * 50, grupos, ["AC", "Racial", "PcD"], 1, 1000, "benchmark")
+
+    return aprovados.sort_values('posicao')['n_inscr'].iloc[len(aprovados) // 2]
+
+
+def medir(at: AppTest, reruns: int, descartar_visao: bool) -> list:
+    """ Duração (ms) de cada rerun da página inicial """
+    tempos = []
+    for _ in range(reruns):
+        if descartar_visao and 'visao' in at.session_state:
+            del at.session_state['visao']
+        inicio = time.perf_counter()
+        at.run()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        assert not at.exception, at.exception
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--mensagens", type=int, default=40)
+    args = parser.parse_args()
+
+    # create_all_tables_once lê o aprovados.csv do diretório atual
+    os.chdir(RAIZ)
+    db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    db = Database(db_url)
+    n_inscr = povoar(db, args.mensagens)
+    conta = Conta(db).acessarConta(n_inscr, SENHA)['resultado']
+
+    # O AppTest não lê o secrets.toml: repassa os do ambiente, trocando só o banco
+    at = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=60)
+    for chave, valor in st.secrets.items():
+        at.secrets[chave] = valor
+    at.secrets["DB_URL"] = db_url
+    at.session_state['logado'] = True
+    at.session_state['conta'] = conta
+    at.run()    # primeiro rerun (frio): cria o view-model e marca as mensagens como lidas
+    at.run()
+
+    meta = float(ler_configuracao("RERUN_META_MS", 150))
+    print(f"{'cenário':<22} {'mediana (ms)':>12} {'p90 (ms)':>9}")
+    for nome, descartar in (("sem view-model", True), ("com view-model", False)):
+        tempos = sorted(medir(at, args.reruns, descartar))
+        print(f"{nome:<22} {statistics.median(tempos):>12.1f} {tempos[int(len(tempos) * 0.9) - 1]:>9.1f}")
+    print(f"meta de rerun quente (RERUN_META_MS): {meta:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
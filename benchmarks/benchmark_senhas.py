@@ -0,0 +1,56 @@
+"""
+
+Micro-benchmark do ServicoSenhas: logins (verificações bcrypt) por segundo
+para diferentes custos e tamanhos de pool, simulando várias threads do
+Streamlit fazendo login ao mesmo tempo.
+
+Uso: python benchmarks/benchmark_senhas.py [--custos 10 11 12] [--workers 1 2 4 8]
+                                           [--clientes 16] [--logins 64]
+
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import ServicoSenhas
+
+
+def medir(custo: int, workers: int, clientes: int, logins: int) -> float:
+    """ Retorna logins por segundo para o custo/pool informados """
+    servico = ServicoSenhas(rounds=custo, workers=workers)
+    hash_senha = servico.hash("senha-de-teste")
+
+    # 'clientes' threads simulam as threads de script do Streamlit
+    with ThreadPoolExecutor(max_workers=clientes) as clientes_pool:
+        inicio = time.perf_counter()
+        resultados = list(clientes_pool.map(
+            lambda _: servico.verificar("senha-de-teste", hash_senha), range(logins)
+        ))
+        duracao = time.perf_counter() - inicio
+
+    servico.encerrar()
+    assert all(resultados)
+    return logins / duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--custos", type=int, nargs="+", default=[10, 11, 12])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'custo':>5} {'workers':>7} {'logins/s':>10}")
+    for custo in args.custos:
+        for workers in args.workers:
+            taxa = medir(custo, workers, args.clientes, args.logins)
+            print(f"{custo:>5} {workers:>7} {taxa:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+
+Console SQL do superusuário, protegido: cada comando roda numa thread
+própria, com tempo máximo (statement_timeout), limite de linhas e de bytes
+lidos por um cursor do lado do servidor, e pode ser cancelado pela tela.
+
+"""
+import re
+import time
+import threading
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text
+from database import Database, Base, versoes_tabelas
+from utils import ler_configuracao
+
+
+def _tamanho(valor) -> int:
+    """ Estimativa do tamanho (bytes) de um valor lido do banco """
+    if valor is None:
+        return 0
+    if isinstance(valor, (bytes, bytearray, memoryview, str)):
+        return len(valor)
+    return 8
+
+
+# Comentários e textos/identificadores entre aspas, ignorados ao classificar o comando
+_TEXTO_E_COMENTARIOS = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", re.S)
+_PALAVRAS_ESCRITA = re.compile(
+    r"\b(insert|update|delete|merge|into|create|alter|drop|truncate|grant|revoke|copy|call|do|lock)\b", re.I
+)
+# Comandos que o Postgres aceita num cursor do lado do servidor (DECLARE ... CURSOR FOR)
+_LEITURA_EM_CURSOR = ('select', 'with', 'values', 'table')
+
+
+def _classificar(sql: str) -> tuple:
+    """
+    (somente leitura, aceita cursor do servidor). Na dúvida o comando é
+    tratado como escrita: o resultado é confirmado e os caches recarregados.
+    UPDATE/INSERT/DELETE ... RETURNING e CTEs com escrita retornam linhas,
+    mas são escrita.
+    """
+    limpo = _TEXTO_E_COMENTARIOS.sub(' ', sql)
+    primeira = re.match(r"[\s(]*(\w*)", limpo).group(1).lower()
+    leitura = primeira in _LEITURA_EM_CURSOR + ('show', 'explain') and not _PALAVRAS_ESCRITA.search(limpo)
+    return leitura, leitura and primeira in _LEITURA_EM_CURSOR
+
+
+def _resumir(valor):
+    """ Binários não vão para a tela: mostra só o tamanho """
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return f"<{len(valor)} bytes>"
+    return valor
+
+
+class ExecucaoSQL:
+    """
+    Execução de um comando do console. 'estado' vai de 'executando' para
+    'concluida', 'erro' ou 'cancelada'. Em 'concluida', 'resultado' é um
+    DataFrame (comandos que retornam linhas) ou None, e 'truncado' indica
+    que o limite de linhas/bytes interrompeu a leitura. Comandos de escrita,
+    inclusive os que retornam linhas (RETURNING), são confirmados.
+    """
+
+    def __init__(
+                 self,
+                 db: Database,
+                 sql: str,
+                 timeout_s: float = None,
+                 max_linhas: int = None,
+                 max_bytes: int = None,
+                 tamanho_lote: int = 500
+                 ) -> None:
+        self.db = db
+        self.sql = sql
+        self.timeout_s = float(timeout_s or ler_configuracao("CONSOLE_TIMEOUT_S", 30))
+        self.max_linhas = int(max_linhas or ler_configuracao("CONSOLE_MAX_LINHAS", 5000))
+        self.max_bytes = int(max_bytes or ler_configuracao("CONSOLE_MAX_BYTES", 20 * 1024 * 1024))
+        self.tamanho_lote = tamanho_lote
+
+        self.estado = 'executando'
+        self.resultado = None
+        self.truncado = False
+        self.linhas_afetadas = None
+        self.mensagem = ''
+        self.inicio = time.monotonic()
+        self.duracao = None
+        self.data = datetime.now()
+
+        self._cancelar = threading.Event()
+        self._dbapi = None
+        self._thread = threading.Thread(target=self._executar, name='console-sql', daemon=True)
+        self._thread.start()
+
+    @property
+    def executando(self) -> bool:
+        return self.estado == 'executando'
+
+    def aguardar(self, timeout: float = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def cancelar(self) -> None:
+        """ Pede o cancelamento; no Postgres, também cancela a consulta no servidor """
+        self._cancelar.set()
+        dbapi = self._dbapi
+        if dbapi is not None and hasattr(dbapi, 'cancel'):
+            try:
+                dbapi.cancel()
+            except Exception as e:
+                print(f"Falha ao cancelar a consulta do console: {e}")
+
+    def _proteger_sqlite(self, dbapi) -> None:
+        # O sqlite não tem statement_timeout: o progress handler interrompe a
+        # consulta quando passa do tempo ou quando o cancelamento é pedido
+        limite = self.inicio + self.timeout_s
+
+        def verificar():
+            return 1 if self._cancelar.is_set() or time.monotonic() > limite else 0
+
+        dbapi.set_progress_handler(verificar, 10000)
+
+    def _executar(self) -> None:
+        postgres = self.db.engine.dialect.name == 'postgresql'
+        try:
+            with self.db.engine.connect() as conn:
+                self._dbapi = conn.connection.driver_connection
+                if postgres:
+                    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.timeout_s * 1000)}")
+                elif hasattr(self._dbapi, 'set_progress_handler'):
+                    self._proteger_sqlite(self._dbapi)
+
+                try:
+                    # Só leituras usam o cursor do servidor: o Postgres não aceita
+                    # RETURNING nem CTEs com escrita num DECLARE ... CURSOR
+                    leitura, em_cursor = _classificar(self.sql)
+                    resultado = conn.execution_options(stream_results=em_cursor).execute(text(self.sql))
+                    if resultado.returns_rows:
+                        self.resultado = self._ler(resultado)
+                    else:
+                        self.linhas_afetadas = resultado.rowcount
+                    if not leitura and self._cancelar.is_set():
+                        raise RuntimeError("Execução cancelada; nenhuma alteração foi gravada.")
+                    conn.commit()
+                    if not leitura:
+                        # Comando livre: não dá para saber quais tabelas mudaram,
+                        # então todos os caches derivados são recarregados
+                        versoes_tabelas.incrementar(*Base.metadata.tables)
+                finally:
+                    if not postgres and hasattr(self._dbapi, 'set_progress_handler'):
+                        self._dbapi.set_progress_handler(None, 0)
+                    self._dbapi = None
+
+            self.estado = 'concluida'
+        except Exception as e:
+            self.estado = 'cancelada' if self._cancelar.is_set() else 'erro'
+            self.mensagem = str(e)
+        finally:
+            self.duracao = time.monotonic() - self.inicio
+
+    def _ler(self, resultado) -> pd.DataFrame:
+        """
+        Lê em lotes (fetchmany) até o fim, ou até o limite de linhas/bytes.
+        O limite de bytes é conferido linha a linha, e o tamanho do lote
+        encolhe conforme a média por linha para não buscar muito além dele.
+        """
+        nomes = list(resultado.keys())
+        linhas, total_bytes = [], 0
+        while len(linhas) < self.max_linhas and not self._cancelar.is_set():
+            tamanho = min(self.tamanho_lote, self.max_linhas - len(linhas))
+            if linhas:
+                media = max(1, total_bytes // len(linhas))
+                tamanho = min(tamanho, (self.max_bytes - total_bytes) // media + 1)
+            else:
+                tamanho = 1     # a primeira linha dá a estimativa do tamanho médio
+            lote = resultado.fetchmany(tamanho)
+            if not lote:
+                break
+            for linha in lote:
+                total_bytes += sum(_tamanho(valor) for valor in linha)
+                if total_bytes > self.max_bytes:
+                    self.truncado = True
+                    break
+                linhas.append(tuple(_resumir(valor) for valor in linha))
+            if self.truncado:
+                break
+        else:
+            # Saiu pelo limite de linhas (ou cancelamento): há mais linhas se o cursor não acabou
+            self.truncado = resultado.fetchone() is not None
+        resultado.close()
+        return pd.DataFrame.from_records(linhas, columns=nomes)
+
+
+def planoExecucao(db: Database, sql: str) -> list:
+    """ Plano de execução (EXPLAIN, sem executar o comando) """
+    return db.explicarConsulta(text(sql))
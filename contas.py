@@ -3,13 +3,16 @@
 Classes para processar informações de Conta, inclusive relacionadas à sua criação e seu acesso.
 
 """
+import time
 from datetime import datetime
 from typing import Union 
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from usuarios import Usuario, Coordenador, Superusuario
-from database import Database, TabelaUsuario, TabelaAprovados, TabelaDocumentos
-from utils import hash_password, verify_password
-from PIL import Image
-import io
+from database import Database, TabelaUsuario, TabelaAprovados
+from utils import hash_password, verify_password, precisa_rehash, servico_senhas
+from documentos import pipeline_documentos, DocumentoInvalido
+from metricas import logins, tempo_cadastro
 
 class Conta:
 
@@ -39,48 +42,113 @@ class Conta:
                     **kwargs
                    ) -> dict:
         
-        if self._existe_cadastro_previo(n_inscr):
+        tempos = {}
+        inicio = time.perf_counter()
+
+        # 1) Uma única consulta: dados de aprovação + existência de conta
+        dados_aprovacao = self._buscar_aprovacao_e_conta(n_inscr)
+        tempos['consulta'] = time.perf_counter() - inicio
+
+        if dados_aprovacao and dados_aprovacao['conta_existente']:
+            tempo_cadastro.observar(time.perf_counter() - inicio, resultado='conta_existente')
             return {
                     'função': 'criarConta', 
                     'data': datetime.now(), 
                     'sucesso': False, 
-                    'resultado': 'Já existe conta para essa inscrição'
+                    'resultado': 'Já existe conta para essa inscrição',
+                    'tempos': tempos
                     }
         
-        dados_aprovacao = self._buscar_dados_colocacao(n_inscr)
-        
         if dados_aprovacao:
             nome = dados_aprovacao['nome']
             posicao = dados_aprovacao['posicao']
             grupo = dados_aprovacao['grupo']
             cota = dados_aprovacao['cota']
+
+            # 2) Só o cabeçalho da imagem é lido aqui; a compactação é feita
+            # depois, pelo pipeline de documentos
+            etapa = time.perf_counter()
+            try:
+                pipeline_documentos().validar(documento)
+            except DocumentoInvalido as e:
+                tempo_cadastro.observar(time.perf_counter() - inicio, resultado='documento_invalido')
+                return {
+                        'função': 'criarConta', 
+                        'data': datetime.now(), 
+                        'sucesso': False, 
+                        'resultado': str(e),
+                        'tempos': tempos
+                        }
+            tempos['documento'] = time.perf_counter() - etapa
+
+            # 3) bcrypt fora da transação, para não segurar uma conexão do pool
+            etapa = time.perf_counter()
             senha_criptografada = hash_password(senha)
+            tempos['hash_senha'] = time.perf_counter() - etapa
+
+            # 4) Usuário e documento gravados numa única transação (um flush)
+            etapa = time.perf_counter()
+            chave_blob = None
+            try:
+                with self.db.unidadeDeTrabalho() as session:
+                    self._adicionar_conta(nome, posicao, senha_criptografada, email, 
+                                          telefone, opcao, n_inscr, grupo, formacao_academica, cota,
+                                          opcao_contato, session=session)
+                    registro_documento = self._armazenar_doc(n_inscr, documento, session=session)
+                    chave_blob = registro_documento.chave_blob
+                    session.flush()
+                    id_documento = registro_documento.id_documento
+            except IntegrityError:
+                # Outra requisição criou a conta entre a consulta e a gravação,
+                # ou o e-mail já está em uso (coluna única)
+                self._descartar_doc(chave_blob)
+                tempo_cadastro.observar(time.perf_counter() - inicio, resultado='conta_existente')
+                return {
+                        'função': 'criarConta', 
+                        'data': datetime.now(), 
+                        'sucesso': False, 
+                        'resultado': 'Já existe conta para essa inscrição ou e-mail',
+                        'tempos': tempos
+                        }
+            except Exception:
+                self._descartar_doc(chave_blob)
+                raise
+            tempos['gravacao'] = time.perf_counter() - etapa
 
-            self._adicionar_conta(nome, posicao, senha_criptografada, email, 
-                                  telefone, opcao, n_inscr, grupo, formacao_academica, cota,
-                                  opcao_contato)
-            
-            self._armazenar_doc(n_inscr, documento)
+            # Compactação do documento em segundo plano
+            pipeline_documentos().agendar(self.db, id_documento)
+            tempos['total'] = time.perf_counter() - inicio
+            tempo_cadastro.observar(tempos['total'], resultado='sucesso')
 
             return {
                     'função': 'criarConta', 
                     'data': datetime.now(), 
                     'sucesso': True, 
-                    'resultado': f'Criado conta para {nome}'
+                    'resultado': f'Criado conta para {nome}',
+                    'tempos': tempos
                     }
         else:
+            tempo_cadastro.observar(time.perf_counter() - inicio, resultado='nao_aprovado')
             return {
                     'função': 'criarConta', 
                     'data': datetime.now(), 
                     'sucesso': False, 
-                    'resultado': 'Não encontrado número de inscrição do candidato.'
+                    'resultado': 'Não encontrado número de inscrição do candidato.',
+                    'tempos': tempos
                     }
 
 
 
-    def acessarConta(self, n_inscr: str, senha: str) -> dict:
-        
-        if not self._existe_cadastro_previo(n_inscr):
+    def acessarConta(self, n_inscr: str, senha: str, preCarga=None) -> dict:
+        """
+        Autentica a inscrição. 'preCarga(usuario)', se informada, é chamada
+        só depois da senha conferida: as consultas que ela dispara (em
+        segundo plano) correm enquanto a página é recarregada para o usuário
+        logado. Uma senha errada não dispara consulta nenhuma.
+        """
+        registros = self.db.retornarValor(TabelaUsuario, filter_dict={'n_inscr': n_inscr})
+        if not registros:
+            logins.inc(resultado='inexistente')
             return {
                     'função': 'acessarConta', 
                     'data': datetime.now(), 
@@ -88,10 +156,12 @@ class Conta:
                     'resultado': 'Não existe conta criada para essa inscrição'
                     }
         
-        dados = self._buscar_dados_conta(n_inscr)
-
+        dados = registros[0]
+        role = dados['role']
+        conta_usuario = self.CLASSES[role](**dados)
 
         if not verify_password(senha, dados['senha']):
+            logins.inc(resultado='senha_incorreta')
             return {
                     'função': 'acessarConta', 
                     'data': datetime.now(), 
@@ -104,10 +174,19 @@ class Conta:
             # if dados['nome'] == 'Jimmy Paiva Gomes':
             #     dados['role'] = 'superuser'
 
-            role = dados['role']
-            conta_usuario = self.CLASSES[role](**dados)
+            # Hash gerado com outro custo: refaz em segundo plano, sem atrasar o login
+            if precisa_rehash(dados['senha']):
+                self._refazer_hash_senha(n_inscr, senha)
+
+            if preCarga is not None:
+                try:
+                    preCarga(conta_usuario)
+                except Exception as e:
+                    # A pré-carga é só uma otimização: o login segue sem ela
+                    print(f"Falha ao iniciar a pré-carga de {n_inscr}: {e}")
 
             self.role = role
+            logins.inc(resultado='sucesso')
             return {
                     'função': 'acessarConta', 
                     'data': datetime.now(), 
@@ -125,14 +204,42 @@ class Conta:
     #         cota_modif = "Aprovado"
     #     return cota_modif
         
-    def _existe_cadastro_previo(self, n_inscr) -> bool:
-        return len(self.db.retornarValor(TabelaUsuario, filter_dict={'n_inscr': n_inscr})) != 0
-    
-    def _buscar_dados_conta(self, n_inscr) -> dict:
-        return self.db.retornarValor(TabelaUsuario, filter_dict={'n_inscr': n_inscr})[0]
-    
-    def _buscar_dados_colocacao(self, n_inscr) -> dict:
-        return self.db.retornarValor(TabelaAprovados, {'n_inscr': n_inscr})[0]
+    def _refazer_hash_senha(self, n_inscr: str, senha: str) -> None:
+        """ Regrava o hash da senha com o custo atual, quando o hash ficar pronto """
+        def _gravar(futuro):
+            try:
+                self.db.atualizarTabela(TabelaUsuario, {'n_inscr': n_inscr}, {'senha': futuro.result()})
+            except Exception as e:
+                print(f"Falha ao refazer hash da senha de {n_inscr}: {e}")
+
+        servico_senhas().hash_async(senha).add_done_callback(_gravar)
+
+    def _buscar_aprovacao_e_conta(self, n_inscr) -> dict:
+        """
+        Numa só consulta, retorna os dados de aprovação do candidato e se já
+        existe conta para a inscrição (chave 'conta_existente').
+        Retorna None se a inscrição não constar na lista de aprovados.
+        """
+        consulta = (
+            select(
+                TabelaAprovados.nome,
+                TabelaAprovados.posicao,
+                TabelaAprovados.grupo,
+                TabelaAprovados.cota,
+                TabelaUsuario.n_inscr.label('n_inscr_conta')
+            )
+            .outerjoin(TabelaUsuario, TabelaUsuario.n_inscr == TabelaAprovados.n_inscr)
+            .where(TabelaAprovados.n_inscr == n_inscr)
+        )
+        with self.db.engine.connect() as conn:
+            linha = conn.execute(consulta).mappings().first()
+
+        if linha is None:
+            return None
+
+        dados = dict(linha)
+        dados['conta_existente'] = dados.pop('n_inscr_conta') is not None
+        return dados
     
     def _adicionar_conta(self, 
                      nome: str, 
@@ -146,6 +253,7 @@ class Conta:
                      formacao_academica: str,
                      cota: str = "AC",
                      opcao_contato: str = 'Não desejo receber',
+                     session=None
                     ) -> None:
 
         data_dict = {
@@ -162,38 +270,25 @@ class Conta:
             'opcao_contato': opcao_contato
         }
         
-        self.db.inserirDados(TabelaUsuario, data_dict)
+        if session is not None:
+            # Dentro de uma unidade de trabalho: o flush/commit é feito por ela
+            session.add(TabelaUsuario(**data_dict))
+        else:
+            self.db.inserirDados(TabelaUsuario, data_dict)
 
-    def _armazenar_doc(self, n_inscr, documento):
+    def _armazenar_doc(self, n_inscr, documento, session):
         """
-        Lê o arquivo enviado, converte em JPEG (por exemplo), reduzindo
-        resolução e qualidade, depois salva no banco.
+        Grava o documento enviado, como recebido, dentro da unidade de trabalho.
+        A conversão para JPEG (reduzindo resolução e qualidade) é feita depois,
+        em segundo plano, pelo pipeline de documentos.
         """
-        # 1) Ler o documento em memória
-        conteudo_original = documento.read()
+        return pipeline_documentos().receber(n_inscr, documento, session)
 
-        # 2) Abrir com Pillow
-        # Obs: como 'documento' é um UploadedFile, podemos criar um BytesIO a partir dele
-        image = Image.open(io.BytesIO(conteudo_original))
-
-        # 3) (Opcional) Converter para RGB (caso seja RGBA ou outro modo)
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        # 4) (Opcional) Reduzir a resolução (thumbnail) 
-        #    Exemplo: no máximo 1000x1000 px
-        image.thumbnail((1000, 1000))
-
-        # 5) Salvar como JPEG em memória, com qualidade menor (ex.: 70)
-        buf = io.BytesIO()
-        image.save(buf, format="JPEG", optimize=True, quality=70)
-        conteudo_compactado = buf.getvalue()
-
-        # 6) Agora sim, gravar no banco. O nome_arquivo pode ter sido .png originalmente,
-        #    mas nós convertemos para .jpg no processo – fica a critério de você ajustar.
-        novo_documento = {
-            'n_inscr': n_inscr,
-            'nome_arquivo': documento.name,
-            'conteudo': conteudo_compactado
-        }
-        self.db.inserirDados(TabelaDocumentos, novo_documento)
\ No newline at end of file
+    def _descartar_doc(self, chave_blob) -> None:
+        """ Apaga o blob gravado por _armazenar_doc quando a transação é desfeita """
+        if chave_blob is None:
+            return
+        try:
+            pipeline_documentos().descartar(self.db, chave_blob)
+        except Exception as e:
+            print(f"Falha ao apagar o documento de um cadastro desfeito: {e}")
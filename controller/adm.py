@@ -3,10 +3,22 @@
 import streamlit as st
 import pandas as pd
 import os
+import time
 import datetime
 from database import Database, TabelaUsuario
+from referencia import dados_referencia
+from exportacao import exportarTabela, FORMATOS
+from console_sql import ExecucaoSQL, planoExecucao
+from controller.grade import grade_usuarios
+from instrumentacao import estatisticas_consultas
 from utils import carregar_chave_criptografia, decriptar_arquivo
-from sqlalchemy import text
+
+# Colunas exibidas/exportadas no painel (sem o hash da senha)
+COLUNAS_USUARIOS = [
+    'n_inscr', 'posicao', 'nome', 'email', 'telefone', 'grupo', 'cota',
+    'formacao_academica', 'opcao', 'opcao_contato', 'role',
+    'data_criacao', 'data_ultima_modificacao'
+]
 
 def administrar_web_app(db: Database):
     st.subheader('Painel de Administração - Superusuário')
@@ -15,11 +27,7 @@ def administrar_web_app(db: Database):
     # 1. Exibir todos os usuários cadastrados
     # ---------------------------------------------------------
     st.write("### Usuários Registrados")
-    usuarios = db.retornarTabela(TabelaUsuario)
-    if usuarios.empty:
-        st.warning("Nenhum usuário registrado.")
-    else:
-        st.dataframe(usuarios)
+    grade_usuarios(db, 'adm_usuarios', COLUNAS_USUARIOS)
 
     # ---------------------------------------------------------
     # 2. Recuperar informações detalhadas de um usuário
@@ -67,25 +75,33 @@ def administrar_web_app(db: Database):
 
 
     # ---------------------------------------------------------
-    # 4. Exportar informações de usuários (CSV ou Excel)
+    # 4. Exportar informações de usuários (CSV, Excel ou Parquet)
     # ---------------------------------------------------------
     st.write("### Exportar Usuários Cadastrados")
-    formato = st.selectbox("Escolha o formato de exportação", ["CSV", "Excel"], key="export_format")
+    formato = st.selectbox("Escolha o formato de exportação", list(FORMATOS), key="export_format")
+    colunas_exportacao = st.multiselect(
+        "Colunas", COLUNAS_USUARIOS, default=COLUNAS_USUARIOS, key="export_colunas"
+    )
+    grupos_exportacao = st.multiselect(
+        "Grupos (vazio = todos)", dados_referencia.listaGrupos(db), key="export_grupos"
+    )
     if st.button("Exportar"):
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        if formato == "CSV":
-            caminho_arquivo = f"usuarios_exportados_{timestamp}.csv"
-            usuarios.to_csv(caminho_arquivo, index=False)
+        if not colunas_exportacao:
+            st.error("Selecione ao menos uma coluna.")
         else:
-            caminho_arquivo = f"usuarios_exportados_{timestamp}.xlsx"
-            usuarios.to_excel(caminho_arquivo, index=False)
-
-        with open(caminho_arquivo, "rb") as f:
-            st.download_button(
-                label="Baixar Arquivo Exportado", 
-                data=f, 
-                file_name=os.path.basename(caminho_arquivo)
-            )
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            extensao, mime = FORMATOS[formato]
+            filtros = {'grupo': grupos_exportacao} if grupos_exportacao else None
+
+            # Gerado em lotes num buffer temporário, descartado ao sair do bloco
+            with exportarTabela(db, TabelaUsuario, colunas_exportacao, formato, filtros,
+                                ordem=['grupo', 'cota', 'posicao']) as arquivo:
+                st.download_button(
+                    label="Baixar Arquivo Exportado",
+                    data=arquivo,
+                    file_name=f"usuarios_exportados_{timestamp}.{extensao}",
+                    mime=mime
+                )
 
     # ---------------------------------------------------------
     # 5. Atribuir Role (usuario / coordenador / superuser)
@@ -120,25 +136,107 @@ def administrar_web_app(db: Database):
         height=150
     )
     
-    if st.button("Executar Comando SQL"):
-        if not sql_command.strip():
-            st.error("Por favor, digite um comando SQL válido.")
+    col_executar, col_plano = st.columns(2)
+    with col_executar:
+        executar = st.button("Executar Comando SQL")
+    with col_plano:
+        ver_plano = st.button("Ver Plano de Execução")
+
+    if (executar or ver_plano) and not sql_command.strip():
+        st.error("Por favor, digite um comando SQL válido.")
+    elif ver_plano:
+        try:
+            st.code("\n".join(planoExecucao(db, sql_command)))
+        except Exception as e:
+            st.error(f"Erro ao gerar o plano: {e}")
+    elif executar:
+        execucao = st.session_state.get('console_sql')
+        if execucao is not None and execucao.executando:
+            st.warning("Já existe um comando em execução. Cancele-o ou aguarde.")
         else:
-            with db.get_session() as session:
-                try:
-                    # Usamos a engine ou a session para executar
-                    result = session.execute(text(sql_command))
-                    session.commit()
+            # Roda numa thread própria, com tempo e volume de leitura limitados
+            st.session_state['console_sql'] = ExecucaoSQL(db, sql_command)
+            st.session_state['console_sql_pagina'] = 1
+
+    execucao = st.session_state.get('console_sql')
+    if execucao is not None:
+        if execucao.executando:
+            _acompanhar_execucao_sql()
+        else:
+            _mostrar_resultado_sql(execucao)
+
+    # ---------------------------------------------------------
+    # 7. Desempenho das consultas (desde o início do processo)
+    # ---------------------------------------------------------
+    st.write("### Desempenho das Consultas")
+    _painel_desempenho()
+
+
+@st.fragment
+def _painel_desempenho():
+    """ Consultas e páginas mais custosas deste processo, pela instrumentação do banco """
+    st.caption(
+        f"Desde {estatisticas_consultas.inicio:%d/%m/%Y %H:%M:%S} - consultas lentas: "
+        f"acima de {estatisticas_consultas.limite_lenta * 1000:.0f} ms"
+    )
+    ordem = st.selectbox(
+        "Ordenar consultas por", ['tempo_total_ms', 'tempo_max_ms', 'chamadas', 'linhas', 'bytes'],
+        key='desempenho_ordem'
+    )
+
+    st.write("Consultas mais custosas")
+    st.dataframe(estatisticas_consultas.topConsultas(20, ordem), hide_index=True)
+    st.write("Tempo por método de acesso ao banco")
+    st.dataframe(estatisticas_consultas.porOrigem(), hide_index=True)
+    st.write("Tempo por página")
+    st.dataframe(estatisticas_consultas.paginas(), hide_index=True)
+
+    lentas = estatisticas_consultas.lentas()
+    if lentas.empty:
+        st.info("Nenhuma consulta lenta registrada.")
+    else:
+        st.write("Consultas lentas recentes")
+        st.dataframe(lentas, hide_index=True)
+
+    st.button("Zerar Estatísticas", on_click=estatisticas_consultas.zerar)
+
+
+@st.fragment(run_every=1)
+def _acompanhar_execucao_sql():
+    """ Acompanha (a cada segundo) o comando em execução, com opção de cancelar """
+    execucao = st.session_state.get('console_sql')
+    if execucao is None or not execucao.executando:
+        st.rerun()
+
+    st.info(f"Executando há {time.monotonic() - execucao.inicio:.0f}s (limite: {execucao.timeout_s:.0f}s)...")
+    if st.button("Cancelar Comando"):
+        execucao.cancelar()
+        execucao.aguardar(5)
+        st.rerun()
+
+
+def _mostrar_resultado_sql(execucao, tamanho_pagina: int = 50):
+    """ Mostra o resultado do último comando do console, paginado """
+    if execucao.estado == 'cancelada':
+        st.warning(f"Comando cancelado após {execucao.duracao:.1f}s.")
+    elif execucao.estado == 'erro':
+        st.error(f"Erro ao executar comando: {execucao.mensagem}")
+    elif execucao.resultado is None:
+        st.success(f"Comando SQL executado com sucesso! Linhas afetadas: {execucao.linhas_afetadas} ({execucao.duracao:.2f}s)")
+    elif execucao.resultado.empty:
+        st.info("Nenhuma linha retornada.")
+    else:
+        df = execucao.resultado
+        st.write(f"Resultado: {len(df)} linha(s) em {execucao.duracao:.2f}s")
+        if execucao.truncado:
+            st.warning(
+                f"Resultado truncado pelo limite de {execucao.max_linhas} linhas "
+                f"ou {execucao.max_bytes // (1024 * 1024)} MB lidos."
+            )
 
-                    # Se for um SELECT, podemos exibir o resultado
-                    if sql_command.strip().lower().startswith("select"):
-                        rows = result.fetchall()
-                        if rows:
-                            st.write("Resultado:")
-                            st.write(rows)
-                        else:
-                            st.info("Nenhuma linha retornada ou SELECT sem resultados.")
-                    else:
-                        st.success("Comando SQL executado com sucesso!")
-                except Exception as e:
-                    st.error(f"Erro ao executar comando: {e}")
\ No newline at end of file
+        n_paginas = (len(df) + tamanho_pagina - 1) // tamanho_pagina
+        pagina = st.number_input(
+            f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, step=1, key='console_sql_pagina'
+        )
+        inicio = (pagina - 1) * tamanho_pagina
+        st.dataframe(df.iloc[inicio:inicio + tamanho_pagina], hide_index=True)
@@ -2,6 +2,7 @@
 
 import streamlit as st
 from database import TabelaGrupos
+from referencia import dados_referencia
 
 def controle_de_grupo(conta, db):
     """
@@ -14,20 +15,21 @@ def controle_de_grupo(conta, db):
     st.subheader("Atualizar Vagas e Link por Cota")
 
     # 1. Selecionar a cota
-    opcoes_cota = ["AC", "Racial", "PCD"]
+    #    (as cotas como gravadas em 'grupos', para o filtro da atualização bater)
+    opcoes_cota = dados_referencia.listaCotas(db)
+    if not opcoes_cota:
+        st.warning("Nenhuma cota cadastrada na tabela de grupos.")
+        return
     cota_escolhida = st.selectbox("Escolha a cota", opcoes_cota)
 
-    # 2. Buscar registro na TabelaGrupos (grupo = conta.grupo, cota = cota_escolhida)
-    registro = db.retornarValor(
-        TabelaGrupos,
-        filter_dict={"grupo": conta.grupo, "cota": cota_escolhida}
-    )
+    # 2. Buscar registro de grupos (grupo = conta.grupo, cota = cota_escolhida),
+    #    no cache de dados de referência (recarregado após cada atualização)
+    registro = dados_referencia.grupo(db, conta.grupo, cota_escolhida)
 
     if registro:
         # Se já existe, obtemos qtde_vagas/link atuais
-        registro_atual = registro[0]
-        vagas_atuais = registro_atual['qtde_vagas']
-        link_atual = registro_atual['link']
+        vagas_atuais = registro['qtde_vagas']
+        link_atual = registro['link']
     else:
         # Se não existir, assumimos algo padrão
         vagas_atuais = 0
@@ -41,13 +43,17 @@ def controle_de_grupo(conta, db):
     if st.button("Atualizar"):
         # Verifica se o registro já existe
         if registro:
-            # Atualizamos
-            db.atualizarTabela(
+            # Atualizamos, filtrando pelos valores do registro encontrado
+            # (a busca no cache não diferencia maiúsculas de minúsculas)
+            atualizado = db.atualizarTabela(
                 TabelaGrupos,
-                filter_dict={"grupo": conta.grupo, "cota": cota_escolhida},
+                filter_dict={"grupo": registro['grupo'], "cota": registro['cota']},
                 update_dict={"qtde_vagas": qtde_vagas, "link": link_grupo}
             )
-            st.success("Dados atualizados com sucesso!")
+            if atualizado is None:
+                st.error("Registro do grupo não encontrado. Recarregue a página e tente novamente.")
+            else:
+                st.success("Dados atualizados com sucesso!")
         else:
             # Inserimos
             dados_novos = {
@@ -4,8 +4,13 @@ import os
 import streamlit as st
 import pandas as pd
 from mensageria import Mensageria
-from database import TabelaUsuario, TabelaDocumentos, retornarAprovados, TabelaGrupos, TabelaMensagens
+from database import TabelaUsuario, TabelaMensagens
+from referencia import dados_referencia
 from utils import carregar_chave_criptografia, decriptar_arquivo
+from estatisticas import contarUsuariosPorOpcao, contarAprovados, retornarCortesRanking
+from documentos import buscarDocumento, abrirDocumento, previaDocumento
+from controller.visao import visao_sessao, TABELAS_GRUPOS
+from controller.grade import grade_usuarios
 
 def estatisticas_de_grupo_coordenador(conta, db):
     """
@@ -15,21 +20,29 @@ def estatisticas_de_grupo_coordenador(conta, db):
 
     st.subheader("Estatísticas de Grupo - Coordenador")
 
+    # Consultas guardadas no view-model da sessão, refeitas só quando as
+    # tabelas de que dependem mudam
+    visao = visao_sessao(conta)
+
     # -----------------------------------------------------
     # 1. Quantidade de usuários já cadastrados para o grupo
+    #    (agregado no banco: grupo x cota x opção)
     # -----------------------------------------------------
-    df_usuarios = db.retornarTabela(TabelaUsuario)
-    usuarios_grupo = df_usuarios[df_usuarios['grupo'] == conta.grupo]
-    num_usuarios = len(usuarios_grupo)
+    contagem_opcoes = visao.obter(
+        'coordenador_opcoes', ('usuarios',),
+        lambda: contarUsuariosPorOpcao(db, grupo=conta.grupo), parametros=(conta.grupo,)
+    )
+    num_usuarios = int(contagem_opcoes['quantidade'].sum())
 
     st.metric("Usuários Cadastrados no Meu Grupo", num_usuarios)
 
     # -----------------------------------------------------
     # 2. Quantidade de aprovados do grupo
     # -----------------------------------------------------
-    df_aprovados = retornarAprovados(db)
-    aprovados_grupo = df_aprovados[df_aprovados['grupo'] == conta.grupo]
-    num_aprovados = len(aprovados_grupo)
+    num_aprovados = visao.obter(
+        'coordenador_aprovados', ('lista_aprovados',),
+        lambda: int(contarAprovados(db, grupo=conta.grupo)['quantidade'].sum()), parametros=(conta.grupo,)
+    )
 
     st.metric("Total de Aprovados do Meu Grupo", num_aprovados)
 
@@ -38,16 +51,28 @@ def estatisticas_de_grupo_coordenador(conta, db):
     #    (Ex.: quantos "Não vai assumir", "Vai assumir", "Indeciso" etc.)
     # -----------------------------------------------------
     st.write("### Tabela de Opções do Grupo")
-    if not usuarios_grupo.empty:
+    if not contagem_opcoes.empty:
         tabela_opcoes = (
-            usuarios_grupo.groupby(['opcao', 'cota'])
-                          .size()
-                          .reset_index(name='Quantidade')
+            contagem_opcoes[['opcao', 'cota', 'quantidade']]
+                           .rename(columns={'quantidade': 'Quantidade'})
         )
         st.dataframe(tabela_opcoes, hide_index=True)
     else:
         st.info("Não há usuários cadastrados nesse grupo ainda.")
 
+    st.write("### Corte por Cota")
+    cortes = visao.obter(
+        'coordenador_cortes', ('lista_aprovados',) + TABELAS_GRUPOS,
+        lambda: retornarCortesRanking(db, grupo=conta.grupo), parametros=(conta.grupo,)
+    )
+    if not cortes.empty:
+        st.dataframe(cortes.rename(columns={
+            'cota': 'Cota',
+            'qtde_vagas': 'Vagas',
+            'total_aprovados': 'Aprovados',
+            'posicao_corte': 'Posição de Corte'
+        }).drop(columns=['grupo']), hide_index=True)
+
     # -----------------------------------------------------
     # 4. Tabela com informações do grupo
     #    Colunas: Posicao, Nome, Telefone, Email, Opção, Formação, Grupo
@@ -57,22 +82,16 @@ def estatisticas_de_grupo_coordenador(conta, db):
         'n_inscr', 'posicao', 'nome', 'telefone', 'email',
         'opcao', 'formacao_academica', 'grupo'
     ]
-    if not usuarios_grupo.empty:
-        df_exibir = usuarios_grupo[colunas_desejadas].copy()
-        df_exibir.rename(columns={
-            'n_inscr': 'Número de Inscrição',
-            'posicao': 'Posicao',
-            'nome': 'Nome',
-            'telefone': 'Telefone',
-            'email': 'Email',
-            'opcao': 'Opção',
-            'formacao_academica': 'Formação',
-            'grupo': 'Grupo',
-            'cota': 'Cota'
-        }, inplace=True)
-        st.dataframe(df_exibir, hide_index=True)
-    else:
-        st.info("Nenhum usuário ainda se cadastrou nesse grupo.")
+    grade_usuarios(db, 'coordenador_usuarios', colunas_desejadas, rotulos={
+        'n_inscr': 'Número de Inscrição',
+        'posicao': 'Posicao',
+        'nome': 'Nome',
+        'telefone': 'Telefone',
+        'email': 'Email',
+        'opcao': 'Opção',
+        'formacao_academica': 'Formação',
+        'grupo': 'Grupo'
+    }, grupo=conta.grupo)
 
     # -----------------------------------------------------
     # 5. AUDITORIA: Verificar documento do usuário
@@ -84,8 +103,18 @@ def estatisticas_de_grupo_coordenador(conta, db):
 
     n_inscr_arquivo = st.text_input("Número de inscrição do usuário para auditoria")
     
+    # A inscrição auditada fica na sessão, para que o botão de carregar o
+    # original (que provoca um novo rerun) continue na mesma auditoria
     if st.button("Ver Documento"):
-        user_record = usuarios_grupo[usuarios_grupo['n_inscr'] == n_inscr_arquivo]
+        st.session_state['auditoria_n_inscr'] = n_inscr_arquivo
+
+    n_inscr_auditoria = st.session_state.get('auditoria_n_inscr')
+    if n_inscr_auditoria:
+        # Só usuários do grupo do coordenador podem ser auditados
+        user_record = db.retornarColunas(
+            TabelaUsuario, ['n_inscr', 'nome', 'telefone', 'email'],
+            filtros={'grupo': conta.grupo, 'n_inscr': n_inscr_auditoria}
+        )
         if user_record.empty:
             st.error("Usuário não encontrado ou não pertence ao seu grupo.")
         
@@ -98,31 +127,25 @@ def estatisticas_de_grupo_coordenador(conta, db):
 
             # Informa ao usuário que está carregando:
             with st.spinner("Carregando documento. Por favor, aguarde..."):
-                documento = db.retornarValor(TabelaDocumentos, {'n_inscr': n_inscr_arquivo})
+                documento = buscarDocumento(db, n_inscr_auditoria)
 
             if documento:
-                documento = documento[0]
-
-                # Exibir o documento como imagem
+                # Por padrão, exibe só a prévia (gerada uma vez e mantida em cache)
                 try:
-                    st.image(documento['conteudo'], caption=documento['nome_arquivo'], use_container_width=True)
+                    st.image(previaDocumento(db, documento), caption=documento['nome_arquivo'], use_container_width=True)
                 except Exception as e:
                     st.error(f"Erro ao exibir o documento: {e}")
 
-                # Botão para baixar o documento
-                st.download_button(
-                    label="Baixar Documento",
-                    data=documento['conteudo'],
-                    file_name=documento['nome_arquivo']
-                )
+                # O original só é lido quando pedido
+                if st.button("Carregar documento original", key=f"original_{documento['id_documento']}"):
+                    with abrirDocumento(db, documento) as arquivo:
+                        st.download_button(
+                            label="Baixar Documento",
+                            data=arquivo,
+                            file_name=documento['nome_arquivo']
+                        )
             else:
                 st.error("Nenhum documento encontrado para este usuário.")
-                    
-
-import streamlit as st
-from database import TabelaMensagens, TabelaUsuario, TabelaGrupos
-from datetime import datetime
-
 
 
 def criar_mensagem(db, usuario_logado):
@@ -150,9 +173,7 @@ def criar_mensagem(db, usuario_logado):
         )
 
         # Seleção múltipla de grupos
-        df_grupos = db.retornarTabela(TabelaGrupos)
-        df_grupos = df_grupos[df_grupos['grupo']!='TI_RAIZ']    # Ocultando o TI_RAIZ
-        lista_grupos = sorted(df_grupos["grupo"].unique().tolist())
+        lista_grupos = [g for g in dados_referencia.listaGrupos(db) if g != 'TI_RAIZ']    # Ocultando o TI_RAIZ
 
         # Mesmo se for coordenador, deixamos escolher todos
         grupos_escolhidos = st.multiselect(
@@ -69,7 +69,7 @@ def gerenciar_dados_usuario(conta, db):
                 'email': novo_email,
                 'telefone': telefone_limpo,
                 'opcao': nova_opcao,
-
+                'opcao_contato': nova_opcao_contato,
             }
 
             resultado = conta.mudarDados(db=db, mudanca=mudancas)
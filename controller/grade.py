@@ -0,0 +1,78 @@
+# controller/grade.py
+
+import streamlit as st
+from database import versoes_tabelas
+from listagem import ORDENACOES, indice_busca, paginaUsuarios, contarUsuariosFiltrados
+from ranking import OPCOES
+from referencia import dados_referencia
+
+
+@st.fragment
+def grade_usuarios(db, chave: str, colunas: list, rotulos: dict = None, grupo: str = None, tamanho_pagina: int = 50):
+    """
+    Grade paginada de usuários, com busca por nome/inscrição, filtros e
+    ordenação feitos no banco. Só a página visível é lida (paginação por
+    chave); navegar ou filtrar executa apenas este fragmento.
+
+    - chave: prefixo das chaves dos widgets e do estado no st.session_state.
+    - rotulos: {coluna: nome exibido}.
+    - grupo: fixa o filtro de grupo (painel do coordenador).
+    """
+    estado = st.session_state.setdefault(f'grade_{chave}', {'assinatura': None, 'pilha': [None], 'total': None})
+
+    busca = st.text_input("Buscar por nome ou inscrição", key=f'{chave}_busca')
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if grupo is None:
+            grupos = st.multiselect("Grupos", dados_referencia.listaGrupos(db), key=f'{chave}_grupos')
+        else:
+            grupos = [grupo]
+    with col2:
+        cotas = st.multiselect("Cotas", dados_referencia.listaCotas(db), key=f'{chave}_cotas')
+    with col3:
+        opcoes = st.multiselect("Opções", OPCOES, key=f'{chave}_opcoes')
+
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        ordenacao = st.selectbox("Ordenar por", list(ORDENACOES), key=f'{chave}_ordenacao')
+    with col2:
+        decrescente = st.checkbox("Decrescente", key=f'{chave}_decrescente')
+
+    filtros = {nome: valor for nome, valor in (('grupo', grupos), ('cota', cotas), ('opcao', opcoes)) if valor}
+    n_inscrs = indice_busca.buscar(db, busca) if busca.strip() else None
+
+    # Filtros ou ordenação diferentes: volta para a primeira página
+    assinatura = (busca, tuple(grupos), tuple(cotas), tuple(opcoes), ordenacao, decrescente)
+    if estado['assinatura'] != assinatura:
+        estado.update(assinatura=assinatura, pilha=[None], total=None)
+
+    # A contagem só é refeita quando os filtros ou a tabela mudam
+    versao = versoes_tabelas.versao('usuarios')
+    if estado['total'] is None or estado['total'][0] != versao:
+        estado['total'] = (versao, contarUsuariosFiltrados(db, filtros, n_inscrs))
+    total = estado['total'][1]
+
+    if total == 0:
+        st.info("Nenhum usuário encontrado.")
+        return
+
+    pagina, proxima = paginaUsuarios(
+        db, colunas, ordenacao, decrescente, filtros, n_inscrs,
+        apos=estado['pilha'][-1], tamanho_pagina=tamanho_pagina
+    )
+    n_pagina = len(estado['pilha'])
+    n_paginas = (total + tamanho_pagina - 1) // tamanho_pagina
+    st.write(f"{total} usuário(s) - página {n_pagina} de {n_paginas}")
+    st.dataframe(pagina.rename(columns=rotulos or {}), hide_index=True)
+
+    # Os callbacks rodam antes do próximo rerun do fragmento, que já desenha a nova página
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.button("Primeira", key=f'{chave}_primeira', disabled=n_pagina == 1,
+                  on_click=lambda: estado.update(pilha=[None]))
+    with col2:
+        st.button("Anterior", key=f'{chave}_anterior', disabled=n_pagina == 1,
+                  on_click=lambda: estado['pilha'].pop())
+    with col3:
+        st.button("Próxima", key=f'{chave}_proxima', disabled=proxima is None,
+                  on_click=lambda: estado['pilha'].append(proxima))
@@ -1,11 +1,66 @@
 # controller/estatisticas.py
 
 import streamlit as st
-import pandas as pd
 from grupos import Grupo
-from database import TabelaGrupos, retornarAprovados, retornarListaUsuariosNaFrente, TabelaMensagens
+from ranking import indice_ranking
+from referencia import dados_referencia
 from utils import is_valid_link
 from mensageria import Mensageria
+from utils import ler_configuracao
+from controller.visao import visao_sessao, TABELAS_RANKING, TABELAS_GRUPOS, TABELAS_MENSAGENS
+
+# Intervalo (s) com que o painel de mensagens procura mensagens novas
+INTERVALO_MENSAGENS = int(ler_configuracao("MENSAGENS_INTERVALO", 30))
+
+
+def partes_home(usuario, db, pagina: int = 0, tamanho_pagina: int = 10) -> dict:
+    """
+    Dados de cada painel do home, no formato de VisaoSessao.obter
+    ({nome: tabelas, carregar, parametros, validade}). As cargas só usam o
+    banco, então podem rodar em paralelo (VisaoSessao.preCarregar).
+    """
+    mensageria = Mensageria(db)
+    filtro = (usuario.grupo, usuario.cota, usuario.posicao)
+
+    def carregar_contagens():
+        id_ultima_lida = mensageria.ultimaLida(usuario.n_inscr)
+        return (id_ultima_lida, *mensageria.contarMensagens(*filtro, id_ultima_lida))
+
+    return {
+        # 'atualizados_ultimo_dia' depende do relógio, então vale no máximo 5 minutos
+        'na_frente': dict(
+            tabelas=TABELAS_RANKING,
+            carregar=lambda: indice_ranking.naFrente(db, *filtro),
+            parametros=filtro, validade=300
+        ),
+        'registro_grupo': dict(
+            tabelas=TABELAS_GRUPOS,
+            carregar=lambda: dados_referencia.grupo(db, usuario.grupo, usuario.cota),
+            parametros=filtro[:2]
+        ),
+        'link_grupo': dict(
+            tabelas=TABELAS_GRUPOS,
+            carregar=lambda: Grupo(grupo=usuario.grupo, db=db).mostrarLink(usuario.cota),
+            parametros=filtro[:2]
+        ),
+        # O marcador de leitura é só deste usuário: a sessão descarta a contagem
+        # ao marcar como lidas, e a validade cobre leituras feitas em outra aba
+        'contagem_mensagens': dict(
+            tabelas=TABELAS_MENSAGENS, carregar=carregar_contagens,
+            parametros=filtro, validade=60
+        ),
+        'caixa_entrada': dict(
+            tabelas=TABELAS_MENSAGENS,
+            carregar=lambda: mensageria.caixaEntrada(*filtro, pagina, tamanho_pagina),
+            parametros=(*filtro, pagina, tamanho_pagina)
+        ),
+    }
+
+
+def _obter(usuario, db, nome: str, **kwargs):
+    """ Uma parte de partes_home, pelo view-model da sessão """
+    return visao_sessao(usuario).obter(nome, **partes_home(usuario, db, **kwargs)[nome])
+
 
 def apresentar_dados_gerais_usuario(usuario, db):
     """ Função para apresentar os dados normais do usuário """
@@ -20,21 +75,14 @@ def apresentar_dados_gerais_usuario(usuario, db):
         st.metric(label='Perfil', value=usuario.role)
 
 
+@st.fragment
 def apresentar_dados_decisoes(usuario, db):
     """ Função para apresentar os metrics com as informações sobre pessoas à frente"""
     st.subheader("Estatísticas do Grupo")
-    grupo = Grupo(grupo=usuario.grupo, db=db)
 
-    usuarios_frente = retornarListaUsuariosNaFrente(db, usuario.grupo, usuario.posicao, usuario.cota)
-    
-    aprovados_na_frente = retornarAprovados(db)
-    aprovados_na_frente = aprovados_na_frente[
-        (aprovados_na_frente['grupo'] == usuario.grupo) & 
-        (aprovados_na_frente['posicao'] < usuario.posicao) &
-        (aprovados_na_frente['cota'] == usuario.cota)
-    ]
-    total_aprovados_grupo = len(aprovados_na_frente)
-    total_usuarios_frente = len(usuarios_frente)
+    na_frente = _obter(usuario, db, 'na_frente')
+    total_aprovados_grupo = na_frente['aprovados']
+    total_usuarios_frente = na_frente['cadastrados']
 
     if total_aprovados_grupo > 0:
         percentual_frente = (total_usuarios_frente / total_aprovados_grupo) * 100
@@ -42,23 +90,15 @@ def apresentar_dados_decisoes(usuario, db):
         percentual_frente = 0
 
     if total_usuarios_frente > 0:
-        assumir = usuarios_frente[usuarios_frente['opcao'] == "Vai assumir"]
-        indecisos = usuarios_frente[usuarios_frente['opcao'] == "Indeciso"]
-        nao_assumir = usuarios_frente[usuarios_frente['opcao'] == "Não vai assumir"]
-
-        # Exemplo: últimas atualizações no último dia
-        ultimas_atualizacoes = usuarios_frente[
-            usuarios_frente['data_ultima_modificacao'] >= pd.Timestamp.now() - pd.Timedelta(days=1)
-        ]
-
         col1, col2 = st.columns(2)
         with col1:
-            st.metric(label="Usuários que irão assumir na minha frente", value=len(assumir))
-            st.metric(label="Atualizações no último dia", value=len(ultimas_atualizacoes))
+            st.metric(label="Usuários que irão assumir na minha frente", value=na_frente["Vai assumir"])
+            # Exemplo: últimas atualizações no último dia
+            st.metric(label="Atualizações no último dia", value=na_frente['atualizados_ultimo_dia'])
 
         with col2:
-            st.metric(label="Usuários indecisos na minha frente", value=len(indecisos))
-            st.metric(label="Usuários que não vão assumir na minha frente", value=len(nao_assumir))
+            st.metric(label="Usuários indecisos na minha frente", value=na_frente["Indeciso"])
+            st.metric(label="Usuários que não vão assumir na minha frente", value=na_frente["Não vai assumir"])
 
         st.metric(
             label="Percentual de usuários já cadastrados",
@@ -73,34 +113,20 @@ def apresentar_dados_decisoes(usuario, db):
         st.metric(label="Percentual de usuários na minha frente", value=f"{percentual_frente:.2f}%")
 
 
+@st.fragment
 def mostrar_link(usuario, db):
     """ Serve para mostrar o link do grupo ao usuário """
-    usuarios = retornarListaUsuariosNaFrente(db, usuario.grupo, usuario.posicao, usuario.cota)
-    grupo = Grupo(grupo=usuario.grupo, db=db)
-    # Retirar usuários na frente que não vã assumir OU que não tenham se cadastrado ainda
-    if not usuarios.empty:
-        try:
-            nao_vao_assumir = usuarios[usuarios['opcao']=="Não vai assumir"]['n_inscr'].unique()
-        except:
-            nao_vao_assumir = ['aaaaa', 'bbbbb']
-    else:
-        nao_vao_assumir = ['aaaaa', 'bbbbb']
 
-    total_aprov = retornarAprovados(db)
-    total_aprov = total_aprov[
-            (total_aprov['grupo']==usuario.grupo)&
-            (total_aprov['cota']==usuario.cota)&
-            (total_aprov['posicao']<usuario.posicao)
-            ]
-    total_aprov = total_aprov[~total_aprov['n_inscr'].isin(nao_vao_assumir)]
+    # Aprovados à frente, retirando os que já declararam que não vão assumir
+    na_frente = _obter(usuario, db, 'na_frente')
+    total_aprov = na_frente['aprovados'] - na_frente["Não vai assumir"]
 
     # Achar limite de CR para o grupo/cota
-    tabela_grupo = db.retornarTabela(TabelaGrupos)
-    tamanho_CR = tabela_grupo[(tabela_grupo['cota'].str.lower()==usuario.cota.lower()) & (tabela_grupo['grupo']==usuario.grupo)]['qtde_vagas'].values
+    registro_grupo = _obter(usuario, db, 'registro_grupo')
+    tamanho_CR = registro_grupo['qtde_vagas'] if registro_grupo else 0
 
-    if total_aprov.shape[0] < tamanho_CR:  # Se tiver menos usuários à frente que vagas
-        mensagem_grupo = grupo.mostrarMensagens()
-        link_grupo = grupo.mostrarLink()
+    if total_aprov < tamanho_CR:  # Se tiver menos usuários à frente que vagas
+        link_grupo = _obter(usuario, db, 'link_grupo')
 
         if link_grupo['sucesso']:
 
@@ -117,41 +143,68 @@ def mostrar_link(usuario, db):
         st.text("Infelizmente ainda não chegou a sua vez para ser inserido no Grupo do CR da CAGE RS. Mas calma! Aguarde os outros aprovados confirmarem que não vão assumir ou aumentar a quantidade de vagas!")
         
 
-def exibir_mensagens_usuario(usuario, db):
+@st.fragment(run_every=INTERVALO_MENSAGENS)
+def exibir_mensagens_usuario(usuario, db, tamanho_pagina: int = 10):
     """
-    Mostra as mensagens destinadas ao usuário, e abre um 'pop-up'/expander
-    para a mais recente que ele ainda não viu nesta sessão.
+    Mostra as mensagens destinadas ao usuário, paginadas e das mais recentes
+    para as mais antigas, abrindo as que ele ainda não leu.
+    Fragmento: roda de novo sozinho a cada INTERVALO_MENSAGENS segundos
+    (e ao trocar de página), sem refazer os outros painéis.
     """
-    
+    id_ultima_lida, total, nao_lidas = _obter(usuario, db, 'contagem_mensagens')
+
     # (b) Histórico de mensagens
-    st.write("### Histórico de Mensagens")
+    if nao_lidas:
+        st.write(f"### Histórico de Mensagens ({nao_lidas} não lida{'s' if nao_lidas > 1 else ''})")
+    else:
+        st.write("### Histórico de Mensagens")
 
-    # Obter todas as mensagens
-    mensageria = Mensageria(db)
-    df_mensagens = mensageria.listar_mensagens()
-    
-    if df_mensagens.empty:
-        st.success("Nenhuma mensagem criada.")
-        return 
-    
-    # Filtro para o grupo, cota, faixa de posição
-    mask = (
-        (df_mensagens["grupo"] == usuario.grupo) &
-        (df_mensagens["cota"] == usuario.cota) &
-        (df_mensagens["posicao_min"] <= usuario.posicao) &
-        (df_mensagens["posicao_max"] >= usuario.posicao)
-    )
-    mensagens_pertinentes = df_mensagens[mask].sort_values("data_criacao", ascending=False)
-    if mensagens_pertinentes.empty:
+    if total == 0:
         st.success("Nenhuma mensagem criada para o usuário.")
-    else:
-        for i, row in mensagens_pertinentes.iterrows():
-            with st.expander(f"{row['titulo']} (enviada em {row['data_criacao']})", expanded=False):
-                st.write(row["conteudo"])
+        return
+
+    n_paginas = (total + tamanho_pagina - 1) // tamanho_pagina
+    pagina = 0
+    if n_paginas > 1:
+        pagina = st.number_input(
+            f"Página (de {n_paginas})", min_value=1, max_value=n_paginas, value=1, step=1,
+            key='pagina_mensagens'
+        ) - 1
+
+    mensagens = _obter(usuario, db, 'caixa_entrada', pagina=pagina, tamanho_pagina=tamanho_pagina)
+    for _, row in mensagens.iterrows():
+        nova = row['id_mensagem'] > id_ultima_lida
+        titulo = f"{'🔵 ' if nova else ''}{row['titulo']} (enviada em {row['data_criacao']})"
+        with st.expander(titulo, expanded=bool(nova)):
+            st.write(row["conteudo"])
+
+    # As mensagens exibidas passam a contar como lidas a partir do próximo rerun.
+    # O marcador vale para todos os ids até ele, então só avança até antes da
+    # mais antiga não lida que ainda não apareceu nesta sessão (em outra página)
+    if not mensagens.empty:
+        exibidas = st.session_state.setdefault(f'mensagens_exibidas_{usuario.n_inscr}', set())
+        exibidas.update(int(id_mensagem) for id_mensagem in mensagens['id_mensagem'])
+        mais_recente = int(mensagens['id_mensagem'].max())
+        if mais_recente > id_ultima_lida:
+            mensageria = Mensageria(db)
+            nao_exibida = mensageria.primeiraNaoExibida(
+                usuario.grupo, usuario.cota, usuario.posicao, id_ultima_lida, exibidas
+            )
+            marcador = max(exibidas) if nao_exibida is None else nao_exibida - 1
+            if marcador > id_ultima_lida:
+                mensageria.marcarComoLidas(usuario.n_inscr, marcador)
+                visao_sessao(usuario).descartar('contagem_mensagens')
 
 
 def home(usuario, db):
-    """ Função para mostrar tudo do home a uma """
+    """
+    Função para mostrar tudo do home a uma. Cada painel com dados é um
+    fragmento (interações nele só o executam de novo); antes do primeiro
+    desenho, os dados que faltam são carregados em paralelo.
+    """
+    pagina = st.session_state.get('pagina_mensagens', 1) - 1
+    visao_sessao(usuario).preCarregar(partes_home(usuario, db, pagina=pagina))
+
     apresentar_dados_gerais_usuario(usuario, db)
     exibir_mensagens_usuario(usuario, db)
     mostrar_link(usuario, db)
@@ -9,9 +9,11 @@ Aquivo para manter funções de controlador e visualizador de login
 import streamlit as st
 import os
 import datetime
-from database import TabelaAprovados, TabelaDocumentos
+from database import TabelaDocumentos
 from data_p_config.textos import TEXTO_DOCUMENTAÇÃO,TEXTO_PROPOSITO_WEBAPP
 from controller.utils_page import limpar_telefone, validar_email, validar_telefone
+from controller.home import partes_home
+from controller.visao import VisaoSessao
 
 
 def criar_conta(db, conta_manager):
@@ -48,10 +50,10 @@ def criar_conta(db, conta_manager):
 
         submit = st.form_submit_button("Criar")
         if submit:
-            # 1. Verifica se a inscrição existe no TabelaAprovados
-            dados_candidato = db.retornarValor(TabelaAprovados, filter_dict={'n_inscr': n_inscr})
-            if not dados_candidato:
-                st.error("Número de inscrição não encontrado no banco.")
+            # 1. A existência da inscrição em TabelaAprovados é verificada
+            #    por criarConta, na mesma consulta que checa conta prévia
+            if not n_inscr:
+                st.error("Por favor, insira o número de inscrição.")
                 return
             
             if not senha:
@@ -98,7 +100,7 @@ def criar_conta(db, conta_manager):
                 if resultado['sucesso']:
                     st.success("Cadastro criado com sucesso!")
                 else:
-                    st.error("Erro ao salvar os dados no banco.")
+                    st.error(resultado['resultado'])
             except Exception as e:
                 
                 st.error("Erro ao criar a conta. Por favor, contate o administrador do sistema no número (21) 99992-6802!")
@@ -115,9 +117,16 @@ def login(db, conta_manager):
         submit = st.form_submit_button("Acessar")
 
         if submit:
-            resultado = conta_manager.acessarConta(n_inscr, senha)
+            # Com a senha conferida, os dados do home começam a ser carregados
+            # em segundo plano, enquanto a página é recarregada
+            visao = VisaoSessao(n_inscr)
+            resultado = conta_manager.acessarConta(
+                n_inscr, senha,
+                preCarga=lambda usuario: visao.preCarregar(partes_home(usuario, db))
+            )
             if resultado['sucesso']:
                 st.session_state['conta'] = resultado['resultado']
+                st.session_state['visao'] = visao
                 st.session_state['logado'] = True
                 st.success("Acesso realizado com sucesso!")
                 st.rerun()
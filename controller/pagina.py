@@ -10,6 +10,7 @@ from controller.adm import administrar_web_app
 from controller.coordenador_grupo import estatisticas_de_grupo_coordenador, criar_mensagem
 from controller.controle_grupo import controle_de_grupo
 from data_p_config.textos import TEXTO_PROPOSITO_WEBAPP, TEXTO_MUDANCAS_ATUAIS
+from instrumentacao import medirPagina
 
 class Pagina:
     """
@@ -57,10 +58,11 @@ class Pagina:
         opcao = st.radio("Escolha uma opção:", ["Login", "Criar Conta"])
 
         
-        if opcao == "Criar Conta":
-            criar_conta(self.db, self.conta_manager)
-        elif opcao == "Login":
-            login(self.db, self.conta_manager)
+        with medirPagina(opcao):
+            if opcao == "Criar Conta":
+                criar_conta(self.db, self.conta_manager)
+            elif opcao == "Login":
+                login(self.db, self.conta_manager)
 
     def _pagina_principal(self):
         """
@@ -102,44 +104,47 @@ class Pagina:
 
         escolha = st.sidebar.selectbox("Menu", opcoes_menu)
 
-        # Módulo para estatísticas do usuário (já implementado antes)
-        if escolha == "Ver Estatísticas (Usuário)":
-            home(conta, self.db)
-
-        # Estatísticas de grupo (coordenador / superuser)
-        elif escolha == "Gestão de Grupo (Coordenador)":
-            if conta.role in ['coordenador', 'superuser']:
-                estatisticas_de_grupo_coordenador(conta, self.db)
-            else:
-                st.error("Você não tem permissão para esta seção.")
-
-        elif escolha == 'Mensagem ao Grupo':
-            if conta.role in ['coordenador', 'superuser']:
-                criar_mensagem(self.db, conta)
-            else:
-                st.error("Você não tem permissão para criar mensagens.")
-
-
-        # Painel de administração (superuser)
-        elif escolha == "Administração (Superuser)":
-            if conta.role == 'superuser':
-                administrar_web_app(self.db)
-            else:
-                st.error("Você não tem permissão para esta seção.")
-
-        # Gerenciamento de dados do próprio usuário (mudar email, telefone, etc.)
-        elif escolha == "Gerenciar Dados de Usuário":
-            gerenciar_dados_usuario(conta, self.db)
-
-        if escolha == "Controle de Grupo":
-            if conta.role in ['coordenador', 'superuser']:
-                from controller.controle_grupo import controle_de_grupo
-                controle_de_grupo(conta, self.db)
-            else:
-                st.warning("Você não tem permissão para este recurso.")
-
-        # Sair
-        elif escolha == "Sair":
-            st.session_state['logado'] = False
-            st.session_state['conta'] = None
-            st.rerun()
+        # Tempo da página e das consultas feitas nela (painel de desempenho)
+        with medirPagina(escolha):
+            # Módulo para estatísticas do usuário (já implementado antes)
+            if escolha == "Ver Estatísticas (Usuário)":
+                home(conta, self.db)
+
+            # Estatísticas de grupo (coordenador / superuser)
+            elif escolha == "Gestão de Grupo (Coordenador)":
+                if conta.role in ['coordenador', 'superuser']:
+                    estatisticas_de_grupo_coordenador(conta, self.db)
+                else:
+                    st.error("Você não tem permissão para esta seção.")
+
+            elif escolha == 'Mensagem ao Grupo':
+                if conta.role in ['coordenador', 'superuser']:
+                    criar_mensagem(self.db, conta)
+                else:
+                    st.error("Você não tem permissão para criar mensagens.")
+
+
+            # Painel de administração (superuser)
+            elif escolha == "Administração (Superuser)":
+                if conta.role == 'superuser':
+                    administrar_web_app(self.db)
+                else:
+                    st.error("Você não tem permissão para esta seção.")
+
+            # Gerenciamento de dados do próprio usuário (mudar email, telefone, etc.)
+            elif escolha == "Gerenciar Dados de Usuário":
+                gerenciar_dados_usuario(conta, self.db)
+
+            if escolha == "Controle de Grupo":
+                if conta.role in ['coordenador', 'superuser']:
+                    from controller.controle_grupo import controle_de_grupo
+                    controle_de_grupo(conta, self.db)
+                else:
+                    st.warning("Você não tem permissão para este recurso.")
+
+            # Sair
+            elif escolha == "Sair":
+                st.session_state['logado'] = False
+                st.session_state['conta'] = None
+                st.session_state.pop('visao', None)
+                st.rerun()
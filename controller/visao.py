@@ -0,0 +1,121 @@
+# controller/visao.py
+
+"""
+
+View-model da sessão: dados derivados do usuário logado (ranking, caixa de
+mensagens, grupo) guardados no st.session_state, cada um com a versão das
+tabelas de que depende. Um rerun que não mudou essas tabelas (ex.: trocar
+uma opção do menu) reaproveita os dados sem consultar o banco.
+
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import streamlit as st
+from database import versoes_tabelas
+from utils import ler_configuracao
+from metricas import tempo_rerun
+
+# Tabelas de que cada parte do view-model depende
+TABELAS_RANKING = ('usuarios', 'lista_aprovados')
+TABELAS_GRUPOS = ('grupos',)
+TABELAS_MENSAGENS = ('mensagens', 'conteudos_mensagens')
+
+
+class VisaoSessao:
+    """
+    Partes do view-model de um usuário. Cada parte guarda
+    (versões das tabelas, parâmetros, instante da carga, valor) e só é
+    recarregada quando uma das versões ou dos parâmetros muda, ou quando
+    passa da 'validade' (em segundos), se informada.
+    """
+
+    def __init__(self, n_inscr: str) -> None:
+        self.n_inscr = n_inscr
+        self._partes = {}
+
+    def _atual(self, nome: str, versoes: tuple, parametros: tuple, validade: float, agora: float) -> bool:
+        parte = self._partes.get(nome)
+        return not (parte is None or parte[0] != versoes or parte[1] != parametros
+                    or (validade is not None and agora - parte[2] > validade))
+
+    def obter(self, nome: str, tabelas: tuple, carregar, parametros: tuple = (), validade: float = None):
+        # A versão é lida antes da carga: uma escrita concorrente força
+        # nova carga no próximo rerun
+        versoes = versoes_tabelas.versoes(*tabelas)
+        agora = time.monotonic()
+
+        if not self._atual(nome, versoes, parametros, validade, agora):
+            self._partes[nome] = (versoes, parametros, agora, carregar())
+
+        versoes, parametros, instante, valor = self._partes[nome]
+        if isinstance(valor, Future):
+            # Parte pré-carregada em segundo plano: espera só por ela
+            try:
+                valor = valor.result()
+            except Exception as e:
+                print(f"Falha na pré-carga de '{nome}': {e}")
+                valor = carregar()
+            self._partes[nome] = (versoes, parametros, instante, valor)
+        return valor
+
+    def preCarregar(self, partes: dict) -> None:
+        """
+        Dispara ao mesmo tempo, no pool de pré-carga, as partes ausentes ou
+        desatualizadas ({nome: argumentos de obter}); cada carga usa a sua
+        própria conexão do pool do banco. Não espera: o obter de cada parte
+        aguarda apenas o resultado dela. As funções de carga rodam fora do
+        rerun e não podem usar st.*.
+        """
+        agora = time.monotonic()
+        for nome, parte in partes.items():
+            versoes = versoes_tabelas.versoes(*parte['tabelas'])
+            parametros = parte.get('parametros', ())
+            if not self._atual(nome, versoes, parametros, parte.get('validade'), agora):
+                self._partes[nome] = (versoes, parametros, agora, executor_precarga().submit(parte['carregar']))
+
+    def descartar(self, nome: str = None) -> None:
+        """ Descarta uma parte (ou todas), forçando a recarga """
+        if nome is None:
+            self._partes.clear()
+        else:
+            self._partes.pop(nome, None)
+
+
+_executor = None
+_lock_executor = threading.Lock()
+
+
+def executor_precarga() -> ThreadPoolExecutor:
+    """ Pool de threads (PRECARGA_WORKERS) compartilhado pelas pré-cargas do processo """
+    global _executor
+    with _lock_executor:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(ler_configuracao("PRECARGA_WORKERS", 4)),
+                thread_name_prefix='precarga'
+            )
+        return _executor
+
+
+def visao_sessao(conta) -> VisaoSessao:
+    """ View-model do usuário logado, criado uma vez por sessão (e por login) """
+    visao = st.session_state.get('visao')
+    if visao is None or visao.n_inscr != conta.n_inscr:
+        visao = VisaoSessao(conta.n_inscr)
+        st.session_state['visao'] = visao
+    return visao
+
+
+def registrar_rerun(duracao: float) -> None:
+    """
+    Guarda a duração (s) dos últimos reruns da sessão e avisa no log quando
+    um rerun "quente" (não o primeiro da sessão) passa da meta RERUN_META_MS.
+    """
+    tempo_rerun.observar(duracao)
+    tempos = st.session_state.setdefault('tempos_rerun', deque(maxlen=50))
+    meta = float(ler_configuracao("RERUN_META_MS", 150)) / 1000
+    if tempos and duracao > meta:
+        print(f"Rerun lento: {duracao * 1000:.0f} ms (meta {meta * 1000:.0f} ms)")
+    tempos.append(duracao)
@@ -5,12 +5,20 @@ Classes para realizar conexões com banco de dados
 """
 
 import os
+import time
+import threading
+from itertools import chain
+from contextlib import contextmanager
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, LargeBinary, Text
+from sqlalchemy import create_engine, event, select, insert, inspect, Index, Column, String, DateTime, Integer, LargeBinary, Text
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import TimeoutError as TimeoutPool
 import pandas as pd 
 import streamlit as st 
-from utils import hash_password
+from utils import hash_password, ler_configuracao, ler_configuracao_bool
+from instrumentacao import instrumentar
+import metricas
 
 # Criação do Base para uso no modelo declarativo
 Base = declarative_base()
@@ -20,6 +28,9 @@ class TabelaMensagens(Base):
     Armazena as mensagens criadas por coordenadores/superusuários.
     """
     __tablename__ = 'mensagens'
+    __table_args__ = (
+        Index('ix_mensagens_grupo_cota_posicoes', 'grupo', 'cota', 'posicao_min', 'posicao_max'),
+    )
 
     id_mensagem = Column(Integer, primary_key=True, autoincrement=True)
     grupo = Column(String(50), nullable=False)
@@ -27,16 +38,45 @@ class TabelaMensagens(Base):
     posicao_min = Column(Integer, nullable=False)
     posicao_max = Column(Integer, nullable=False)
     titulo = Column(String(255), nullable=False)
-    conteudo = Column(Text, nullable=False)
+    conteudo = Column(Text, nullable=True)                       # legado: corpo copiado em cada linha
+    id_conteudo = Column(Integer, nullable=True, index=True)     # corpo único em 'conteudos_mensagens'
     data_criacao = Column(DateTime, default=datetime.now)
     autor = Column(String(100), nullable=False)
 
 
+class TabelaConteudos(Base):
+    """
+    Corpo das mensagens, gravado uma única vez e referenciado por todas as
+    linhas de 'mensagens' (uma por grupo/cota) do mesmo envio.
+    """
+    __tablename__ = 'conteudos_mensagens'
+
+    id_conteudo = Column(Integer, primary_key=True, autoincrement=True)
+    conteudo = Column(Text, nullable=False)
+    data_criacao = Column(DateTime, default=datetime.now)
+
+
+class TabelaLeituras(Base):
+    """
+    Marcador de leitura por usuário: guarda o id da última mensagem lida
+    (os ids crescem na ordem de criação), sem uma linha por mensagem.
+    """
+    __tablename__ = 'leituras_mensagens'
+
+    n_inscr = Column(String(50), primary_key=True)
+    id_ultima_lida = Column(Integer, nullable=False, default=0)
+    data_leitura = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 class TabelaUsuario(Base):
     """
     Classe que representa a tabela 'usuarios' no banco de dados.
     """
     __tablename__ = 'usuarios'
+    __table_args__ = (
+        Index('ix_usuarios_grupo_cota_posicao', 'grupo', 'cota', 'posicao'),
+        Index('ix_usuarios_nome', 'nome', 'n_inscr'),
+    )
 
     n_inscr = Column(String(50), primary_key=True, index=True)
     posicao = Column(Integer, nullable=False)
@@ -64,6 +104,9 @@ class TabelaAprovados(Base):
     Classe que representa a tabela 'lista_aprovados' no banco de dados.
     """
     __tablename__ = 'lista_aprovados'
+    __table_args__ = (
+        Index('ix_lista_aprovados_grupo_cota_posicao', 'grupo', 'cota', 'posicao'),
+    )
 
     n_inscr = Column(String(50), primary_key=True, index=True)
     posicao = Column(Integer, nullable = False)
@@ -91,17 +134,172 @@ class TabelaDocumentos(Base):
     id_documento = Column(Integer, primary_key=True, autoincrement=True)
     n_inscr = Column(String(50), nullable=False, index=True)
     nome_arquivo = Column(String(255), nullable=False)
-    conteudo = Column(LargeBinary, nullable=False)  # Para armazenar o arquivo em binário
+    # Legado: arquivos antigos guardados no próprio banco. Os novos ficam no
+    # blob store (armazenamento.py), referenciados por 'chave_blob'
+    conteudo = Column(LargeBinary, nullable=True)
+    chave_blob = Column(String(64), nullable=True, index=True)  # sha256 do conteúdo
     data_upload = Column(DateTime, default=datetime.now, nullable=False)
+    # 'pendente' enquanto o pipeline de ingestão não compacta o arquivo;
+    # 'processando' desde 'processando_desde' enquanto um worker o reserva
+    status = Column(String(20), nullable=True, default='pendente', server_default='processado')
+    processando_desde = Column(DateTime, nullable=True)
+    tamanho_original = Column(Integer, nullable=True)      # bytes recebidos no upload
+    tamanho_comprimido = Column(Integer, nullable=True)    # bytes após a compactação
+
+
+class TabelaEnvios(Base):
+    """
+    Fila de saída (outbox) das notificações: uma linha por destinatário e
+    canal, com o status e as tentativas de entrega.
+    """
+    __tablename__ = 'fila_envios'
+    __table_args__ = (
+        Index('ix_fila_envios_status_proxima', 'status', 'proxima_tentativa'),
+    )
+
+    id_envio = Column(Integer, primary_key=True, autoincrement=True)
+    id_mensagem = Column(Integer, nullable=True, index=True)
+    n_inscr = Column(String(50), nullable=False)
+    canal = Column(String(20), nullable=False, default='whatsapp')
+    destino = Column(String(255), nullable=False)
+    titulo = Column(String(255), nullable=True)
+    conteudo = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='pendente')  # pendente, enviando, enviado, falha
+    tentativas = Column(Integer, nullable=False, default=0)
+    proxima_tentativa = Column(DateTime, default=datetime.now, nullable=False)
+    ultimo_erro = Column(Text, nullable=True)
+    data_criacao = Column(DateTime, default=datetime.now, nullable=False)
+    data_envio = Column(DateTime, nullable=True)
+
+
+class PoolMedido(QueuePool):
+    """ QueuePool que registra nas métricas a espera por uma conexão livre """
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutPool:
+            metricas.pool_timeouts.inc()
+            raise
+        finally:
+            metricas.espera_pool.observar(time.perf_counter() - inicio)
 
 
 @st.cache_resource
-def get_engine(db_url):
+def get_engine(
+               db_url,
+               pool_size: int = 5,
+               max_overflow: int = 10,
+               pool_pre_ping: bool = True,
+               pool_recycle: int = 1800,
+               pool_timeout: int = 30
+               ):
     # Cria a engine com pool de conexões (reduz overhead de conexões repetidas)
-    engine = create_engine(db_url, echo=False, pool_size=5, max_overflow=10)
+    engine = create_engine(
+        db_url,
+        echo=False,
+        poolclass=PoolMedido,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=pool_pre_ping,   # descarta conexões derrubadas pelo servidor
+        pool_recycle=pool_recycle,     # segundos até reciclar uma conexão
+        pool_timeout=pool_timeout      # espera máxima por uma conexão livre
+    )
+    # Tempo, linhas e bytes de cada comando (painel de desempenho do superusuário)
+    instrumentar(engine)
+    metricas.registrarPool(engine.pool)
     return engine
 
 
+def configuracao_pool() -> dict:
+    """
+    Parâmetros do pool de conexões, lidos do st.secrets
+    (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_TIMEOUT).
+    """
+    return {
+        'pool_size': int(ler_configuracao("DB_POOL_SIZE", 5)),
+        'max_overflow': int(ler_configuracao("DB_MAX_OVERFLOW", 10)),
+        'pool_pre_ping': ler_configuracao_bool("DB_POOL_PRE_PING", True),
+        'pool_recycle': int(ler_configuracao("DB_POOL_RECYCLE", 1800)),
+        'pool_timeout': int(ler_configuracao("DB_POOL_TIMEOUT", 30)),
+    }
+
+
+class VersoesTabelas:
+    """
+    Versão (contador) de cada tabela neste processo. Toda transação do
+    Database que escreve numa tabela incrementa a versão dela após o commit;
+    os caches derivados (dados de referência, ranking) guardam a versão com
+    que foram construídos e se reconstroem quando ela muda.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versoes = {}
+        self._publicador = None
+
+    def versao(self, tabela: str) -> int:
+        return self._versoes.get(tabela, 0)
+
+    def versoes(self, *tabelas) -> tuple:
+        return tuple(self._versoes.get(tabela, 0) for tabela in tabelas)
+
+    def definirPublicador(self, publicador) -> None:
+        """
+        'publicador(tabelas)' é chamado a cada incremento local, para
+        repassá-lo às outras réplicas (ver invalidacao.py).
+        """
+        self._publicador = publicador
+
+    def incrementar(self, *tabelas, propagar: bool = True) -> None:
+        """
+        Incrementa a versão das tabelas. 'propagar=False' é usado ao aplicar
+        um incremento recebido de outra réplica, para não reenviá-lo.
+        """
+        if not tabelas:
+            return
+        with self._lock:
+            for tabela in tabelas:
+                self._versoes[tabela] = self._versoes.get(tabela, 0) + 1
+
+        if propagar and self._publicador is not None:
+            try:
+                self._publicador(sorted(set(tabelas)))
+            except Exception as e:
+                # A escrita já foi confirmada; as outras réplicas se corrigem pelo TTL
+                print(f"Falha ao publicar invalidação de {tabelas}: {e}")
+
+
+# Instância única por processo
+versoes_tabelas = VersoesTabelas()
+
+
+def _registrar_versionamento(fabrica_sessoes) -> None:
+    """
+    Liga a fábrica de sessões ao versoes_tabelas: as tabelas escritas
+    (pelo ORM no flush, ou por INSERT/UPDATE/DELETE executados na sessão)
+    são anotadas em session.info e só têm a versão incrementada no commit.
+    """
+    def anotar(session, tabelas):
+        session.info.setdefault('tabelas_alteradas', set()).update(tabelas)
+
+    @event.listens_for(fabrica_sessoes, 'after_flush')
+    def _apos_flush(session, flush_context):
+        anotar(session, {obj.__table__.name for obj in chain(session.new, session.dirty, session.deleted)})
+
+    @event.listens_for(fabrica_sessoes, 'do_orm_execute')
+    def _ao_executar(estado):
+        if estado.is_insert or estado.is_update or estado.is_delete:
+            anotar(estado.session, {estado.statement.table.name})
+
+    @event.listens_for(fabrica_sessoes, 'after_commit')
+    def _apos_commit(session):
+        versoes_tabelas.incrementar(*session.info.pop('tabelas_alteradas', ()))
+
+    @event.listens_for(fabrica_sessoes, 'after_rollback')
+    def _apos_rollback(session):
+        session.info.pop('tabelas_alteradas', None)
 
 
 class Database:
@@ -114,18 +312,53 @@ class Database:
           Se não informada, tenta buscar em st.secrets["DB_URL"].
         """
         # Se não for fornecido, buscarmos do st.secrets
-        if not db_url:
-            self.db_url = st.secrets["DB_URL"]
+        self.db_url = db_url or st.secrets["DB_URL"]
         
-        self.engine = get_engine(self.db_url)
+        self.engine = get_engine(self.db_url, **configuracao_pool())
+
+        # Fábrica de sessões criada uma única vez por instância
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        _registrar_versionamento(self.SessionLocal)
 
         # Cria as tabelas no banco (caso não existam)
         Base.metadata.create_all(bind=self.engine)
 
     def get_session(self):
-        engine = get_engine(self.db_url)  # Recupera do cache
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-        return SessionLocal()
+        return self.SessionLocal()
+
+    @contextmanager
+    def unidadeDeTrabalho(self):
+        """
+        Unidade de trabalho: uma única sessão (um checkout de conexão e uma
+        transação) para várias leituras e escritas. Faz commit ao final do
+        bloco, ou rollback se houver exceção.
+
+        Uso:
+            with db.unidadeDeTrabalho() as session:
+                db.retornarValor(TabelaUsuario, {...}, session=session)
+                db.inserirDados(TabelaUsuario, {...}, session=session)
+        """
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @contextmanager
+    def _sessao(self, session=None):
+        """
+        Reaproveita a sessão de uma unidade de trabalho (sem commit próprio)
+        ou abre uma sessão avulsa. Retorna (sessao, propria).
+        """
+        if session is not None:
+            yield session, False
+        else:
+            with self.get_session() as nova:
+                yield nova, True
                 
     def create_all_tables_once(self):
         """
@@ -134,12 +367,15 @@ class Database:
         # Cria as tabelas (se não existir)
         Base.metadata.create_all(bind=self.engine)
 
+        # Em bancos já existentes, cria os índices declarados que ainda faltam
+        self._migrar_esquema()
+
         # Se a TabelaAprovados está vazia, só então insere
-        if self.retornarTabela(TabelaAprovados).empty:
+        if self.retornarColunas(TabelaAprovados, ['n_inscr']).empty:
             self._inserir_tabela_aprovados()
 
         # Se a TabelaGrupos está vazia, só então insere
-        if self.retornarTabela(TabelaGrupos).empty:
+        if self.retornarColunas(TabelaGrupos, ['grupo']).empty:
             self._inserir_grupos()
 
         # Garante a existência de um superusuário padrão
@@ -147,41 +383,171 @@ class Database:
 
     
     
-    def retornarTabela(self, model_class) -> pd.DataFrame:
+    def _migrar_esquema(self):
+        """
+        Migração incremental (create_all não altera tabelas já existentes):
+        - adiciona as colunas declaradas nos modelos que ainda não existem
+          (sempre como anuláveis, com o server_default, se houver);
+        - no Postgres, remove o NOT NULL de colunas que passaram a ser anuláveis;
+        - cria os índices declarados que ainda não existem. No Postgres usa
+          CREATE INDEX CONCURRENTLY IF NOT EXISTS, para não bloquear escritas
+          e tolerar réplicas executando ao mesmo tempo.
+        """
+        inspetor = inspect(self.engine)
+        tabelas_existentes = set(inspetor.get_table_names())
+        postgres = self.engine.dialect.name == 'postgresql'
+
+        for tabela in Base.metadata.sorted_tables:
+            if tabela.name not in tabelas_existentes:
+                continue
+
+            colunas_existentes = {col['name']: col for col in inspetor.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name in colunas_existentes:
+                    # Coluna que passou a ser anulável no modelo (só no Postgres;
+                    # o sqlite não altera restrições de colunas existentes)
+                    if (postgres and coluna.nullable and not coluna.primary_key
+                            and not colunas_existentes[coluna.name]['nullable']):
+                        with self.engine.begin() as conn:
+                            conn.exec_driver_sql(
+                                f'ALTER TABLE {tabela.name} ALTER COLUMN {coluna.name} DROP NOT NULL'
+                            )
+                        print(f"Coluna {tabela.name}.{coluna.name} agora aceita nulos.")
+                    continue
+
+                ddl = (
+                    f'ALTER TABLE {tabela.name} ADD COLUMN {"IF NOT EXISTS " if postgres else ""}'
+                    f'{coluna.name} {coluna.type.compile(dialect=self.engine.dialect)}'
+                )
+                if coluna.server_default is not None:
+                    ddl += f" DEFAULT '{coluna.server_default.arg}'"
+
+                with self.engine.begin() as conn:
+                    conn.exec_driver_sql(ddl)
+                print(f"Coluna {coluna.name} adicionada em {tabela.name}.")
+
+            indices_existentes = {ix['name'] for ix in inspetor.get_indexes(tabela.name)}
+            for indice in tabela.indexes:
+                if indice.name in indices_existentes:
+                    continue
+
+                if postgres:
+                    colunas = ", ".join(col.name for col in indice.columns)
+                    with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        conn.exec_driver_sql(
+                            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {indice.name} '
+                            f'ON {tabela.name} ({colunas})'
+                        )
+                else:
+                    indice.create(bind=self.engine, checkfirst=True)
+
+                print(f"Índice {indice.name} criado em {tabela.name}.")
+
+    def explicarConsulta(self, consulta, forcar_indice: bool = False) -> list:
+        """
+        Retorna o plano de execução (EXPLAIN) de um select() do Core,
+        uma linha do plano por item da lista.
+        'forcar_indice' (Postgres) desabilita o seq scan só nesta transação.
+        """
+        sql = str(consulta.compile(dialect=self.engine.dialect, compile_kwargs={"literal_binds": True}))
+        postgres = self.engine.dialect.name == 'postgresql'
+        prefixo = "EXPLAIN " if postgres else "EXPLAIN QUERY PLAN "
+
+        with self.engine.connect() as conn:
+            if forcar_indice and postgres:
+                conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            linhas = conn.exec_driver_sql(prefixo + sql).fetchall()
+
+        # No sqlite o detalhe do plano é a última coluna; no Postgres, a única
+        return [str(linha[-1]) for linha in linhas]
+
+    def retornarTabela(self, model_class, incluir_binarios: bool = False) -> pd.DataFrame:
         """
         Consulta todos os registros da 'model_class' informada 
         e retorna como DataFrame.
+        Colunas binárias (ex.: TabelaDocumentos.conteudo) só vêm se 'incluir_binarios'.
         """
-        with self.get_session() as session:
-            # Consulta todos os objetos da classe informada
-            results = session.query(model_class).all()
-
-            # Converte cada resultado em um dicionário {coluna: valor}
-            data = []
-            for obj in results:
-                # Percorre as colunas do objeto (mapeadas via SQLAlchemy)
-                row_dict = {
-                    column.name: getattr(obj, column.name)
-                    for column in obj.__table__.columns
-                }
-                data.append(row_dict)
+        return self.retornarColunas(model_class, incluir_binarios=incluir_binarios)
+
+    def retornarColunas(
+                        self,
+                        model_class,
+                        colunas: list = None,
+                        filtros: dict = None,
+                        incluir_binarios: bool = False,
+                        formato: str = 'pandas',
+                        tamanho_lote: int = 5000
+                        ):
+        """
+        Leitura projetada (sem ORM) de uma tabela, via select() do Core.
+
+        - colunas: nomes das colunas desejadas (None = todas, exceto binárias).
+        - filtros: {coluna: valor}; listas/tuplas/sets viram IN (...).
+        - incluir_binarios: só traz colunas LargeBinary se pedido explicitamente
+          (quando 'colunas' não é informado).
+        - formato: 'pandas' (DataFrame) ou 'arrow' (pyarrow.Table).
+        - tamanho_lote: linhas lidas por vez do cursor (stream_results).
+        """
+        tabela = model_class.__table__
+
+        if colunas is None:
+            selecionadas = [
+                c for c in tabela.columns
+                if incluir_binarios or not isinstance(c.type, LargeBinary)
+            ]
+        else:
+            selecionadas = [tabela.c[nome] for nome in colunas]
+
+        consulta = select(*selecionadas)
+        for nome, valor in (filtros or {}).items():
+            if isinstance(valor, (list, tuple, set)):
+                consulta = consulta.where(tabela.c[nome].in_(list(valor)))
+            else:
+                consulta = consulta.where(tabela.c[nome] == valor)
+
+        return self.retornarConsulta(consulta, formato=formato, tamanho_lote=tamanho_lote)
+
+    def retornarConsulta(self, consulta, formato: str = 'pandas', tamanho_lote: int = 5000):
+        """
+        Executa um select() do Core e devolve o resultado como DataFrame
+        (ou pyarrow.Table, se formato='arrow'), lendo o cursor em lotes.
+        """
+        partes = []
+        with self.engine.connect() as conn:
+            resultado = conn.execution_options(stream_results=True).execute(consulta)
+            nomes = list(resultado.keys())
+            for parte in resultado.partitions(tamanho_lote):
+                partes.append(pd.DataFrame.from_records(parte, columns=nomes))
+
+        if partes:
+            df = pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+        else:
+            df = pd.DataFrame(columns=nomes)
+
+        if formato == 'arrow':
+            import pyarrow as pa
+            return pa.Table.from_pandas(df, preserve_index=False)
 
-        # Retorna o DataFrame com as linhas coletadas
-        df = pd.DataFrame(data)
         return df
     
 
-    def inserirDados(self, model_class, data_dict: dict):
+    def inserirDados(self, model_class, data_dict: dict, session=None):
         """
         Adiciona um registro em 'model_class' (tabela) com base em 'data_dict'.
         Retorna o objeto criado (mapeado pelo SQLAlchemy).
+        Se 'session' (de unidadeDeTrabalho) for informada, apenas faz flush;
+        o commit fica a cargo da unidade de trabalho.
         """
-        with self.get_session() as session:
+        with self._sessao(session) as (session, propria):
             # Cria uma instância do modelo usando ** para desempacotar o dicionário
             novo_registro = model_class(**data_dict)
             
             # Adiciona e confirma no banco
             session.add(novo_registro)
+            if not propria:
+                session.flush()
+                return novo_registro
+
             session.commit()
             
             # Opcional: refresh para garantir que o objeto tenha os dados atualizados
@@ -189,7 +555,7 @@ class Database:
             
             return novo_registro
 
-    def atualizarTabela(self, model_class, filter_dict: dict, update_dict: dict):
+    def atualizarTabela(self, model_class, filter_dict: dict, update_dict: dict, session=None):
         """
         Atualiza um ou mais campos em um único registro, com base
         em um dicionário de filtro (filter_dict) e um dicionário 
@@ -197,7 +563,7 @@ class Database:
 
         Retorna o registro atualizado ou None caso não exista.
         """
-        with self.get_session() as session:
+        with self._sessao(session) as (session, propria):
             # Busca um único registro que atenda aos critérios de filtro
             record = session.query(model_class).filter_by(**filter_dict).one_or_none()
             if not record:
@@ -207,15 +573,18 @@ class Database:
             for key, value in update_dict.items():
                 setattr(record, key, value)
             
-            session.commit()
+            if propria:
+                session.commit()
+            else:
+                session.flush()
             return record
         
 
-    def retornarValor(self, model_class, filter_dict: dict):
+    def retornarValor(self, model_class, filter_dict: dict, session=None):
         """
         Retorna uma linha de uma tabela escolhida
         """
-        with self.get_session() as session:
+        with self._sessao(session) as (session, _):
             # Busca todos os registros que atendam aos critérios de filtro
             records = session.query(model_class).filter_by(**filter_dict).all()
 
@@ -229,36 +598,66 @@ class Database:
 
     
 
-    def _inserir_tabela_aprovados(self):
-        aprovados = pd.read_csv('aprovados.csv', sep=';')  # Certifique-se de ter a coluna "cota"
+    def _inserir_tabela_aprovados(self, caminho_csv: str = 'aprovados.csv', tamanho_lote: int = None) -> dict:
+        """
+        Carga em lote (e idempotente) da lista de aprovados.
+
+        Lê o CSV uma única vez, busca numa só consulta as inscrições já
+        existentes em 'lista_aprovados' e insere apenas as que faltam,
+        tudo numa única transação. 'tamanho_lote' divide o INSERT em
+        blocos (None = um único executemany).
+        Retorna um dicionário com as quantidades e os tempos de cada etapa.
+        """
+        tempos = {}
+        inicio = time.perf_counter()
 
-        for _, row in aprovados.iterrows():
-            numero_inscricao = str(row['n_inscr'])
-            nome = row['nome']
-            posicao = str(row['posicao'])
-            grupo = row['grupo']
+        # 1) Leitura do CSV (uma passada só)
+        aprovados = pd.read_csv(caminho_csv, sep=';', dtype={'n_inscr': str})  # Certifique-se de ter a coluna "cota"
+        if 'cota' not in aprovados.columns:
+            aprovados['cota'] = "AC"  # default
+        aprovados['cota'] = aprovados['cota'].fillna("AC")
+        aprovados = aprovados.drop_duplicates(subset='n_inscr', keep='first')
+        tempos['leitura_csv'] = time.perf_counter() - inicio
 
-            # Se o CSV tiver a coluna "cota", usar:
-            if 'cota' in row:
-                cota = row['cota']
-            else:
-                cota = "AC"  # default
-
-            registro_existente = self.retornarValor(
-                TabelaAprovados,
-                filter_dict={'n_inscr': numero_inscricao}
-            )
-            if not registro_existente:
-                dados_para_inserir = {
-                    'n_inscr': numero_inscricao,
-                    'nome': nome,
-                    'posicao': posicao,
-                    'grupo': grupo,
-                    'cota': cota  # <-- Novo
+        with self.get_session() as session:
+            # 2) Diferença contra as chaves já existentes (uma única consulta)
+            etapa = time.perf_counter()
+            existentes = set(session.execute(select(TabelaAprovados.n_inscr)).scalars())
+            faltantes = aprovados[~aprovados['n_inscr'].isin(existentes)]
+            tempos['diff_chaves'] = time.perf_counter() - etapa
+
+            registros = [
+                {
+                    'n_inscr': row.n_inscr,
+                    'nome': row.nome,
+                    'posicao': int(row.posicao),
+                    'grupo': row.grupo,
+                    'cota': row.cota
                 }
-                self.inserirDados(TabelaAprovados, dados_para_inserir)
-        
+                for row in faltantes[['n_inscr', 'nome', 'posicao', 'grupo', 'cota']].itertuples(index=False)
+            ]
 
+            # 3) INSERT em lote, numa única transação
+            etapa = time.perf_counter()
+            if registros:
+                lote = tamanho_lote or len(registros)
+                for i in range(0, len(registros), lote):
+                    session.execute(insert(TabelaAprovados), registros[i:i + lote])
+                session.commit()
+            tempos['insercao'] = time.perf_counter() - etapa
+
+        tempos['total'] = time.perf_counter() - inicio
+        print(
+            f"Carga de aprovados: {len(registros)} inseridos, {len(existentes)} já existentes "
+            f"({tempos['total']:.3f}s)"
+        )
+
+        return {
+            'lidos': len(aprovados),
+            'existentes': len(existentes),
+            'inseridos': len(registros),
+            'tempos': tempos
+        }
 
     def _inserir_grupos(self):
         grupos = [
@@ -307,33 +706,12 @@ class Database:
             self.inserirDados(TabelaUsuario, dados_para_inserir)
             print("Superusuário koriptnueve criado com sucesso.")
 
-@st.cache_data
-def retornarAprovados(_db: Database) -> pd.DataFrame:
-    """ Método para otimizar o retorno de aprovados, com cache do streamlit """
-    return _db.retornarTabela(TabelaAprovados)
-
-
-@st.cache_data
-def retornarListaUsuariosNaFrente(_db: Database, grupo: str, posicao: int, cota: str) -> pd.DataFrame:
-    """
-    Retorna todos os registros da tabela 'usuarios' que estejam na frente de uma determinada inscrição para um certo grupo
-    """
-    with _db.get_session() as session:
-        # Query que filtra pela data_criacao > reference_date
-        results = (
-            session.query(TabelaUsuario)
-            .filter(TabelaUsuario.grupo == grupo)       #
-            .filter(TabelaUsuario.posicao < posicao)
-            .filter(TabelaUsuario.cota == cota)
-            .all()
-        )
-
-        data = []
-        for obj in results:
-            row_dict = {
-                column.name: getattr(obj, column.name)
-                for column in obj.__table__.columns
-            }
-            data.append(row_dict)
+def consultaUsuariosNaFrente(grupo: str, posicao: int, cota: str):
+    """ select() dos usuários à frente de 'posicao' no mesmo grupo/cota """
+    return (
+        select(TabelaUsuario)
+        .where(TabelaUsuario.grupo == grupo)
+        .where(TabelaUsuario.cota == cota)
+        .where(TabelaUsuario.posicao < posicao)
+    )
 
-    return pd.DataFrame(data)
\ No newline at end of file
@@ -0,0 +1,349 @@
+"""
+
+Pipeline de ingestão dos documentos enviados no cadastro.
+
+O upload é gravado como recebido no blob store (status 'pendente') dentro
+da transação de criação da conta; a decodificação, redução e recompressão em JPEG
+acontecem depois, num pool de threads, fora da requisição de cadastro.
+
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from sqlalchemy import select, update, or_, and_
+from database import Database, TabelaDocumentos
+from utils import ler_configuracao
+from armazenamento import BlobStore, blob_store
+
+# Dimensões máximas do documento compactado
+TAMANHO_MAXIMO = (1000, 1000)
+QUALIDADE_JPEG = 70
+
+
+class DocumentoInvalido(ValueError):
+    """ Upload que não é uma imagem suportada ou que excede o limite de pixels """
+
+
+def compactar_imagem(conteudo: bytes, tamanho_maximo: tuple = TAMANHO_MAXIMO, qualidade: int = QUALIDADE_JPEG) -> bytes:
+    """
+    Converte a imagem para JPEG, reduzindo resolução e qualidade.
+    Para JPEGs, usa draft() para decodificar já em resolução reduzida
+    (escala 1/2, 1/4 ou 1/8), o que corta bastante a memória da decodificação.
+    """
+    image = Image.open(io.BytesIO(conteudo))
+
+    # Decodificação reduzida (só tem efeito em JPEG)
+    image.draft("RGB", tamanho_maximo)
+
+    # Converter para RGB (caso seja RGBA ou outro modo)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail(tamanho_maximo)
+
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", optimize=True, quality=qualidade)
+    return buf.getvalue()
+
+
+class PipelineDocumentos:
+    """
+    Recebe os uploads e agenda a compactação num pool limitado de threads.
+    """
+
+    def __init__(self, workers: int = 2, max_pixels: int = 40_000_000, reserva_segundos: int = 600) -> None:
+        self.max_pixels = max_pixels
+        # Reserva de um documento por um worker; passado esse tempo (ex.: o
+        # processo caiu no meio), outro worker pode assumi-lo
+        self.reserva = timedelta(seconds=reserva_segundos)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="documentos")
+
+    def validar(self, documento) -> None:
+        """
+        Verificação barata, feita antes de gravar: abre apenas o cabeçalho
+        da imagem (sem decodificar os pixels) e confere o limite de pixels.
+        """
+        try:
+            documento.seek(0)
+            with Image.open(documento) as image:
+                largura, altura = image.size
+        except Exception as e:
+            raise DocumentoInvalido(f"Arquivo não é uma imagem válida: {e}")
+        finally:
+            documento.seek(0)
+
+        if largura * altura > self.max_pixels:
+            raise DocumentoInvalido(
+                f"Imagem muito grande ({largura}x{altura}); o limite é de {self.max_pixels} pixels."
+            )
+
+    def receber(self, n_inscr: str, documento, session, store: BlobStore = None) -> TabelaDocumentos:
+        """
+        Grava o upload como recebido no blob store e registra o documento
+        (status 'pendente') dentro da unidade de trabalho informada.
+        Após o commit, chamar agendar().
+        """
+        store = store or blob_store()
+        conteudo = documento.getvalue() if hasattr(documento, "getvalue") else documento.read()
+        registro = TabelaDocumentos(
+            n_inscr=n_inscr,
+            nome_arquivo=documento.name,
+            chave_blob=store.salvar(conteudo),
+            status='pendente',
+            tamanho_original=len(conteudo)
+        )
+        session.add(registro)
+        return registro
+
+    def descartar(self, db: Database, chave_blob: str, store: BlobStore = None) -> None:
+        """
+        Apaga o blob de um upload cuja transação foi desfeita, se nenhum
+        documento gravado apontar para ele (o mesmo arquivo pode ter sido
+        enviado por outra inscrição).
+        """
+        store = store or blob_store()
+        with db.engine.connect() as conn:
+            em_uso = conn.execute(
+                select(TabelaDocumentos.id_documento)
+                .where(TabelaDocumentos.chave_blob == chave_blob)
+                .limit(1)
+            ).first()
+        if em_uso is None:
+            store.remover(chave_blob)
+
+    def agendar(self, db: Database, id_documento: int):
+        """ Agenda a compactação do documento no pool """
+        return self._pool.submit(self._processar, db, id_documento)
+
+    def _disponiveis(self, agora: datetime):
+        """ Condição dos documentos que podem ser reservados: pendentes ou com a reserva expirada """
+        return or_(
+            TabelaDocumentos.status == 'pendente',
+            and_(TabelaDocumentos.status == 'processando', TabelaDocumentos.processando_desde < agora - self.reserva)
+        )
+
+    def reprocessarPendentes(self, db: Database) -> int:
+        """
+        Reagenda documentos que ficaram 'pendente' ou com a reserva expirada
+        (ex.: processo reiniciado antes de terminar). Retorna quantos foram
+        agendados. Cada réplica pode chamar: só um worker reserva cada documento.
+        """
+        with db.engine.connect() as conn:
+            pendentes = conn.execute(
+                select(TabelaDocumentos.id_documento).where(self._disponiveis(datetime.now()))
+            ).scalars().all()
+        for id_documento in pendentes:
+            self.agendar(db, int(id_documento))
+        return len(pendentes)
+
+    def _reservar(self, db: Database, id_documento: int):
+        """
+        Reserva o documento para este worker (UPDATE condicional: só um
+        worker consegue). Retorna (chave do original, instante da reserva),
+        ou None se ele já foi processado ou está reservado por outro worker.
+        """
+        agora = datetime.now()
+        with db.engine.begin() as conn:
+            reservado = conn.execute(
+                update(TabelaDocumentos)
+                .where(TabelaDocumentos.id_documento == id_documento)
+                .where(self._disponiveis(agora))
+                .values(status='processando', processando_desde=agora)
+            ).rowcount
+            if not reservado:
+                return None
+            chave_original = conn.execute(
+                select(TabelaDocumentos.chave_blob).where(TabelaDocumentos.id_documento == id_documento)
+            ).scalar_one()
+        return chave_original, agora
+
+    def _processar(self, db: Database, id_documento: int, store: BlobStore = None) -> None:
+        store = store or blob_store()
+        reserva = self._reservar(db, id_documento)
+        if reserva is None:
+            return
+        chave_original, reservado_em = reserva
+
+        try:
+            compactado = compactar_imagem(store.ler(chave_original))
+            valores = {
+                'chave_blob': store.salvar(compactado),
+                'tamanho_comprimido': len(compactado),
+                'status': 'processado'
+            }
+        except Exception as e:
+            print(f"Falha ao processar documento {id_documento}: {e}")
+            valores = {'status': 'erro'}
+
+        with db.engine.begin() as conn:
+            # Só grava se a reserva ainda é deste worker (não expirou e foi assumida por outro)
+            gravado = conn.execute(
+                update(TabelaDocumentos)
+                .where(TabelaDocumentos.id_documento == id_documento)
+                .where(TabelaDocumentos.status == 'processando')
+                .where(TabelaDocumentos.processando_desde == reservado_em)
+                .values(processando_desde=None, **valores)
+            ).rowcount
+            if not gravado:
+                print(f"Documento {id_documento}: reserva perdida para outro worker; resultado descartado")
+                return
+
+            # O original só é apagado se nenhum outro documento apontar para ele
+            if valores.get('chave_blob', chave_original) != chave_original:
+                em_uso = conn.execute(
+                    select(TabelaDocumentos.id_documento)
+                    .where(TabelaDocumentos.chave_blob == chave_original)
+                    .limit(1)
+                ).first()
+                if em_uso is None:
+                    store.remover(chave_original)
+
+
+def buscarDocumento(db: Database, n_inscr: str):
+    """
+    Metadados do documento mais recente da inscrição (sem o conteúdo),
+    ou None se não houver documento.
+    """
+    documentos = db.retornarColunas(
+        TabelaDocumentos,
+        ['id_documento', 'nome_arquivo', 'chave_blob', 'status', 'tamanho_original', 'tamanho_comprimido'],
+        filtros={'n_inscr': n_inscr}
+    )
+    if documentos.empty:
+        return None
+    return documentos.sort_values('id_documento').iloc[-1].to_dict()
+
+
+def abrirDocumento(db: Database, documento: dict, store: BlobStore = None):
+    """
+    Conteúdo de um documento para leitura em stream (objeto de arquivo binário).
+    Documentos ainda não migrados são lidos da coluna legada 'conteudo'.
+    """
+    store = store or blob_store()
+    if documento.get('chave_blob'):
+        return store.abrir(documento['chave_blob'])
+
+    with db.engine.connect() as conn:
+        conteudo = conn.execute(
+            select(TabelaDocumentos.conteudo)
+            .where(TabelaDocumentos.id_documento == documento['id_documento'])
+        ).scalar_one_or_none()
+    return io.BytesIO(conteudo or b"")
+
+
+class CachePrevias:
+    """
+    Cache de prévias (versões reduzidas) dos documentos, usadas na auditoria.
+    A prévia é gerada no primeiro acesso e gravada em disco, ao lado dos
+    blobs; o conjunto respeita um orçamento de bytes, descartando as
+    prévias acessadas há mais tempo (LRU).
+    """
+
+    def __init__(self, diretorio: str, orcamento_bytes: int, tamanho: tuple = (480, 480), qualidade: int = 60) -> None:
+        self.diretorio = diretorio
+        self.orcamento_bytes = orcamento_bytes
+        self.tamanho = tamanho
+        self.qualidade = qualidade
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+
+        # chave -> tamanho em bytes, do acesso mais antigo para o mais recente.
+        # Ao iniciar, a ordem é reconstruída pela data de acesso dos arquivos.
+        arquivos = [
+            os.path.join(diretorio, nome) for nome in os.listdir(diretorio) if nome.endswith(".jpg")
+        ]
+        self._lru = OrderedDict(
+            (os.path.basename(caminho)[:-4], os.path.getsize(caminho))
+            for caminho in sorted(arquivos, key=os.path.getmtime)
+        )
+        self._total = sum(self._lru.values())
+
+    def _caminho(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f"{chave}.jpg")
+
+    def obter(self, chave: str, carregar_original) -> str:
+        """
+        Caminho da prévia de 'chave'. Se ainda não existir, é gerada a partir
+        de carregar_original() (função que retorna o conteúdo original).
+        """
+        caminho = self._caminho(chave)
+        with self._lock:
+            if chave in self._lru and os.path.exists(caminho):
+                self._lru.move_to_end(chave)
+                os.utime(caminho)
+                return caminho
+
+        previa = compactar_imagem(carregar_original(), self.tamanho, self.qualidade)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(previa)
+        os.replace(temporario, caminho)
+
+        with self._lock:
+            self._total -= self._lru.pop(chave, 0)
+            self._lru[chave] = len(previa)
+            self._total += len(previa)
+            self._despejar()
+        return caminho
+
+    def _despejar(self) -> None:
+        # Mantém sempre ao menos a prévia mais recente
+        while self._total > self.orcamento_bytes and len(self._lru) > 1:
+            chave, tamanho = self._lru.popitem(last=False)
+            self._total -= tamanho
+            try:
+                os.remove(self._caminho(chave))
+            except FileNotFoundError:
+                pass
+
+
+_previas = None
+_pipeline = None
+_lock_pipeline = threading.Lock()
+
+
+def pipeline_documentos() -> PipelineDocumentos:
+    """
+    Instância única do pipeline, configurada via st.secrets
+    (DOC_WORKERS, DOC_MAX_PIXELS e DOC_RESERVA_S).
+    """
+    global _pipeline
+    with _lock_pipeline:
+        if _pipeline is None:
+            _pipeline = PipelineDocumentos(
+                workers=int(ler_configuracao("DOC_WORKERS", 2)),
+                max_pixels=int(ler_configuracao("DOC_MAX_PIXELS", 40_000_000)),
+                reserva_segundos=int(ler_configuracao("DOC_RESERVA_S", 600))
+            )
+        return _pipeline
+
+
+def cache_previas() -> CachePrevias:
+    """
+    Instância única do cache de prévias, configurada via st.secrets
+    (PREVIA_DIR, padrão '<BLOB_DIR>/previas'; PREVIA_ORCAMENTO_MB, padrão 64).
+    """
+    global _previas
+    with _lock_pipeline:
+        if _previas is None:
+            diretorio_padrao = os.path.join(ler_configuracao("BLOB_DIR", "documentos_blob"), "previas")
+            _previas = CachePrevias(
+                diretorio=ler_configuracao("PREVIA_DIR", diretorio_padrao),
+                orcamento_bytes=int(ler_configuracao("PREVIA_ORCAMENTO_MB", 64)) * 1024 * 1024
+            )
+        return _previas
+
+
+def previaDocumento(db: Database, documento: dict) -> str:
+    """ Caminho da prévia de um documento (gerada no primeiro acesso) """
+    chave = documento.get('chave_blob') or f"legado-{documento['id_documento']}"
+
+    def carregar_original():
+        with abrirDocumento(db, documento) as arquivo:
+            return arquivo.read()
+
+    return cache_previas().obter(chave, carregar_original)
@@ -0,0 +1,467 @@
+"""
+
+Motor de entrega das notificações (fila de saída em 'fila_envios').
+
+As mensagens são enfileiradas no banco e entregues por threads de fundo
+(uma por canal: WhatsApp e e-mail), com remetentes que reaproveitam
+conexões HTTP/SMTP, limite de taxa por provedor e novas tentativas com
+backoff exponencial. Nada disso roda na thread do script do Streamlit.
+
+"""
+import queue
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select, update, func, or_
+from database import Database, TabelaEnvios
+from utils import ler_configuracao, ler_configuracao_bool
+from metricas import envios, tempo_envio
+
+
+class FalhaEnvio(Exception):
+    """
+    Falha na entrega. 'temporaria' indica se vale tentar novamente
+    (erro de rede, 429, 5xx) ou não (demais 4xx, destino inválido).
+    """
+
+    def __init__(self, mensagem: str, temporaria: bool = True) -> None:
+        super().__init__(mensagem)
+        self.temporaria = temporaria
+
+
+class LimitadorTaxa:
+    """
+    Balde de fichas (token bucket): no máximo 'taxa' envios por segundo,
+    com rajadas de até 'rajada' envios.
+    """
+
+    def __init__(self, taxa: float, rajada: int = None) -> None:
+        self.taxa = taxa
+        self.capacidade = rajada or max(1, int(taxa))
+        self._fichas = float(self.capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self) -> None:
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+class RemetenteWhatsApp:
+    """
+    Envio via API HTTP do provedor (formato Twilio). Usa uma única
+    requests.Session, cujo pool de conexões é compartilhado pelas threads.
+    """
+    canal = 'whatsapp'
+
+    def __init__(
+                 self,
+                 url_api: str,
+                 usuario: str,
+                 token: str,
+                 remetente: str,
+                 taxa: float = 10,
+                 conexoes: int = 4,
+                 timeout: float = 10
+                 ) -> None:
+        self.url_api = url_api
+        self.remetente = remetente
+        self.timeout = timeout
+        self.limitador = LimitadorTaxa(taxa)
+        self.conexoes = conexoes
+
+        self.sessao = requests.Session()
+        self.sessao.auth = (usuario, token)
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexoes)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+
+    def enviar(self, destino: str, conteudo: str, titulo: str = None) -> None:
+        self.limitador.aguardar()
+        data = {
+            "From": self.remetente,
+            "Body": f"*{titulo}*\n\n{conteudo}" if titulo else conteudo,
+            "To": destino
+        }
+        try:
+            resp = self.sessao.post(self.url_api, data=data, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise FalhaEnvio(f"Erro de conexão: {e}")
+
+        if resp.status_code in (200, 201):
+            return
+        temporaria = resp.status_code == 429 or resp.status_code >= 500
+        raise FalhaEnvio(f"HTTP {resp.status_code}: {resp.text[:500]}", temporaria=temporaria)
+
+    def encerrar(self) -> None:
+        self.sessao.close()
+
+
+class RemetenteEmail:
+    """
+    Envio de e-mail via SMTP, com um pool de conexões SMTP reaproveitadas
+    entre envios (cada thread pega uma conexão livre e a devolve ao final).
+    """
+    canal = 'email'
+
+    def __init__(
+                 self,
+                 host: str,
+                 porta: int,
+                 remetente: str,
+                 usuario: str = None,
+                 senha: str = None,
+                 starttls: bool = True,
+                 taxa: float = 5,
+                 conexoes: int = 2,
+                 timeout: float = 10
+                 ) -> None:
+        self.host = host
+        self.porta = porta
+        self.remetente = remetente
+        self.usuario = usuario
+        self.senha = senha
+        self.starttls = starttls
+        self.timeout = timeout
+        self.limitador = LimitadorTaxa(taxa)
+        self.conexoes = conexoes
+        self._livres = queue.LifoQueue()
+
+    def _conectar(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.porta, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.senha)
+        except BaseException:
+            self._descartar(smtp)
+            raise
+        return smtp
+
+    @staticmethod
+    def _descartar(smtp: smtplib.SMTP) -> None:
+        """ Fecha uma conexão com erro (sem QUIT: o servidor pode nem responder mais) """
+        if smtp is None:
+            return
+        try:
+            smtp.close()
+        except OSError:
+            pass
+
+    def enviar(self, destino: str, conteudo: str, titulo: str = None) -> None:
+        self.limitador.aguardar()
+        msg = EmailMessage()
+        msg["From"] = self.remetente
+        msg["To"] = destino
+        msg["Subject"] = titulo or "Aviso aos aprovados do CAGE RS"
+        msg.set_content(conteudo)
+
+        try:
+            smtp = self._livres.get_nowait()
+            reaproveitada = True
+        except queue.Empty:
+            smtp, reaproveitada = None, False
+
+        try:
+            if smtp is None:
+                smtp = self._conectar()
+            try:
+                smtp.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Conexão ociosa fechada pelo servidor: reconecta uma vez
+                if not reaproveitada:
+                    raise
+                self._descartar(smtp)
+                smtp = self._conectar()
+                smtp.send_message(msg)
+        except smtplib.SMTPRecipientsRefused as e:
+            self._livres.put(smtp)
+            raise FalhaEnvio(f"Destinatário recusado: {e}", temporaria=False)
+        except smtplib.SMTPResponseException as e:
+            self._livres.put(smtp)
+            # 4xx: falha temporária do servidor; 5xx: permanente
+            raise FalhaEnvio(f"SMTP {e.smtp_code}: {e.smtp_error!r}", temporaria=e.smtp_code < 500)
+        except (smtplib.SMTPException, OSError) as e:
+            # Conexão em estado desconhecido: fecha em vez de devolver ao pool
+            self._descartar(smtp)
+            raise FalhaEnvio(f"Erro SMTP: {e}")
+
+        self._livres.put(smtp)
+
+    def encerrar(self) -> None:
+        while True:
+            try:
+                smtp = self._livres.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+
+
+class MotorEnvios:
+    """
+    Consome a fila de envios em threads de fundo, uma por canal, de modo
+    que cada canal reserve e entregue os seus lotes de forma independente
+    (um canal lento não atrasa o outro).
+
+    A cada ciclo, o canal reserva um lote de envios vencidos (status
+    'pendente', ou 'enviando' com a reserva expirada, caso um processo
+    tenha caído no meio), entrega no seu pool de threads e grava o
+    resultado de cada destinatário. Falhas temporárias voltam para a fila
+    com backoff exponencial; após 'max_tentativas', o envio fica como 'falha'.
+    """
+
+    def __init__(
+                 self,
+                 db: Database,
+                 remetentes: dict,
+                 tamanho_lote: int = 50,
+                 max_tentativas: int = 5,
+                 backoff_base: float = 2.0,
+                 reserva_segundos: int = 300,
+                 intervalo: float = 5.0
+                 ) -> None:
+        self.db = db
+        self.remetentes = remetentes   # canal -> remetente
+        self.tamanho_lote = tamanho_lote
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.reserva = timedelta(seconds=reserva_segundos)
+        self.intervalo = intervalo
+
+        self._pools = {
+            canal: ThreadPoolExecutor(max_workers=remetente.conexoes, thread_name_prefix=f"envio-{canal}")
+            for canal, remetente in remetentes.items()
+        }
+        self._acordar = {canal: threading.Event() for canal in remetentes}
+        self._parar = threading.Event()
+        self._threads = {}
+
+    @property
+    def canais(self) -> set:
+        return set(self.remetentes)
+
+    def iniciar(self) -> None:
+        self._parar.clear()
+        for canal in self.remetentes:
+            thread = self._threads.get(canal)
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._laco, args=(canal,), name=f"motor-envios-{canal}", daemon=True)
+                self._threads[canal] = thread
+                thread.start()
+
+    def acordar(self, canal: str = None) -> None:
+        """ Processa a fila imediatamente (ex.: logo após enfileirar) """
+        for nome, evento in self._acordar.items():
+            if canal is None or canal == nome:
+                evento.set()
+
+    def parar(self) -> None:
+        self._parar.set()
+        self.acordar()
+        for thread in self._threads.values():
+            thread.join()
+        for pool in self._pools.values():
+            pool.shutdown(wait=True)
+        for remetente in self.remetentes.values():
+            remetente.encerrar()
+
+    def _laco(self, canal: str) -> None:
+        evento = self._acordar[canal]
+        while not self._parar.is_set():
+            try:
+                processados, menor_espera = self.processarLote(canal)
+            except Exception as e:
+                print(f"Erro no motor de envios ({canal}): {e}")
+                processados, menor_espera = 0, self.intervalo
+
+            # Lote cheio: provavelmente há mais na fila, segue sem esperar.
+            # Senão, dorme até o próximo ciclo ou até a nova tentativa mais próxima
+            if processados < self.tamanho_lote:
+                evento.wait(min(self.intervalo, menor_espera))
+                evento.clear()
+
+    def _reservar(self, canal: str) -> list:
+        agora = datetime.now()
+        with self.db.engine.begin() as conn:
+            lote = conn.execute(
+                select(
+                    TabelaEnvios.id_envio,
+                    TabelaEnvios.canal,
+                    TabelaEnvios.destino,
+                    TabelaEnvios.titulo,
+                    TabelaEnvios.conteudo,
+                    TabelaEnvios.tentativas
+                )
+                .where(TabelaEnvios.canal == canal)
+                .where(TabelaEnvios.proxima_tentativa <= agora)
+                .where(or_(
+                    TabelaEnvios.status == 'pendente',
+                    TabelaEnvios.status == 'enviando'   # reserva expirada
+                ))
+                .order_by(TabelaEnvios.proxima_tentativa)
+                .limit(self.tamanho_lote)
+                .with_for_update(skip_locked=True)
+            ).fetchall()
+
+            if lote:
+                conn.execute(
+                    update(TabelaEnvios)
+                    .where(TabelaEnvios.id_envio.in_([envio.id_envio for envio in lote]))
+                    .values(status='enviando', proxima_tentativa=agora + self.reserva)
+                )
+        return lote
+
+    def processarLote(self, canal: str) -> tuple:
+        """
+        Reserva e entrega um lote do canal. Retorna (quantidade processada,
+        segundos até a nova tentativa mais próxima agendada neste lote).
+        """
+        remetente = self.remetentes[canal]
+        lote = self._reservar(canal)
+        futuros = [
+            (envio, self._pools[canal].submit(self._entregar, remetente, canal, envio))
+            for envio in lote
+        ]
+
+        resultados = []
+        for envio, futuro in futuros:
+            try:
+                futuro.result()
+                resultados.append((envio, None))
+            except FalhaEnvio as e:
+                resultados.append((envio, e))
+            except Exception as e:
+                resultados.append((envio, FalhaEnvio(str(e))))
+
+        return len(lote), self._registrar(resultados)
+
+    @staticmethod
+    def _entregar(remetente, canal: str, envio) -> None:
+        inicio = time.perf_counter()
+        try:
+            remetente.enviar(envio.destino, envio.conteudo, envio.titulo)
+        finally:
+            tempo_envio.observar(time.perf_counter() - inicio, canal=canal)
+
+    def _registrar(self, resultados: list) -> float:
+        agora = datetime.now()
+        menor_espera = self.intervalo
+        with self.db.engine.begin() as conn:
+            enviados = [envio.id_envio for envio, erro in resultados if erro is None]
+            if enviados:
+                conn.execute(
+                    update(TabelaEnvios)
+                    .where(TabelaEnvios.id_envio.in_(enviados))
+                    .values(status='enviado', data_envio=agora, ultimo_erro=None)
+                )
+                envios.inc(len(enviados), canal=resultados[0][0].canal, resultado='enviado')
+
+            for envio, erro in resultados:
+                if erro is None:
+                    continue
+                tentativas = envio.tentativas + 1
+                if erro.temporaria and tentativas < self.max_tentativas:
+                    # Backoff exponencial com jitter: base^tentativas segundos (+/- 20%)
+                    espera = self.backoff_base ** tentativas * random.uniform(0.8, 1.2)
+                    menor_espera = min(menor_espera, espera)
+                    valores = {'status': 'pendente', 'proxima_tentativa': agora + timedelta(seconds=espera)}
+                else:
+                    valores = {'status': 'falha'}
+                envios.inc(canal=envio.canal, resultado='reagendado' if valores['status'] == 'pendente' else 'falha')
+
+                conn.execute(
+                    update(TabelaEnvios)
+                    .where(TabelaEnvios.id_envio == envio.id_envio)
+                    .values(tentativas=tentativas, ultimo_erro=str(erro)[:1000], **valores)
+                )
+        return menor_espera
+
+    def resumo(self, id_mensagem: int = None) -> dict:
+        """ Quantidade de envios por canal e status (de uma mensagem, se informada) """
+        consulta = (
+            select(TabelaEnvios.canal, TabelaEnvios.status, func.count())
+            .group_by(TabelaEnvios.canal, TabelaEnvios.status)
+        )
+        if id_mensagem is not None:
+            consulta = consulta.where(TabelaEnvios.id_mensagem == id_mensagem)
+        with self.db.engine.connect() as conn:
+            return {(canal, status): qtde for canal, status, qtde in conn.execute(consulta)}
+
+
+def _remetentes_configurados() -> dict:
+    """
+    Remetentes cujos parâmetros existem no st.secrets.
+    WhatsApp: TWILIO_SID, TWILIO_TOKEN (e opcionalmente WHATSAPP_API_URL,
+    WHATSAPP_FROM, WHATSAPP_TAXA, WHATSAPP_CONEXOES).
+    E-mail: SMTP_HOST (e opcionalmente SMTP_PORTA, SMTP_REMETENTE, SMTP_USUARIO,
+    SMTP_SENHA, SMTP_STARTTLS, SMTP_TAXA, SMTP_CONEXOES).
+    """
+    remetentes = {}
+
+    sid = ler_configuracao("TWILIO_SID")
+    token = ler_configuracao("TWILIO_TOKEN")
+    if sid and token:
+        remetentes['whatsapp'] = RemetenteWhatsApp(
+            url_api=ler_configuracao(
+                "WHATSAPP_API_URL",
+                f"https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+            ),
+            usuario=sid,
+            token=token,
+            remetente=ler_configuracao("WHATSAPP_FROM", "whatsapp:+14155238886"),  # Exemplo de número do sandbox
+            taxa=float(ler_configuracao("WHATSAPP_TAXA", 10)),
+            conexoes=int(ler_configuracao("WHATSAPP_CONEXOES", 4))
+        )
+
+    host = ler_configuracao("SMTP_HOST")
+    if host:
+        remetentes['email'] = RemetenteEmail(
+            host=host,
+            porta=int(ler_configuracao("SMTP_PORTA", 587)),
+            remetente=ler_configuracao("SMTP_REMETENTE", ler_configuracao("SMTP_USUARIO")),
+            usuario=ler_configuracao("SMTP_USUARIO"),
+            senha=ler_configuracao("SMTP_SENHA"),
+            starttls=ler_configuracao_bool("SMTP_STARTTLS", True),
+            taxa=float(ler_configuracao("SMTP_TAXA", 5)),
+            conexoes=int(ler_configuracao("SMTP_CONEXOES", 2))
+        )
+
+    return remetentes
+
+
+_motor = None
+_lock_motor = threading.Lock()
+
+
+def motor_envios(db: Database) -> MotorEnvios:
+    """ Instância única (e já iniciada) do motor de envios """
+    global _motor
+    with _lock_motor:
+        if _motor is None:
+            _motor = MotorEnvios(
+                db,
+                _remetentes_configurados(),
+                tamanho_lote=int(ler_configuracao("ENVIOS_LOTE", 50)),
+                max_tentativas=int(ler_configuracao("ENVIOS_MAX_TENTATIVAS", 5))
+            )
+            if _motor.canais:
+                _motor.iniciar()
+        return _motor
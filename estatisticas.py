@@ -0,0 +1,115 @@
+"""
+
+Consultas agregadas (GROUP BY/COUNT no banco) para as estatísticas de grupo.
+
+"""
+import pandas as pd
+from sqlalchemy import select, func, and_
+from database import Database, TabelaUsuario, TabelaAprovados, TabelaGrupos
+
+
+def contarUsuarios(db: Database, grupo: str = None) -> int:
+    """ Quantidade de usuários cadastrados (no grupo, se informado) """
+    consulta = select(func.count()).select_from(TabelaUsuario)
+    if grupo is not None:
+        consulta = consulta.where(TabelaUsuario.grupo == grupo)
+
+    with db.engine.connect() as conn:
+        return conn.execute(consulta).scalar_one()
+
+
+def contarUsuariosPorOpcao(db: Database, grupo: str = None) -> pd.DataFrame:
+    """
+    Quantidade de usuários cadastrados por grupo, cota e opção.
+    Colunas: grupo, cota, opcao, quantidade
+    """
+    consulta = (
+        select(
+            TabelaUsuario.grupo,
+            TabelaUsuario.cota,
+            TabelaUsuario.opcao,
+            func.count().label('quantidade')
+        )
+        .group_by(TabelaUsuario.grupo, TabelaUsuario.cota, TabelaUsuario.opcao)
+        .order_by(TabelaUsuario.grupo, TabelaUsuario.cota, TabelaUsuario.opcao)
+    )
+    if grupo is not None:
+        consulta = consulta.where(TabelaUsuario.grupo == grupo)
+
+    return db.retornarConsulta(consulta)
+
+
+def contarAprovados(db: Database, grupo: str = None) -> pd.DataFrame:
+    """
+    Quantidade de aprovados por grupo e cota.
+    Colunas: grupo, cota, quantidade
+    """
+    consulta = (
+        select(
+            TabelaAprovados.grupo,
+            TabelaAprovados.cota,
+            func.count().label('quantidade')
+        )
+        .group_by(TabelaAprovados.grupo, TabelaAprovados.cota)
+        .order_by(TabelaAprovados.grupo, TabelaAprovados.cota)
+    )
+    if grupo is not None:
+        consulta = consulta.where(TabelaAprovados.grupo == grupo)
+
+    return db.retornarConsulta(consulta)
+
+
+def retornarCortesRanking(db: Database, grupo: str = None) -> pd.DataFrame:
+    """
+    Para cada grupo/cota cadastrado em 'grupos', retorna a quantidade de vagas,
+    o total de aprovados e a posição de corte (posição do último aprovado que
+    está dentro do número de vagas; nulo se houver menos aprovados que vagas).
+    Colunas: grupo, cota, qtde_vagas, total_aprovados, posicao_corte
+    """
+    # Ordem de cada aprovado dentro do seu grupo/cota
+    ordenados = (
+        select(
+            TabelaAprovados.grupo,
+            TabelaAprovados.cota,
+            TabelaAprovados.posicao,
+            func.row_number().over(
+                partition_by=(TabelaAprovados.grupo, TabelaAprovados.cota),
+                order_by=TabelaAprovados.posicao
+            ).label('ordem')
+        )
+        .subquery()
+    )
+
+    totais = (
+        select(
+            TabelaAprovados.grupo,
+            TabelaAprovados.cota,
+            func.count().label('total_aprovados')
+        )
+        .group_by(TabelaAprovados.grupo, TabelaAprovados.cota)
+        .subquery()
+    )
+
+    consulta = (
+        select(
+            TabelaGrupos.grupo,
+            TabelaGrupos.cota,
+            TabelaGrupos.qtde_vagas,
+            func.coalesce(totais.c.total_aprovados, 0).label('total_aprovados'),
+            ordenados.c.posicao.label('posicao_corte')
+        )
+        .outerjoin(totais, and_(
+            totais.c.grupo == TabelaGrupos.grupo,
+            totais.c.cota == TabelaGrupos.cota
+        ))
+        .outerjoin(ordenados, and_(
+            ordenados.c.grupo == TabelaGrupos.grupo,
+            ordenados.c.cota == TabelaGrupos.cota,
+            ordenados.c.ordem == TabelaGrupos.qtde_vagas
+        ))
+        .order_by(TabelaGrupos.grupo, TabelaGrupos.cota)
+    )
+    if grupo is not None:
+        consulta = consulta.where(TabelaGrupos.grupo == grupo)
+
+    return db.retornarConsulta(consulta)
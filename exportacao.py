@@ -0,0 +1,122 @@
+"""
+
+Exportação de tabelas (CSV, Excel e Parquet) em fluxo: as linhas são lidas
+do banco em lotes por um cursor do lado do servidor e escritas num
+SpooledTemporaryFile, sem carregar a tabela inteira nem deixar arquivos
+no diretório da aplicação.
+
+"""
+import io
+import csv
+import tempfile
+from sqlalchemy import select, DateTime, Integer
+from database import Database
+from utils import ler_configuracao
+
+# Formato -> (extensão, tipo MIME)
+FORMATOS = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def _escrever_csv(destino, nomes: list, lotes) -> None:
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+    escritor = csv.writer(texto)
+    escritor.writerow(nomes)
+    for lote in lotes:
+        escritor.writerows(lote)
+    texto.flush()
+    texto.detach()      # devolve o arquivo sem fechá-lo
+
+
+def _escrever_excel(destino, nomes: list, lotes) -> None:
+    from openpyxl import Workbook
+
+    # write_only: as linhas não ficam em memória, vão direto para o XML da planilha
+    pasta = Workbook(write_only=True)
+    planilha = pasta.create_sheet('dados')
+    planilha.append(nomes)
+    for lote in lotes:
+        for linha in lote:
+            planilha.append(list(linha))
+    pasta.save(destino)
+
+
+def _esquema_arrow(colunas: list):
+    import pyarrow as pa
+
+    campos = []
+    for coluna in colunas:
+        if isinstance(coluna.type, Integer):
+            tipo = pa.int64()
+        elif isinstance(coluna.type, DateTime):
+            tipo = pa.timestamp('us')
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(coluna.name, tipo))
+    return pa.schema(campos)
+
+
+def _escrever_parquet(destino, colunas: list, lotes) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Esquema fixo (dos tipos das colunas), para que todos os lotes sejam
+    # gravados como grupos de linhas do mesmo arquivo
+    esquema = _esquema_arrow(colunas)
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for lote in lotes:
+            dados = {nome: [linha[i] for linha in lote] for i, nome in enumerate(esquema.names)}
+            escritor.write_table(pa.Table.from_pydict(dados, schema=esquema))
+
+
+def exportarTabela(
+                   db: Database,
+                   model_class,
+                   colunas: list,
+                   formato: str = 'CSV',
+                   filtros: dict = None,
+                   ordem: list = None,
+                   tamanho_lote: int = 2000
+                   ):
+    """
+    Exporta 'colunas' de 'model_class' no 'formato' (chave de FORMATOS).
+    'filtros' é {coluna: valor ou lista de valores}; 'ordem', a lista de
+    colunas para o ORDER BY.
+
+    Retorna um SpooledTemporaryFile já posicionado no início: fica em memória
+    até EXPORTACAO_MEMORIA_MB e, acima disso, passa para um arquivo temporário
+    anônimo, removido ao fechar. Quem chama deve fechá-lo (use 'with').
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+    tabela_colunas = [getattr(model_class, nome) for nome in colunas]
+    consulta = select(*tabela_colunas)
+    for nome, valor in (filtros or {}).items():
+        coluna = getattr(model_class, nome)
+        consulta = consulta.where(coluna.in_(valor) if isinstance(valor, (list, tuple, set)) else coluna == valor)
+    if ordem:
+        consulta = consulta.order_by(*[getattr(model_class, nome) for nome in ordem])
+
+    limite_memoria = int(ler_configuracao("EXPORTACAO_MEMORIA_MB", 16)) * 1024 * 1024
+    destino = tempfile.SpooledTemporaryFile(max_size=limite_memoria, mode='w+b')
+    try:
+        with db.engine.connect() as conn:
+            resultado = conn.execution_options(stream_results=True, yield_per=tamanho_lote).execute(consulta)
+            lotes = resultado.partitions(tamanho_lote)
+
+            if formato == 'CSV':
+                _escrever_csv(destino, colunas, lotes)
+            elif formato == 'Excel':
+                _escrever_excel(destino, colunas, lotes)
+            else:
+                _escrever_parquet(destino, [col.property.columns[0] for col in tabela_colunas], lotes)
+    except Exception:
+        destino.close()
+        raise
+
+    destino.seek(0)
+    return destino
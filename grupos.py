@@ -5,8 +5,10 @@ Classe para abstrair conjunto de atividades de grupos
 """
 import pandas as pd 
 from datetime import datetime 
-from database import Database, TabelaAprovados, TabelaUsuario, TabelaGrupos
+from database import Database
 from data_p_config.textos import TEXTO_PARABENS 
+from estatisticas import contarUsuarios
+from referencia import dados_referencia
 
 class Grupo:
 
@@ -27,8 +29,7 @@ class Grupo:
 
     def verQuantidade(self) -> dict:
         
-        usuarios = self.db.retornarTabela(TabelaUsuario)
-        qtde_usuarios = len(usuarios[usuarios['grupo']==self.grupo])
+        qtde_usuarios = contarUsuarios(self.db, grupo=self.grupo)
         return {
                 'função': 'verQuantidade', 
                 'data': datetime.now(), 
@@ -48,9 +49,9 @@ class Grupo:
                 }
     
 
-    def mostrarLink(self) -> dict:
+    def mostrarLink(self, cota: str = None) -> dict:
 
-        link = self.db.retornarValor(TabelaGrupos, filter_dict={'grupo': self.grupo})[0]['link']
+        link = dados_referencia.grupo(self.db, self.grupo, cota)['link']
         return {
                 'função': 'mostrarLink', 
                 'data': datetime.now(), 
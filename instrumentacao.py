@@ -0,0 +1,263 @@
+"""
+
+Instrumentação das consultas ao banco, por eventos da engine do SQLAlchemy:
+tempo, linhas e bytes lidos de cada comando, agregados por função do
+controller e método de acesso ao banco que o originou, com log de consultas
+lentas e tempos por página. Os dados valem desde o início do processo.
+
+"""
+import os
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import event
+from utils import ler_configuracao, ler_configuracao_bool
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__)) + os.sep
+DIRETORIO_CONTROLLER = os.path.join(DIRETORIO_APP, 'controller') + os.sep
+
+# Acumulador da página em exibição neste rerun (ver medirPagina)
+_pagina_atual = ContextVar('pagina_atual', default=None)
+
+
+def _tamanho_linha(linha) -> int:
+    """ Estimativa dos bytes de uma linha lida (textos e binários pelo tamanho, o resto 8) """
+    return sum(len(valor) if isinstance(valor, (str, bytes, bytearray, memoryview)) else 8
+               for valor in linha if valor is not None)
+
+
+def _origem() -> tuple:
+    """
+    (função do controller, função da aplicação que executou o comando),
+    procuradas na pilha de chamadas. Dentro do database.py vale o método
+    chamado de fora (retornarTabela, e não o retornarConsulta que ele usa).
+    Ex.: ('home.apresentar_dados_decisoes', 'database.retornarColunas').
+    '-' quando não há.
+    """
+    controller, origem, no_database = '-', '-', False
+    frame = sys._getframe(2)
+    while frame is not None:
+        arquivo = frame.f_code.co_filename
+        if (arquivo.startswith(DIRETORIO_APP) and 'site-packages' not in arquivo
+                and not arquivo.endswith('instrumentacao.py')):
+            modulo = os.path.splitext(os.path.basename(arquivo))[0]
+            nome = f"{modulo}.{getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)}"
+            if origem == '-' or (no_database and modulo == 'database'):
+                origem = nome
+                no_database = modulo == 'database'
+            else:
+                no_database = False
+            if arquivo.startswith(DIRETORIO_CONTROLLER):
+                controller = nome
+                break
+        frame = frame.f_back
+    return controller, origem
+
+
+class _Medicao:
+    """ Um comando em andamento: o tempo e as leituras somam até o cursor fechar """
+
+    __slots__ = ('chave', 'duracao', 'linhas', 'bytes', 'pagina', 'encerrada')
+
+    def __init__(self, chave: tuple, duracao: float) -> None:
+        self.chave = chave
+        self.duracao = duracao
+        self.linhas = 0
+        self.bytes = 0
+        self.pagina = _pagina_atual.get()
+        self.encerrada = False
+
+
+class _CursorMedido:
+    """ Cursor DBAPI que conta as linhas e os bytes lidos e o tempo gasto lendo """
+
+    def __init__(self, cursor, estatisticas, medicao: _Medicao) -> None:
+        self._cursor = cursor
+        self._estatisticas = estatisticas
+        self._medicao = medicao
+
+    def __getattr__(self, nome):
+        return getattr(self._cursor, nome)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _ler(self, metodo, *args):
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        medicao = self._medicao
+        medicao.duracao += time.perf_counter() - inicio
+        linhas = resultado if isinstance(resultado, list) else ([resultado] if resultado is not None else [])
+        medicao.linhas += len(linhas)
+        medicao.bytes += sum(_tamanho_linha(linha) for linha in linhas)
+        return resultado
+
+    def fetchone(self):
+        return self._ler(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._ler(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._ler(self._cursor.fetchall)
+
+    def close(self):
+        try:
+            self._cursor.close()
+        finally:
+            self._estatisticas.encerrar(self._medicao)
+
+
+class EstatisticasConsultas:
+    """
+    Agregados por (controller, origem, comando SQL) e por página, desde o
+    início do processo (ou do último zerar). Comandos que passam de
+    CONSULTA_LENTA_MS vão para o log (print) e para a lista de lentas.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.limite_lenta = float(ler_configuracao("CONSULTA_LENTA_MS", 500)) / 1000
+        self.zerar()
+
+    def zerar(self) -> None:
+        with self._lock:
+            self.inicio = datetime.now()
+            self._consultas = {}                 # chave -> [chamadas, tempo, tempo_max, linhas, bytes]
+            self._paginas = {}                   # pagina -> {exibicoes, tempos, tempo_sql, consultas}
+            self._lentas = deque(maxlen=100)
+
+    def encerrar(self, medicao: _Medicao) -> None:
+        """ Contabiliza um comando terminado (chamado uma única vez por medição) """
+        if medicao.encerrada:
+            return
+        medicao.encerrada = True
+
+        with self._lock:
+            agregado = self._consultas.setdefault(medicao.chave, [0, 0.0, 0.0, 0, 0])
+            agregado[0] += 1
+            agregado[1] += medicao.duracao
+            agregado[2] = max(agregado[2], medicao.duracao)
+            agregado[3] += medicao.linhas
+            agregado[4] += medicao.bytes
+            if medicao.duracao >= self.limite_lenta:
+                self._lentas.append((datetime.now(), medicao.duracao, *medicao.chave, medicao.linhas))
+
+        if medicao.pagina is not None:
+            medicao.pagina['consultas'] += 1
+            medicao.pagina['tempo_sql'] += medicao.duracao
+
+        if medicao.duracao >= self.limite_lenta:
+            controller, origem, sql = medicao.chave
+            print(f"Consulta lenta ({medicao.duracao * 1000:.0f} ms, {medicao.linhas} linhas) "
+                  f"em {controller} / {origem}: {sql[:300]}")
+
+    def registrarPagina(self, pagina: str, duracao: float, acumulado: dict) -> None:
+        with self._lock:
+            dados = self._paginas.setdefault(pagina, {
+                'exibicoes': 0, 'tempos': deque(maxlen=200), 'tempo_sql': 0.0, 'consultas': 0
+            })
+            dados['exibicoes'] += 1
+            dados['tempos'].append(duracao)
+            dados['tempo_sql'] += acumulado['tempo_sql']
+            dados['consultas'] += acumulado['consultas']
+
+    def topConsultas(self, n: int = 20, ordem: str = 'tempo_total_ms') -> pd.DataFrame:
+        """ Os 'n' comandos com maior 'ordem' (tempo_total_ms, chamadas, linhas, bytes...) """
+        with self._lock:
+            linhas = [
+                (controller, origem, chamadas, tempo * 1000, tempo * 1000 / chamadas, maximo * 1000, n_linhas, n_bytes, sql)
+                for (controller, origem, sql), (chamadas, tempo, maximo, n_linhas, n_bytes) in self._consultas.items()
+            ]
+        df = pd.DataFrame(linhas, columns=[
+            'controller', 'origem', 'chamadas', 'tempo_total_ms', 'tempo_medio_ms',
+            'tempo_max_ms', 'linhas', 'bytes', 'sql'
+        ])
+        df = df.sort_values(ordem, ascending=False).reset_index(drop=True)
+        return df if n is None else df.head(n)
+
+    def porOrigem(self) -> pd.DataFrame:
+        """ Tempo total por função de origem (ex.: database.retornarValor) """
+        df = self.topConsultas(n=None)
+        return (
+            df.groupby('origem', as_index=False)[['chamadas', 'tempo_total_ms', 'linhas', 'bytes']].sum()
+              .sort_values('tempo_total_ms', ascending=False).reset_index(drop=True)
+        )
+
+    def paginas(self) -> pd.DataFrame:
+        """ Tempo de exibição por página (p95 sobre as últimas 200 exibições) """
+        with self._lock:
+            linhas = []
+            for pagina, dados in self._paginas.items():
+                tempos = sorted(dados['tempos'])
+                linhas.append((
+                    pagina, dados['exibicoes'],
+                    sum(tempos) / len(tempos) * 1000,
+                    tempos[max(int(len(tempos) * 0.95) - 1, 0)] * 1000,
+                    dados['consultas'] / dados['exibicoes'],
+                    dados['tempo_sql'] / dados['exibicoes'] * 1000
+                ))
+        return pd.DataFrame(linhas, columns=[
+            'pagina', 'exibicoes', 'tempo_medio_ms', 'tempo_p95_ms', 'consultas_por_exibicao', 'tempo_sql_medio_ms'
+        ]).sort_values('tempo_medio_ms', ascending=False).reset_index(drop=True)
+
+    def lentas(self) -> pd.DataFrame:
+        """ Últimas consultas lentas (mais recentes primeiro) """
+        with self._lock:
+            linhas = [(data, duracao * 1000, controller, origem, n_linhas, sql)
+                      for data, duracao, controller, origem, sql, n_linhas in reversed(self._lentas)]
+        return pd.DataFrame(linhas, columns=['data', 'tempo_ms', 'controller', 'origem', 'linhas', 'sql'])
+
+
+# Instância única por processo
+estatisticas_consultas = EstatisticasConsultas()
+
+
+def _antes_do_comando(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._inicio_medicao = time.perf_counter()
+
+
+def _depois_do_comando(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, '_inicio_medicao', None)
+    if inicio is None:
+        return
+    medicao = _Medicao((*_origem(), ' '.join(statement.split())), time.perf_counter() - inicio)
+
+    # Comandos que retornam linhas: a leitura (e o tempo dela) é contada
+    # pelo cursor até ele ser fechado; os demais encerram aqui
+    if cursor.description is not None and not executemany and context.cursor is cursor:
+        context.cursor = _CursorMedido(cursor, estatisticas_consultas, medicao)
+    else:
+        medicao.linhas = max(cursor.rowcount, 0)
+        estatisticas_consultas.encerrar(medicao)
+
+
+def instrumentar(engine) -> None:
+    """
+    Registra os eventos de medição na engine (uma vez por engine).
+    Desligável com INSTRUMENTACAO = false no st.secrets.
+    """
+    if not ler_configuracao_bool("INSTRUMENTACAO", True):
+        return
+    if not event.contains(engine, 'after_cursor_execute', _depois_do_comando):
+        event.listen(engine, 'before_cursor_execute', _antes_do_comando)
+        event.listen(engine, 'after_cursor_execute', _depois_do_comando)
+
+
+@contextmanager
+def medirPagina(pagina: str):
+    """ Mede a exibição de uma página, com as consultas feitas durante ela """
+    acumulado = {'consultas': 0, 'tempo_sql': 0.0}
+    token = _pagina_atual.set(acumulado)
+    inicio = time.perf_counter()
+    try:
+        yield acumulado
+    finally:
+        _pagina_atual.reset(token)
+        estatisticas_consultas.registrarPagina(pagina, time.perf_counter() - inicio, acumulado)
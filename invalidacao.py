@@ -0,0 +1,190 @@
+"""
+
+Barramento de invalidação entre réplicas: repassa os incrementos de
+versoes_tabelas de um processo para os demais, para que os caches de cada
+réplica (dados de referência, ranking, busca) acompanhem as escritas
+feitas em qualquer uma delas.
+
+"""
+import os
+import json
+import glob
+import uuid
+import select
+import socket
+import threading
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from database import Database, Base, versoes_tabelas
+from utils import ler_configuracao
+
+
+class BarramentoInvalidacao:
+    """
+    Interface do barramento. 'publicar' envia a lista de tabelas alteradas;
+    a thread de escuta aplica, com propagar=False, as recebidas de outros
+    processos. Mensagens do próprio processo (identificado por 'origem')
+    são ignoradas.
+    """
+
+    def __init__(self) -> None:
+        self.origem = uuid.uuid4().hex
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _mensagem(self, tabelas: list) -> str:
+        return json.dumps({'origem': self.origem, 'tabelas': tabelas})
+
+    def _aplicar(self, payload) -> None:
+        try:
+            mensagem = json.loads(payload)
+        except ValueError:
+            return
+        if mensagem.get('origem') != self.origem:
+            versoes_tabelas.incrementar(*mensagem.get('tabelas', []), propagar=False)
+
+    @staticmethod
+    def _invalidarTudo() -> None:
+        """ Após perder a conexão (e talvez mensagens), recarrega todos os caches """
+        versoes_tabelas.incrementar(*Base.metadata.tables, propagar=False)
+
+    def publicar(self, tabelas: list) -> None:
+        raise NotImplementedError
+
+    def _escutar(self) -> None:
+        raise NotImplementedError
+
+    def iniciar(self) -> None:
+        versoes_tabelas.definirPublicador(self.publicar)
+        self._thread = threading.Thread(target=self._escutar, name='invalidacao', daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        versoes_tabelas.definirPublicador(None)
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class BarramentoPostgres(BarramentoInvalidacao):
+    """
+    Usa LISTEN/NOTIFY do Postgres: publica com pg_notify (uma conexão do
+    pool, em autocommit) e escuta numa conexão dedicada, fora do pool.
+    """
+
+    def __init__(self, db: Database, canal: str = 'invalidacao_cache', intervalo: float = 5.0) -> None:
+        super().__init__()
+        self.db = db
+        self.canal = canal
+        self.intervalo = intervalo
+        self._engine_escuta = create_engine(db.engine.url, poolclass=NullPool)
+
+    def publicar(self, tabelas: list) -> None:
+        with self.db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("SELECT pg_notify(:canal, :payload)"),
+                         {'canal': self.canal, 'payload': self._mensagem(tabelas)})
+
+    def _escutar(self) -> None:
+        while not self._parar.is_set():
+            try:
+                conexao = self._engine_escuta.raw_connection()
+                try:
+                    dbapi = conexao.dbapi_connection
+                    dbapi.autocommit = True
+                    with dbapi.cursor() as cursor:
+                        cursor.execute(f'LISTEN "{self.canal}"')
+
+                    # O que mudou enquanto não estávamos escutando não foi recebido
+                    self._invalidarTudo()
+
+                    while not self._parar.is_set():
+                        if select.select([dbapi], [], [], self.intervalo) == ([], [], []):
+                            continue
+                        dbapi.poll()
+                        while dbapi.notifies:
+                            self._aplicar(dbapi.notifies.pop(0).payload)
+                finally:
+                    conexao.close()
+            except Exception as e:
+                print(f"Barramento de invalidação (Postgres) desconectado: {e}")
+                self._parar.wait(self.intervalo)
+
+
+class BarramentoLocal(BarramentoInvalidacao):
+    """
+    Substituto para testes e para várias réplicas na mesma máquina: cada
+    processo abre um socket Unix (datagrama) em 'diretorio', e publicar
+    envia a mensagem para os sockets de todos os outros.
+    """
+
+    def __init__(self, diretorio: str, intervalo: float = 1.0) -> None:
+        super().__init__()
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        os.makedirs(diretorio, exist_ok=True)
+        self.caminho = os.path.join(diretorio, f'{self.origem}.sock')
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.caminho)
+        self._socket.settimeout(intervalo)
+
+    def publicar(self, tabelas: list) -> None:
+        dados = self._mensagem(tabelas).encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as saida:
+            for destino in glob.glob(os.path.join(self.diretorio, '*.sock')):
+                if destino == self.caminho:
+                    continue
+                try:
+                    saida.sendto(dados, destino)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket de um processo que já terminou
+                    try:
+                        os.remove(destino)
+                    except OSError:
+                        pass
+
+    def _escutar(self) -> None:
+        while not self._parar.is_set():
+            try:
+                dados = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._aplicar(dados.decode('utf-8'))
+
+    def parar(self) -> None:
+        super().parar()
+        self._socket.close()
+        try:
+            os.remove(self.caminho)
+        except OSError:
+            pass
+
+
+_barramento = None
+_lock_barramento = threading.Lock()
+
+
+def barramento_invalidacao(db: Database) -> BarramentoInvalidacao:
+    """
+    Instância única (e já iniciada) do barramento, conforme INVALIDACAO_BACKEND:
+    'postgres' (padrão quando o banco é Postgres), 'local' (sockets em
+    INVALIDACAO_DIR) ou 'nenhum' (padrão nos demais bancos; uma só réplica).
+    """
+    global _barramento
+    with _lock_barramento:
+        if _barramento is None:
+            padrao = 'postgres' if db.engine.dialect.name == 'postgresql' else 'nenhum'
+            backend = ler_configuracao("INVALIDACAO_BACKEND", padrao)
+
+            if backend == 'postgres':
+                _barramento = BarramentoPostgres(db, canal=ler_configuracao("INVALIDACAO_CANAL", 'invalidacao_cache'))
+            elif backend == 'local':
+                _barramento = BarramentoLocal(ler_configuracao("INVALIDACAO_DIR", '/tmp/invalidacao_cache'))
+            elif backend == 'nenhum':
+                return None
+            else:
+                raise ValueError(f"INVALIDACAO_BACKEND desconhecido: {backend}")
+
+            _barramento.iniciar()
+        return _barramento
@@ -0,0 +1,147 @@
+"""
+
+Listagem paginada de usuários para os painéis de administração e de
+coordenação: paginação por chave (keyset) no banco, com filtros e ordenação
+no servidor, e um índice em memória para a busca por nome ou inscrição.
+
+"""
+import bisect
+import threading
+import unicodedata
+import pandas as pd
+from sqlalchemy import select, func, tuple_
+from database import Database, TabelaUsuario, versoes_tabelas
+
+# Ordenações da grade -> colunas da chave de paginação. A última coluna
+# desempata, de modo que a chave identifica uma única linha
+ORDENACOES = {
+    'Grupo, cota e posição': ('grupo', 'cota', 'posicao', 'n_inscr'),
+    'Nome': ('nome', 'n_inscr'),
+    'Número de inscrição': ('n_inscr',),
+}
+
+
+def normalizar(texto: str) -> str:
+    """ Minúsculas e sem acentos ('João' -> 'joao'), para comparar nomes """
+    # NFKD separa a letra do acento; o encode descarta os acentos (não-ASCII)
+    decomposto = unicodedata.normalize('NFKD', str(texto or ''))
+    return decomposto.encode('ascii', 'ignore').decode('ascii').lower().strip()
+
+
+class IndiceBusca:
+    """
+    Índice de busca por prefixo, sem diferenciar acentos nem maiúsculas,
+    sobre o nome e o número de inscrição dos usuários. Guarda os termos
+    (cada palavra do nome e a inscrição) ordenados, e responde com bisect.
+    É reconstruído quando a versão da tabela 'usuarios' muda.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._termos = None     # (versao, [(termo, n_inscr)] ordenada)
+
+    def _construir(self, db: Database) -> list:
+        usuarios = db.retornarColunas(TabelaUsuario, ['n_inscr', 'nome'])
+        termos = []
+        for n_inscr, nome in usuarios.itertuples(index=False):
+            termos.append((normalizar(n_inscr), n_inscr))
+            termos.extend((palavra, n_inscr) for palavra in set(normalizar(nome).split()))
+        termos.sort()
+        return termos
+
+    def _indice(self, db: Database) -> list:
+        versao = versoes_tabelas.versao(TabelaUsuario.__tablename__)
+        with self._lock:
+            if self._termos is None or self._termos[0] != versao:
+                self._termos = (versao, self._construir(db))
+            return self._termos[1]
+
+    def buscar(self, db: Database, texto: str) -> set:
+        """
+        Inscrições dos usuários em que cada palavra de 'texto' é início de
+        uma palavra do nome (ou da inscrição): 'jo sil' encontra 'João da Silva'.
+        """
+        palavras = normalizar(texto).split()
+        if not palavras:
+            return set()
+
+        termos = self._indice(db)
+        encontrados = None
+        for palavra in palavras:
+            inicio = bisect.bisect_left(termos, (palavra,))
+            fim = bisect.bisect_left(termos, (palavra + '\U0010ffff',))
+            n_inscrs = {n_inscr for _, n_inscr in termos[inicio:fim]}
+            encontrados = n_inscrs if encontrados is None else encontrados & n_inscrs
+            if not encontrados:
+                break
+        return encontrados
+
+
+def _filtrar(consulta, filtros: dict = None, n_inscrs: set = None):
+    for nome, valor in (filtros or {}).items():
+        coluna = getattr(TabelaUsuario, nome)
+        consulta = consulta.where(coluna.in_(list(valor)) if isinstance(valor, (list, tuple, set)) else coluna == valor)
+    if n_inscrs is not None:
+        consulta = consulta.where(TabelaUsuario.n_inscr.in_(sorted(n_inscrs)))
+    return consulta
+
+
+def paginaUsuarios(
+                   db: Database,
+                   colunas: list,
+                   ordenacao: str = 'Grupo, cota e posição',
+                   decrescente: bool = False,
+                   filtros: dict = None,
+                   n_inscrs: set = None,
+                   apos: tuple = None,
+                   tamanho_pagina: int = 50
+                   ) -> tuple:
+    """
+    Uma página de usuários, lida a partir da chave 'apos' (keyset): o banco
+    percorre o índice da ordenação a partir da chave, sem OFFSET, então o
+    custo de cada página não cresce com o número de usuários.
+
+    - ordenacao: chave de ORDENACOES; 'decrescente' inverte a ordem.
+    - filtros: {coluna: valor}; listas/tuplas/sets viram IN (...).
+    - n_inscrs: restringe aos usuários informados (resultado de IndiceBusca.buscar).
+    - apos: chave da última linha da página anterior (None = primeira página).
+
+    Retorna (DataFrame com 'colunas', chave da última linha), com a chave
+    None quando não há página seguinte.
+    """
+    if n_inscrs is not None and not n_inscrs:
+        return pd.DataFrame(columns=colunas), None
+
+    chave = [getattr(TabelaUsuario, nome) for nome in ORDENACOES[ordenacao]]
+    extras = [nome for nome in ORDENACOES[ordenacao] if nome not in colunas]
+    consulta = _filtrar(
+        select(*[getattr(TabelaUsuario, nome) for nome in colunas + extras]), filtros, n_inscrs
+    )
+
+    if apos is not None:
+        consulta = consulta.where(tuple_(*chave) < tuple(apos) if decrescente else tuple_(*chave) > tuple(apos))
+    consulta = consulta.order_by(*[c.desc() if decrescente else c for c in chave])
+
+    # Uma linha a mais só para saber se existe a página seguinte
+    df = db.retornarConsulta(consulta.limit(tamanho_pagina + 1))
+    if len(df) <= tamanho_pagina:
+        return df[colunas], None
+
+    df = df.iloc[:tamanho_pagina]
+    ultima = df.iloc[-1]
+    return df[colunas], tuple(ultima[nome].item() if hasattr(ultima[nome], 'item') else ultima[nome]
+                              for nome in ORDENACOES[ordenacao])
+
+
+def contarUsuariosFiltrados(db: Database, filtros: dict = None, n_inscrs: set = None) -> int:
+    """ Quantidade de usuários com os mesmos filtros de paginaUsuarios """
+    if n_inscrs is not None and not n_inscrs:
+        return 0
+
+    consulta = _filtrar(select(func.count()).select_from(TabelaUsuario), filtros, n_inscrs)
+    with db.engine.connect() as conn:
+        return conn.execute(consulta).scalar_one()
+
+
+# Instância única por processo
+indice_busca = IndiceBusca()
@@ -6,15 +6,32 @@ Classe de Mensageria, responsável por fazer a gestão das mensagens para os usu
 
 # mensageria.py
 
-from database import TabelaMensagens, TabelaUsuario
+from database import TabelaMensagens, TabelaConteudos, TabelaUsuario, TabelaEnvios, TabelaLeituras
+from envios import motor_envios
 from datetime import datetime
-import requests
-import streamlit as st
+from sqlalchemy import select, insert, update, delete, literal, func, case
+from sqlalchemy.exc import IntegrityError
+from metricas import mensagens_criadas, envios_enfileirados
+
+# Canal -> (valores de 'opcao_contato' que aceitam o canal, destino, coluna de contato)
+CANAIS = {
+    'whatsapp': (
+        ['Sim, por WhatsApp', 'Sim, por e-mail e WhatsApp'],
+        literal('whatsapp:+55') + TabelaUsuario.telefone,
+        TabelaUsuario.telefone
+    ),
+    'email': (
+        ['Sim, por e-mail', 'Sim, por e-mail e WhatsApp'],
+        TabelaUsuario.email,
+        TabelaUsuario.email
+    ),
+}
+
 
 class Mensageria:
     """
     Responsável por criar, excluir e gerenciar o envio das mensagens 
-    (incluso disparar via WhatsApp).
+    (incluso disparar via e-mail e WhatsApp).
     """
 
     def __init__(self, db):
@@ -34,36 +51,162 @@ class Mensageria:
         """
         Cria uma ou várias mensagens no banco, baseando-se em 
         múltiplos grupos e cotas. 
-        Em seguida, envia via WhatsApp para cada usuário que se encaixe no critério.
+        Em seguida, envia por e-mail e/ou WhatsApp (conforme 'opcao_contato')
+        para cada usuário que se encaixe no critério.
         """
-        # 1) Inserir no banco (uma mensagem para cada combinação grupo/cota)
-        for grupo in grupos:
-            for cota in cotas:
-                nova_msg = {
+        # 1) Inserir no banco, numa única transação: o corpo uma só vez e uma
+        #    linha de mensagem para cada combinação grupo/cota, num só INSERT
+        agora = datetime.now()
+        with self.db.unidadeDeTrabalho() as session:
+            id_conteudo = self.db.inserirDados(
+                TabelaConteudos, {"conteudo": conteudo, "data_criacao": agora}, session=session
+            ).id_conteudo
+
+            novas_msgs = [
+                {
                     "grupo": grupo,
                     "cota": cota,
                     "posicao_min": posicao_min,
                     "posicao_max": posicao_max,
                     "titulo": titulo,
-                    "conteudo": conteudo,
+                    "id_conteudo": id_conteudo,
+                    "data_criacao": agora,
                     "autor": autor
                 }
-                self.db.inserirDados(TabelaMensagens, nova_msg)
+                for grupo in grupos
+                for cota in cotas
+            ]
+            # O RETURNING traz grupo/cota junto do id, então a ordem das linhas
+            # devolvidas não importa (e o driver pode agrupar tudo num só INSERT)
+            ids_por_combinacao = {
+                (grupo, cota): id_mensagem
+                for id_mensagem, grupo, cota in session.execute(
+                    insert(TabelaMensagens).returning(
+                        TabelaMensagens.id_mensagem, TabelaMensagens.grupo, TabelaMensagens.cota
+                    ),
+                    novas_msgs
+                )
+            }
+        ids_mensagens = [ids_por_combinacao[(msg["grupo"], msg["cota"])] for msg in novas_msgs]
+        mensagens_criadas.inc(len(ids_mensagens))
 
-        # 2) Após criar, chamamos a lógica de envio via WhatsApp
-        # self._enviar_para_whatsapp(grupos, cotas, posicao_min, posicao_max, conteudo)
+        # 2) Após criar, enfileira o envio por e-mail/WhatsApp, conforme a
+        #    preferência de cada usuário (entregue em segundo plano)
+        self._enfileirar_envios(grupos, cotas, posicao_min, posicao_max, titulo, conteudo, ids_mensagens)
+
+        return ids_mensagens
 
 
     def listar_mensagens(self):
         """
         Retorna todas as mensagens existentes (DataFrame).
         """
-        mensagens = self.db.retornarTabela(TabelaMensagens)
-        
-        if not mensagens.empty:
-            return mensagens.sort_values("data_criacao", ascending=False)
-        
-        return mensagens
+        consulta = self.consultaMensagens().order_by(TabelaMensagens.data_criacao.desc())
+        return self.db.retornarConsulta(consulta)
+
+    @staticmethod
+    def consultaMensagens():
+        """
+        select() das mensagens com o corpo já resolvido: o da tabela de
+        conteúdos ou, nas mensagens antigas, o copiado na própria linha.
+        """
+        return (
+            select(
+                TabelaMensagens.id_mensagem,
+                TabelaMensagens.grupo,
+                TabelaMensagens.cota,
+                TabelaMensagens.posicao_min,
+                TabelaMensagens.posicao_max,
+                TabelaMensagens.titulo,
+                func.coalesce(TabelaConteudos.conteudo, TabelaMensagens.conteudo).label('conteudo'),
+                TabelaMensagens.data_criacao,
+                TabelaMensagens.autor,
+            )
+            .select_from(TabelaMensagens)
+            .outerjoin(TabelaConteudos, TabelaConteudos.id_conteudo == TabelaMensagens.id_conteudo)
+        )
+
+
+    @staticmethod
+    def consultaCaixaEntrada(grupo: str, cota: str, posicao: int):
+        """ select() das mensagens destinadas a um (grupo, cota, posicao) """
+        return (
+            Mensageria.consultaMensagens()
+            .where(TabelaMensagens.grupo == grupo)
+            .where(TabelaMensagens.cota == cota)
+            .where(TabelaMensagens.posicao_min <= posicao)
+            .where(TabelaMensagens.posicao_max >= posicao)
+        )
+
+    def caixaEntrada(self, grupo: str, cota: str, posicao: int,
+                     pagina: int = 0, tamanho_pagina: int = 10):
+        """
+        Retorna (DataFrame) uma página das mensagens do usuário, das mais
+        recentes para as mais antigas, filtrando no banco pelo índice de
+        grupo/cota/posições em vez de carregar a tabela inteira.
+        """
+        consulta = (
+            self.consultaCaixaEntrada(grupo, cota, posicao)
+            .order_by(TabelaMensagens.data_criacao.desc(), TabelaMensagens.id_mensagem.desc())
+            .limit(tamanho_pagina)
+            .offset(pagina * tamanho_pagina)
+        )
+        return self.db.retornarConsulta(consulta)
+
+    def contarMensagens(self, grupo: str, cota: str, posicao: int, id_ultima_lida: int = 0) -> tuple:
+        """
+        Conta, numa única consulta, o total de mensagens do usuário e quantas
+        são posteriores ao seu marcador de leitura. Retorna (total, nao_lidas).
+        """
+        consulta = self.consultaCaixaEntrada(grupo, cota, posicao).with_only_columns(
+            func.count(TabelaMensagens.id_mensagem),
+            func.coalesce(func.sum(case((TabelaMensagens.id_mensagem > id_ultima_lida, 1), else_=0)), 0)
+        )
+        with self.db.engine.connect() as conn:
+            total, nao_lidas = conn.execute(consulta).one()
+        return int(total), int(nao_lidas)
+
+    def primeiraNaoExibida(self, grupo: str, cota: str, posicao: int, id_ultima_lida: int, exibidas: set):
+        """
+        Retorna o menor id entre as mensagens não lidas do usuário (posteriores
+        ao marcador) que não estão em 'exibidas', ou None se todas foram exibidas.
+        """
+        consulta = (
+            self.consultaCaixaEntrada(grupo, cota, posicao)
+            .with_only_columns(func.min(TabelaMensagens.id_mensagem))
+            .where(TabelaMensagens.id_mensagem > id_ultima_lida)
+            .where(TabelaMensagens.id_mensagem.not_in(sorted(exibidas)))
+        )
+        with self.db.engine.connect() as conn:
+            return conn.execute(consulta).scalar()
+
+    def ultimaLida(self, n_inscr: str) -> int:
+        """
+        Retorna o id da última mensagem lida pelo usuário (0 se nunca leu).
+        """
+        leitura = self.db.retornarValor(TabelaLeituras, {'n_inscr': n_inscr})
+        return leitura[0]['id_ultima_lida'] if leitura else 0
+
+    def marcarComoLidas(self, n_inscr: str, id_mensagem: int):
+        """
+        Avança o marcador de leitura do usuário até 'id_mensagem': as mensagens
+        com id até ele contam como lidas, então quem chama não deve passar da
+        mais antiga não lida ainda não exibida (ver primeiraNaoExibida).
+        O marcador nunca retrocede (ao abrir páginas antigas, por exemplo).
+        """
+        try:
+            with self.db.unidadeDeTrabalho() as session:
+                resultado = session.execute(
+                    update(TabelaLeituras)
+                    .where(TabelaLeituras.n_inscr == n_inscr)
+                    .where(TabelaLeituras.id_ultima_lida < id_mensagem)
+                    .values(id_ultima_lida=id_mensagem, data_leitura=datetime.now())
+                )
+                if resultado.rowcount == 0 and session.get(TabelaLeituras, n_inscr) is None:
+                    self.db.inserirDados(TabelaLeituras, {'n_inscr': n_inscr, 'id_ultima_lida': id_mensagem}, session=session)
+        except IntegrityError:
+            # Outra aba do mesmo usuário criou o marcador ao mesmo tempo
+            self.marcarComoLidas(n_inscr, id_mensagem)
 
 
     def deletar_mensagem(self, id_mensagem: int) -> bool:
@@ -74,42 +217,76 @@ class Mensageria:
         with self.db.get_session() as session:
             msg_obj = session.query(TabelaMensagens).filter_by(id_mensagem=id_mensagem).first()
             if msg_obj:
+                id_conteudo = msg_obj.id_conteudo
                 session.delete(msg_obj)
+                session.flush()
+
+                # Remove o corpo quando nenhuma outra mensagem o referencia mais
+                if id_conteudo is not None and session.query(TabelaMensagens).filter_by(id_conteudo=id_conteudo).first() is None:
+                    session.execute(delete(TabelaConteudos).where(TabelaConteudos.id_conteudo == id_conteudo))
+
                 session.commit()
                 return True
             return False
 
-    def _enviar_para_whatsapp(self, grupos: list, cotas: list, posicao_min: int, posicao_max: int, conteudo: str):
+    @staticmethod
+    def consultaDestinatarios(grupos: list, cotas: list, posicao_min: int, posicao_max: int):
+        """ select() dos usuários que se encaixam nos filtros de uma mensagem """
+        return (
+            select(TabelaUsuario)
+            .where(TabelaUsuario.grupo.in_(grupos))
+            .where(TabelaUsuario.cota.in_(cotas))
+            .where(TabelaUsuario.posicao >= posicao_min)
+            .where(TabelaUsuario.posicao <= posicao_max)
+        )
+
+    def _enfileirar_envios(self, grupos: list, cotas: list, posicao_min: int, posicao_max: int,
+                           titulo: str, conteudo: str, ids_mensagens: list = None) -> dict:
         """
-        Localiza os usuários que se encaixam nos filtros e dispara a API de WhatsApp
-        (ou gera links para envio). Ajuste conforme sua integração real.
+        Roteia os destinatários pelo 'opcao_contato' de cada usuário e
+        enfileira, com um INSERT ... SELECT por canal e grupo/cota, um envio
+        para cada um. Cada canal é entregue pelo seu próprio remetente no
+        motor de envios, fora do rerun do Streamlit.
+        Retorna a quantidade enfileirada por canal.
         """
+        motor = motor_envios(self.db)
 
-        # 1) Buscar usuários relevantes
-        with self.db.get_session() as session:
-            matched_users = (
-                session.query(TabelaUsuario)
-                .filter(TabelaUsuario.grupo.in_(grupos))
-                .filter(TabelaUsuario.cota.in_(cotas))
-                .filter(TabelaUsuario.posicao >= posicao_min)
-                .filter(TabelaUsuario.posicao <= posicao_max)
-                .all()
-            )
+        # Liga cada envio à mensagem do seu grupo/cota (ids na mesma ordem de criação)
+        combinacoes = [(grupo, cota) for grupo in grupos for cota in cotas]
+        ids_por_combinacao = dict(zip(combinacoes, ids_mensagens or []))
 
-        TWILIO_SID = st.secrets["TWILIO_SID"]
-        TWILIO_TOKEN = st.secrets["TWILIO_TOKEN"]
-        url_api = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_SID}/Messages.json"
-
-        for u in matched_users:
-            telefone_limpo = ...
-            if telefone_limpo:
-                data = {
-                    "From": "whatsapp:+14155238886",  # Exemplo de número do sandbox
-                    "Body": conteudo,
-                    "To": f"whatsapp:+55{telefone_limpo}"
-                }
-                resp = requests.post(url_api, data=data, auth=(TWILIO_SID, TWILIO_TOKEN))
-                if resp.status_code == 201:
-                    print(f"Mensagem enviada para {u.nome}")
-                else:
-                    print(f"Falha ao enviar p/ {u.nome}: {resp.text}")
\ No newline at end of file
+        enfileirados = {}
+        with self.db.engine.begin() as conn:
+            # Canais sem provedor configurado no st.secrets são ignorados
+            for canal in sorted(motor.canais & set(CANAIS)):
+                opcoes, destino, coluna_contato = CANAIS[canal]
+                enfileirados[canal] = 0
+
+                for (grupo, cota) in combinacoes:
+                    destinatarios = (
+                        self.consultaDestinatarios([grupo], [cota], posicao_min, posicao_max)
+                        .where(TabelaUsuario.opcao_contato.in_(opcoes))
+                        .where(coluna_contato.is_not(None))
+                        .where(coluna_contato != '')
+                        .with_only_columns(
+                            literal(ids_por_combinacao.get((grupo, cota))).label('id_mensagem'),
+                            TabelaUsuario.n_inscr,
+                            literal(canal).label('canal'),
+                            destino.label('destino'),
+                            literal(titulo).label('titulo'),
+                            literal(conteudo).label('conteudo'),
+                        )
+                    )
+                    resultado = conn.execute(
+                        insert(TabelaEnvios).from_select(
+                            ['id_mensagem', 'n_inscr', 'canal', 'destino', 'titulo', 'conteudo'],
+                            destinatarios
+                        )
+                    )
+                    enfileirados[canal] += max(resultado.rowcount, 0)
+
+        for canal, quantidade in enfileirados.items():
+            envios_enfileirados.inc(quantidade, canal=canal)
+            if quantidade:
+                motor.acordar(canal)
+        return enfileirados
@@ -0,0 +1,270 @@
+"""
+
+Métricas do processo (logins, bcrypt, cadastros, caches, pool de conexões,
+envios de mensagens) no formato texto do Prometheus, servidas por um
+servidor HTTP próprio numa thread (METRICS_PORT), fora do Streamlit: a
+coleta não custa um rerun.
+
+"""
+import abc
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Limites (s) padrão dos histogramas, os mesmos dos clientes oficiais do Prometheus
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _rotulos(nomes: tuple, valores: tuple, extra: str = '') -> str:
+    """ {nome="valor",...} com os escapes do formato texto """
+    pares = [
+        f'{nome}="' + str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for nome, valor in zip(nomes, valores)
+    ]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica(abc.ABC):
+    tipo = None
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()) -> None:
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        self._valores = {}
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(rotulos.get(nome, '') for nome in self.rotulos)
+
+    @abc.abstractmethod
+    def _linhas(self) -> list:
+        """ Linhas de amostras da métrica, sem HELP/TYPE """
+
+    def texto(self) -> str:
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        linhas.extend(self._linhas())
+        return '\n'.join(linhas)
+
+
+class Contador(_Metrica):
+    """ Valor que só cresce (ex.: logins realizados) """
+    tipo = 'counter'
+
+    def inc(self, valor: float = 1, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def _linhas(self) -> list:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in itens]
+
+
+class Medidor(_Metrica):
+    """
+    Valor instantâneo (ex.: conexões em uso). Com 'coletar', o valor é lido
+    na hora da coleta: coletar() retorna {tupla de rótulos: valor}.
+    """
+    tipo = 'gauge'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), coletar=None) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self.coletar = coletar
+
+    def definir(self, valor: float, **rotulos) -> None:
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def _linhas(self) -> list:
+        if self.coletar is not None:
+            itens = sorted(self.coletar().items())
+        else:
+            with self._lock:
+                itens = sorted(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}" for chave, valor in itens]
+
+
+class Histograma(_Metrica):
+    """ Distribuição de durações (s), em faixas acumuladas, com soma e contagem """
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_PADRAO) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+
+    def observar(self, valor: float, **rotulos) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            faixas, soma = self._valores.get(chave, ([0] * (len(self.limites) + 1), 0.0))
+            faixas[bisect_left(self.limites, valor)] += 1
+            self._valores[chave] = (faixas, soma + valor)
+
+    def _linhas(self) -> list:
+        with self._lock:
+            itens = sorted((chave, (list(faixas), soma)) for chave, (faixas, soma) in self._valores.items())
+
+        linhas = []
+        for chave, (faixas, soma) in itens:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + (float('inf'),), faixas):
+                acumulado += quantidade
+                le = f'le="{_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+
+class RegistroMetricas:
+    """ Conjunto das métricas do processo, na ordem em que foram criadas """
+
+    def __init__(self) -> None:
+        self._metricas = []
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: tuple = (), coletar=None) -> Medidor:
+        return self._registrar(Medidor(nome, ajuda, rotulos, coletar))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_PADRAO) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def texto(self) -> str:
+        """ Todas as métricas no formato texto do Prometheus (versão 0.0.4) """
+        return '\n'.join(metrica.texto() for metrica in self._metricas) + '\n'
+
+
+# Instância única por processo
+registro_metricas = RegistroMetricas()
+
+# ---------------------------------------------------------
+# Métricas da aplicação
+# ---------------------------------------------------------
+logins = registro_metricas.contador(
+    'cage_logins_total', 'Tentativas de login, por resultado', ('resultado',)
+)
+tempo_bcrypt = registro_metricas.histograma(
+    'cage_bcrypt_segundos', 'Duração do bcrypt (hash ou verificação) no pool de senhas', ('operacao',),
+    limites=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+)
+espera_bcrypt = registro_metricas.histograma(
+    'cage_bcrypt_espera_segundos', 'Espera na fila do pool de senhas antes do bcrypt', ('operacao',)
+)
+tempo_cadastro = registro_metricas.histograma(
+    'cage_cadastro_segundos', 'Duração da criação de conta, por resultado', ('resultado',)
+)
+cache_consultas = registro_metricas.contador(
+    'cage_cache_consultas_total', 'Leituras de cada cache', ('cache',)
+)
+cache_falhas = registro_metricas.contador(
+    'cage_cache_falhas_total', 'Leituras de cada cache que precisaram ir ao banco', ('cache',)
+)
+espera_pool = registro_metricas.histograma(
+    'cage_pool_espera_segundos', 'Espera por uma conexão do pool do banco (checkout)',
+    limites=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0)
+)
+pool_timeouts = registro_metricas.contador(
+    'cage_pool_timeouts_total', 'Checkouts que desistiram por falta de conexão livre (pool_timeout)'
+)
+tempo_rerun = registro_metricas.histograma(
+    'cage_rerun_segundos', 'Duração dos reruns completos do app'
+)
+mensagens_criadas = registro_metricas.contador(
+    'cage_mensagens_criadas_total', 'Mensagens criadas (uma por grupo/cota)'
+)
+envios_enfileirados = registro_metricas.contador(
+    'cage_envios_enfileirados_total', 'Envios colocados na fila, por canal', ('canal',)
+)
+envios = registro_metricas.contador(
+    'cage_envios_total', 'Envios processados pelo motor, por canal e resultado', ('canal', 'resultado')
+)
+tempo_envio = registro_metricas.histograma(
+    'cage_envio_segundos', 'Duração da entrega de um envio ao provedor', ('canal',)
+)
+
+# Pools de conexão acompanhados (ver registrarPool)
+_pools = []
+
+
+def registrarPool(pool) -> None:
+    """ Inclui um pool (QueuePool) nas métricas de conexões, lidas na hora da coleta """
+    if pool not in _pools:
+        _pools.append(pool)
+
+
+def _estado_pools(atributo: str):
+    return lambda: {(): sum(getattr(pool, atributo)() for pool in _pools)} if _pools else {}
+
+
+registro_metricas.medidor(
+    'cage_pool_conexoes_em_uso', 'Conexões do pool emprestadas no momento', coletar=_estado_pools('checkedout')
+)
+registro_metricas.medidor(
+    'cage_pool_tamanho', 'Tamanho configurado do pool (pool_size)', coletar=_estado_pools('size')
+)
+registro_metricas.medidor(
+    'cage_pool_excedente', 'Conexões além do pool_size (negativo: ainda não abertas)', coletar=_estado_pools('overflow')
+)
+
+
+class _RespostaMetricas(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        corpo = registro_metricas.texto().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass    # sem log a cada coleta
+
+
+_servidor = None
+_lock_servidor = threading.Lock()
+
+
+def servidor_metricas():
+    """
+    Servidor HTTP das métricas (GET /metrics), iniciado uma vez por processo
+    numa thread, na porta METRICS_PORT (e METRICS_HOST, padrão 127.0.0.1:
+    só a própria máquina; use 0.0.0.0 para o Prometheus coletar de fora).
+    Sem METRICS_PORT no st.secrets, não sobe nada e retorna None.
+    """
+    from utils import ler_configuracao
+
+    global _servidor
+    with _lock_servidor:
+        porta = ler_configuracao("METRICS_PORT")
+        if _servidor is None and porta:
+            try:
+                _servidor = ThreadingHTTPServer(
+                    (ler_configuracao("METRICS_HOST", "127.0.0.1"), int(porta)), _RespostaMetricas
+                )
+            except OSError as e:
+                print(f"Não foi possível abrir a porta de métricas {porta}: {e}")
+                return None
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name='metricas', daemon=True).start()
+            print(f"Métricas em http://{_servidor.server_address[0]}:{_servidor.server_address[1]}/metrics")
+        return _servidor
+
@@ -0,0 +1,106 @@
+"""
+
+Índice em memória do ranking de cada grupo/cota, para responder
+"quantos estão na minha frente" sem consultar o banco a cada página.
+
+"""
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from database import Database, TabelaUsuario, TabelaAprovados, versoes_tabelas
+from referencia import dados_referencia
+from metricas import cache_consultas, cache_falhas
+
+OPCOES = ("Vai assumir", "Indeciso", "Não vai assumir")
+
+
+class _RankingGrupo:
+    """
+    Ranking de um único (grupo, cota): posições ordenadas dos usuários
+    cadastrados e dos aprovados, com contagens acumuladas por opção.
+    """
+
+    def __init__(self, usuarios: list, posicoes_aprovados: list) -> None:
+        # usuarios: lista de tuplas (posicao, opcao, data_ultima_modificacao)
+        usuarios = sorted(usuarios, key=lambda u: u[0])
+        self.posicoes = [u[0] for u in usuarios]
+        self.datas = [u[2] for u in usuarios]
+        self.posicoes_aprovados = sorted(posicoes_aprovados)
+
+        # prefixos[opcao][i] = quantos dos i primeiros usuários escolheram 'opcao'
+        self.prefixos = {opcao: [0] for opcao in OPCOES}
+        for _, opcao, _ in usuarios:
+            for chave, acumulado in self.prefixos.items():
+                acumulado.append(acumulado[-1] + (opcao == chave))
+
+    def naFrente(self, posicao: int) -> dict:
+        i = bisect_left(self.posicoes, posicao)
+        limite = datetime.now() - timedelta(days=1)
+        return {
+            'cadastrados': i,
+            'aprovados': bisect_left(self.posicoes_aprovados, posicao),
+            'atualizados_ultimo_dia': sum(1 for d in self.datas[:i] if d is not None and d >= limite),
+            **{opcao: acumulado[i] for opcao, acumulado in self.prefixos.items()}
+        }
+
+
+class IndiceRanking:
+    """
+    Índice de ranking por (grupo, cota), construído sob demanda a partir
+    de 'usuarios' e 'lista_aprovados'. É reconstruído quando a versão de
+    uma dessas tabelas muda (versoes_tabelas), ou quando invalidado.
+    """
+
+    TABELAS = (TabelaUsuario.__tablename__, TabelaAprovados.__tablename__)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._grupos = None
+        self._versoes = None
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._grupos = None
+
+    def _construir(self, db: Database) -> dict:
+        usuarios = db.retornarColunas(
+            TabelaUsuario, ['grupo', 'cota', 'posicao', 'opcao', 'data_ultima_modificacao']
+        )
+
+        por_chave_usuarios = {}
+        for grupo, cota, posicao, opcao, data in usuarios.itertuples(index=False):
+            por_chave_usuarios.setdefault((grupo, cota), []).append((posicao, opcao, data))
+
+        por_chave_aprovados = dados_referencia.posicoesAprovados(db)
+
+        chaves = set(por_chave_usuarios) | set(por_chave_aprovados)
+        return {
+            chave: _RankingGrupo(por_chave_usuarios.get(chave, []), por_chave_aprovados.get(chave, []))
+            for chave in chaves
+        }
+
+    def naFrente(self, db: Database, grupo: str, cota: str, posicao: int) -> dict:
+        """
+        Retorna, para quem está em 'posicao' no (grupo, cota):
+        - cadastrados: usuários cadastrados à frente
+        - aprovados: aprovados à frente
+        - 'Vai assumir' / 'Indeciso' / 'Não vai assumir': cadastrados à frente por opção
+        - atualizados_ultimo_dia: cadastrados à frente modificados nas últimas 24h
+        """
+        versoes = versoes_tabelas.versoes(*self.TABELAS)
+        cache_consultas.inc(cache='ranking')
+        with self._lock:
+            if self._grupos is None or self._versoes != versoes:
+                cache_falhas.inc(cache='ranking')
+                self._grupos = self._construir(db)
+                self._versoes = versoes
+            grupos = self._grupos
+
+        ranking = grupos.get((grupo, cota))
+        if ranking is None:
+            ranking = _RankingGrupo([], [])
+        return ranking.naFrente(posicao)
+
+
+# Instância única por processo
+indice_ranking = IndiceRanking()
@@ -0,0 +1,89 @@
+"""
+
+Cache, por processo, dos dados de referência ('grupos' e 'lista_aprovados'),
+que mudam raramente mas são lidos a cada rerun.
+
+"""
+import threading
+from bisect import insort
+import pandas as pd
+from database import Database, TabelaGrupos, TabelaAprovados, versoes_tabelas
+from metricas import cache_consultas, cache_falhas
+
+
+class DadosReferencia:
+    """
+    Mantém 'grupos' e 'lista_aprovados' em memória, indexados por
+    (grupo, cota). Cada estrutura guarda a versão da tabela com que foi
+    carregada (versoes_tabelas) e é recarregada quando uma escrita feita
+    pelo Database incrementa essa versão; fora isso, não consulta o banco.
+    A cota é comparada sem diferenciar maiúsculas de minúsculas.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._grupos = None       # (versao, {(grupo, cota): registro})
+        self._aprovados = None    # (versao, {(grupo, cota): [posicoes]}, DataFrame)
+
+    @staticmethod
+    def _chave(grupo: str, cota: str) -> tuple:
+        return (grupo, (cota or '').lower())
+
+    def _tabela_grupos(self, db: Database) -> dict:
+        # A versão é lida antes da carga: uma escrita concorrente deixa o
+        # cache com a versão antiga, e a próxima leitura recarrega
+        versao = versoes_tabelas.versao(TabelaGrupos.__tablename__)
+        cache_consultas.inc(cache='grupos')
+        with self._lock:
+            if self._grupos is None or self._grupos[0] != versao:
+                cache_falhas.inc(cache='grupos')
+                df = db.retornarColunas(TabelaGrupos, ['grupo', 'cota', 'qtde_vagas', 'link'])
+                self._grupos = (versao, {
+                    self._chave(grupo, cota): {'grupo': grupo, 'cota': cota, 'qtde_vagas': qtde_vagas, 'link': link}
+                    for grupo, cota, qtde_vagas, link in df.itertuples(index=False)
+                })
+            return self._grupos[1]
+
+    def _tabela_aprovados(self, db: Database) -> tuple:
+        versao = versoes_tabelas.versao(TabelaAprovados.__tablename__)
+        cache_consultas.inc(cache='lista_aprovados')
+        with self._lock:
+            if self._aprovados is None or self._aprovados[0] != versao:
+                cache_falhas.inc(cache='lista_aprovados')
+                df = db.retornarColunas(TabelaAprovados, ['n_inscr', 'posicao', 'nome', 'grupo', 'cota'])
+                posicoes = {}
+                for posicao, grupo, cota in df[['posicao', 'grupo', 'cota']].itertuples(index=False):
+                    insort(posicoes.setdefault((grupo, cota), []), posicao)
+                self._aprovados = (versao, posicoes, df)
+            return self._aprovados[1], self._aprovados[2]
+
+    def grupo(self, db: Database, grupo: str, cota: str = None) -> dict:
+        """
+        Retorna o registro de 'grupos' do (grupo, cota) como dicionário
+        (grupo, cota, qtde_vagas, link), ou None se não existir.
+        Sem 'cota', retorna o primeiro registro do grupo.
+        """
+        grupos = self._tabela_grupos(db)
+        if cota is not None:
+            return grupos.get(self._chave(grupo, cota))
+        return next((registro for (g, _), registro in grupos.items() if g == grupo), None)
+
+    def listaGrupos(self, db: Database) -> list:
+        """ Nomes dos grupos cadastrados, em ordem alfabética """
+        return sorted({grupo for grupo, _ in self._tabela_grupos(db)})
+
+    def listaCotas(self, db: Database) -> list:
+        """ Cotas cadastradas em 'grupos' (como gravadas), em ordem alfabética """
+        return sorted({registro['cota'] for registro in self._tabela_grupos(db).values()})
+
+    def posicoesAprovados(self, db: Database) -> dict:
+        """ {(grupo, cota) como gravados: posições dos aprovados, em ordem crescente} """
+        return self._tabela_aprovados(db)[0]
+
+    def aprovados(self, db: Database) -> pd.DataFrame:
+        """ Tabela 'lista_aprovados' (somente leitura; não altere o DataFrame) """
+        return self._tabela_aprovados(db)[1]
+
+
+# Instância única por processo
+dados_referencia = DadosReferencia()
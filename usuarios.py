@@ -6,8 +6,9 @@ Classes para controlar usuários
 import sqlalchemy 
 import pandas as pd 
 from typing import Union
-from database import Database, TabelaUsuario, retornarListaUsuariosNaFrente
+from database import Database, TabelaUsuario
 from datetime import datetime 
+from ranking import indice_ranking, OPCOES
 
 class Usuario:
 
@@ -81,8 +82,8 @@ class Usuario:
         
 
     def verOpcoes(self, db: Database) -> dict:
-        lista_opcoes = retornarListaUsuariosNaFrente(db=db, grupo=self.grupo, posicao=self.posicao)
-        lista_opcoes = lista_opcoes.groupby(['opcao'])['n_inscr'].count() 
+        na_frente = indice_ranking.naFrente(db, self.grupo, self.cota, self.posicao)
+        lista_opcoes = pd.Series({opcao: na_frente[opcao] for opcao in OPCOES}, name='n_inscr')
 
         return  {
                 'função': 'verOpcoes', 
@@ -1,20 +1,120 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 import bcrypt
 from cryptography.fernet import Fernet
 import streamlit as st
 import validators
+import metricas
+
+
+def ler_configuracao(chave: str, padrao=None):
+    """
+    Lê um parâmetro do st.secrets, retornando 'padrao' se a chave
+    (ou o próprio arquivo de secrets) não existir.
+    """
+    try:
+        return st.secrets[chave]
+    except Exception:
+        return padrao
+
+
+def ler_configuracao_bool(chave: str, padrao: bool = False) -> bool:
+    """
+    Lê um parâmetro booleano do st.secrets. Aceita true/false do TOML ou
+    texto ("1", "true", "sim", "yes"); qualquer outro texto é falso.
+    """
+    valor = ler_configuracao(chave, padrao)
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in ('1', 'true', 'sim', 'yes')
+
+
+class ServicoSenhas:
+    """
+    Executa o bcrypt (hash e verificação) num pool limitado de threads.
+    O bcrypt libera o GIL, então até 'workers' hashes rodam em paralelo,
+    e o excedente aguarda na fila do pool em vez de disputar CPU.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 4) -> None:
+        self.rounds = rounds
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def _hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @staticmethod
+    def _verificar(password: str, hashed_password: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    @staticmethod
+    def _medir(operacao: str, funcao, enviado: float, *args):
+        """ Roda 'funcao' no pool registrando a espera na fila e a duração do bcrypt """
+        inicio = time.perf_counter()
+        metricas.espera_bcrypt.observar(inicio - enviado, operacao=operacao)
+        try:
+            return funcao(*args)
+        finally:
+            metricas.tempo_bcrypt.observar(time.perf_counter() - inicio, operacao=operacao)
+
+    def hash_async(self, password: str) -> Future:
+        return self._pool.submit(self._medir, 'hash', self._hash, time.perf_counter(), password)
+
+    def hash(self, password: str) -> str:
+        return self.hash_async(password).result()
+
+    def verificar(self, password: str, hashed_password: str) -> bool:
+        return self._pool.submit(
+            self._medir, 'verificacao', self._verificar, time.perf_counter(), password, hashed_password
+        ).result()
+
+    def precisa_rehash(self, hashed_password: str) -> bool:
+        """ True se o custo do hash armazenado for diferente do custo configurado """
+        try:
+            # Formato: $2b$<custo>$<salt+hash>
+            return int(hashed_password.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def encerrar(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+_servico_senhas = None
+_lock_servico_senhas = threading.Lock()
+
+
+def servico_senhas() -> ServicoSenhas:
+    """
+    Instância única do ServicoSenhas, configurada via st.secrets
+    (BCRYPT_ROUNDS e BCRYPT_WORKERS).
+    """
+    global _servico_senhas
+    with _lock_servico_senhas:
+        if _servico_senhas is None:
+            _servico_senhas = ServicoSenhas(
+                rounds=int(ler_configuracao("BCRYPT_ROUNDS", 12)),
+                workers=int(ler_configuracao("BCRYPT_WORKERS", 4))
+            )
+        return _servico_senhas
 
 
 # Função para gerar o hash da senha
 def hash_password(password: str) -> str:
-    # Converte a senha para bytes e gera o hash
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password.decode('utf-8')
+    # Converte a senha para bytes e gera o hash (no pool do bcrypt)
+    return servico_senhas().hash(password)
 
 # Função para verificar a senha
 def verify_password(password: str, hashed_password: str) -> bool:
     # Verifica se a senha corresponde ao hash armazenado
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return servico_senhas().verificar(password, hashed_password)
+
+def precisa_rehash(hashed_password: str) -> bool:
+    # Verifica se o hash foi gerado com um custo diferente do configurado
+    return servico_senhas().precisa_rehash(hashed_password)
 
 
 def encriptar_arquivo(conteudo_arquivo: bytes, chave: bytes) -> bytes:
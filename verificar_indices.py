@@ -0,0 +1,51 @@
+"""
+
+Verificação (via EXPLAIN) de que o planejador usa os índices compostos
+nas consultas mais frequentes.
+
+Uso: streamlit run verificar_indices.py   (ou python verificar_indices.py)
+
+"""
+from database import Database, consultaUsuariosNaFrente
+from mensageria import Mensageria
+
+INDICE_USUARIOS = 'ix_usuarios_grupo_cota_posicao'
+
+
+def verificarIndices(db: Database, forcar_indice: bool = False) -> dict:
+    """
+    Executa EXPLAIN nas consultas quentes e indica se o índice esperado
+    aparece no plano. Com 'forcar_indice' (apenas Postgres), desabilita o
+    seq scan na sessão, útil em tabelas pequenas, onde o planejador
+    prefere ler a tabela inteira mesmo com o índice disponível.
+    """
+    consultas = {
+        'consultaUsuariosNaFrente': (
+            consultaUsuariosNaFrente('Auditor do Estado', 100, 'AC'),
+            INDICE_USUARIOS
+        ),
+        'Mensageria.consultaDestinatarios': (
+            Mensageria.consultaDestinatarios(['Auditor do Estado'], ['AC'], 1, 50),
+            INDICE_USUARIOS
+        ),
+    }
+
+    resultado = {}
+    for nome, (consulta, indice) in consultas.items():
+        plano = db.explicarConsulta(consulta, forcar_indice=forcar_indice)
+        resultado[nome] = {
+            'indice': indice,
+            'usa_indice': any(indice in linha for linha in plano),
+            'plano': plano
+        }
+    return resultado
+
+
+if __name__ == "__main__":
+    db = Database()
+    db.create_all_tables_once()
+    for nome, info in verificarIndices(db).items():
+        situacao = "OK" if info['usa_indice'] else "NÃO USA"
+        print(f"[{situacao}] {nome} -> {info['indice']}")
+        for linha in info['plano']:
+            print(f"    {linha}")